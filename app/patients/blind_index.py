@@ -0,0 +1,90 @@
+import re
+from django.utils.crypto import salted_hmac
+from core.settings import BLIND_INDEX_KEY, PATIENT_PHONE_COUNTRY_CODE, PATIENT_PHONE_TRUNK_PREFIX
+
+##########################################################
+#
+#            Blind indexes of encrypted patient fields
+#
+# Encrypted columns cannot be compared in SQL. Next to
+# each searchable one, a keyed HMAC (SHA-256) of its
+# normalized value is stored, so an exact match is an
+# indexed equality lookup and no row is decrypted:
+#
+#   phone_index = HMAC(key, 'phone', normalize_phone(phone))
+#
+# The key is `BLIND_INDEX_KEY`. After changing it or the
+# normalization, run `python manage.py rebuild_patient_search`.
+#
+##########################################################
+
+
+def normalize_phone(value):
+    """Digits with the country code, so that the international and
+    national forms of a number match. Numbers without '+' or '00' are
+    national numbers of `PATIENT_PHONE_COUNTRY_CODE`.
+
+    '+1 (604) 555-0100', '1-604-555-0100', '604 555 0100' -> '16045550100'
+    """
+    value = (value or '').strip()
+    digits = re.sub(r'\D', '', value)
+    if not digits or value.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:]
+    if PATIENT_PHONE_TRUNK_PREFIX and digits.startswith(PATIENT_PHONE_TRUNK_PREFIX):
+        digits = digits[len(PATIENT_PHONE_TRUNK_PREFIX):]
+    return PATIENT_PHONE_COUNTRY_CODE + digits if digits else ''
+
+
+def normalize_email(value):
+    """Trim and lowercase, ' Ada@Example.com' -> 'ada@example.com'"""
+    return (value or '').strip().lower()
+
+
+# Fields with a `<field>_index` column, and their normalizer
+INDEXED_FIELDS = {
+    'phone': normalize_phone,
+    'email': normalize_email,
+}
+
+
+def blind_index(field, value):
+    """Compute the blind index of a field value
+
+    Args:
+        field (str): One of `INDEXED_FIELDS`
+        value (str): Plaintext value, normalized here
+
+    Returns:
+        str: Hex digest, None if the value is empty after normalizing
+    """
+    value = INDEXED_FIELDS[field](value)
+    if not value:
+        return None
+    return salted_hmac(f'patients.blind_index.{field}', value,
+                       secret=BLIND_INDEX_KEY, algorithm='sha256').hexdigest()
+
+
+def keyword_indexes(keyword):
+    """Blind indexes a search keyword may match exactly: an email if
+    it has '@', a phone number if it is only digits and separators
+
+    Returns:
+        dict: `{'<field>_index': digest}`
+    """
+    keyword = keyword or ''
+    if '@' in keyword:
+        field = 'email'
+    elif re.fullmatch(r'[\d\s()+.-]+', keyword):
+        field = 'phone'
+    else:
+        return {}
+    index = blind_index(field, keyword)
+    return {f'{field}_index': index} if index else {}
+
+
+def update_blind_indexes(patient):
+    """Set the `<field>_index` attributes of a patient from its plaintext fields"""
+    for field in INDEXED_FIELDS:
+        setattr(patient, f'{field}_index', blind_index(field, getattr(patient, field)))
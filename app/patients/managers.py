@@ -1,9 +1,12 @@
-from django.db import models
 from organizations.api import get_user_org
 from users.api import get_request_user
+from core.settings import PATIENT_SEARCH_LIMIT
+from utils.encryption.fields import EncryptedManager, values_decrypted
+from .blind_index import keyword_indexes
+from .search import search_names
 
 
-class PatientManager(models.Manager):
+class PatientManager(EncryptedManager):
     """
     This manager works with the Patient model to provide CRUD operations.
 
@@ -60,8 +63,13 @@ class PatientManager(models.Manager):
 
     def search_patient(self, request, keyword):
         organization = get_user_org(get_request_user(request))
+        # Phone numbers and emails are encrypted, they match exactly
+        # through their blind index. Names match by prefix, see search.py
+        indexes = keyword_indexes(keyword)
         patients = self.model.objects.filter(
-            models.Q(first_name__startswith=keyword) | models.Q(
-                last_name__startswith=keyword),
-            organization=organization, mark_deleted=False).values('id', 'first_name', 'last_name', 'phone', 'city', 'state')
-        return patients
+            organization=organization, mark_deleted=False)
+        if indexes:
+            patients = patients.filter(**indexes)[:PATIENT_SEARCH_LIMIT]
+        else:
+            patients = search_names(patients, keyword)
+        return values_decrypted(patients, 'id', 'first_name', 'last_name', 'phone', 'city', 'state')
@@ -3,8 +3,10 @@ from django.db import models
 from django.utils.timezone import now
 from users.models import User
 from organizations.models import Organization
-from django_cryptography.fields import encrypt
+from utils.encryption.fields import encrypt
 from .managers import PatientManager
+from .blind_index import INDEXED_FIELDS, update_blind_indexes
+from .search import NAME_FIELDS, update_name_columns, trigram_indexes
 
 
 class Patient(models.Model):
@@ -16,6 +18,9 @@ class Patient(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
+    # Search columns of the names, see search.py
+    norm_first_name = models.CharField(max_length=255, default='', editable=False)
+    norm_last_name = models.CharField(max_length=255, default='', editable=False)
     dob = encrypt(models.DateField(blank=True, null=True))
     sex = encrypt(models.CharField(
         max_length=10, choices=sex_choices, blank=True, null=True))
@@ -27,6 +32,9 @@ class Patient(models.Model):
     country = encrypt(models.CharField(max_length=255, blank=True, null=True))
     phone = encrypt(models.CharField(max_length=15, blank=True, null=True))
     email = encrypt(models.EmailField(blank=True, null=True))
+    # Blind indexes of phone and email, see blind_index.py
+    phone_index = models.CharField(max_length=64, blank=True, null=True, editable=False)
+    email_index = models.CharField(max_length=64, blank=True, null=True, editable=False)
     organization = models.ForeignKey(
         Organization, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(default=now)
@@ -42,4 +50,20 @@ class Patient(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['first_name', 'last_name']),
+            models.Index(fields=['organization', 'phone_index']),
+            models.Index(fields=['organization', 'email_index']),
+            models.Index(fields=['organization', 'norm_last_name']),
+            models.Index(fields=['organization', 'norm_first_name']),
+            *trigram_indexes(),
         ]
+
+    def save(self, *args, **kwargs):
+        update_blind_indexes(self)
+        update_name_columns(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # Keep search columns in step with the fields they are computed from
+            kwargs['update_fields'] = set(update_fields) | {
+                f'{field}_index' for field in INDEXED_FIELDS if field in update_fields} | {
+                column for field, column in NAME_FIELDS.items() if field in update_fields}
+        super().save(*args, **kwargs)
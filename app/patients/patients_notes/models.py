@@ -2,7 +2,7 @@ import uuid
 from django.db import models
 from django.utils.timezone import now
 from users.models import User
-from django_cryptography.fields import encrypt
+from utils.encryption.fields import EncryptedManager, encrypt
 from app.patients.models import Patient
 
 
@@ -18,6 +18,8 @@ class GeneralNote(models.Model):
         User, on_delete=models.SET_NULL, null=True, related_name='patient_general_note_updated_by')
     mark_deleted = models.BooleanField(default=False)
 
+    objects = EncryptedManager()
+
 
 class DoctorNote(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
@@ -30,3 +32,5 @@ class DoctorNote(models.Model):
     updated_by = models.ForeignKey(
         User, on_delete=models.SET_NULL, null=True, related_name='patient_doc_note_updated_by')
     mark_deleted = models.BooleanField(default=False)
+
+    objects = EncryptedManager()
@@ -101,7 +101,7 @@ class GeneralNoteView(APIView):
                     code='NoteNotFound'
                 ).to_response()
             # Check if the user is the creator of the note
-            if note.created_by != get_request_user(request):
+            if note.created_by_id != get_request_user(request).id:
                 return ErrorMessage(
                     title='Unauthorized',
                     status=403,
@@ -136,7 +136,7 @@ class GeneralNoteView(APIView):
                 code='NoteNotFound'
             ).to_response()
         # Check if the user is the creator of the note
-        if note.created_by != get_request_user(request):
+        if note.created_by_id != get_request_user(request).id:
             return ErrorMessage(
                 title='Unauthorized',
                 status=403,
@@ -234,7 +234,7 @@ class DoctorNoteView(APIView):
                     code='NoteNotFound'
                 ).to_response()
             # Check if the user is the creator of the note
-            if note.created_by != get_request_user(request):
+            if note.created_by_id != get_request_user(request).id:
                 return ErrorMessage(
                     title='Unauthorized',
                     status=403,
@@ -269,7 +269,7 @@ class DoctorNoteView(APIView):
                 code='NoteNotFound'
             ).to_response()
         # Check if the user is the creator of the note
-        if note.created_by != get_request_user(request):
+        if note.created_by_id != get_request_user(request).id:
             return ErrorMessage(
                 title='Unauthorized',
                 status=403,
@@ -0,0 +1,130 @@
+import re
+import unicodedata
+from django.db import connection, models
+from core.settings import PATIENT_SEARCH_LIMIT, PATIENT_SEARCH_TRIGRAM
+
+##########################################################
+#
+#                   Patient name search
+#
+# Names are matched on `norm_first_name` and
+# `norm_last_name`: lowercase, without accents and with
+# single spaces, kept in step on save. A prefix match is
+# written as a range on the column as well, so it is served
+# by the `(organization, norm_*)` indexes on every backend.
+#
+# Keywords are read as:
+#   'smi'          last or first name starts with 'smi'
+#   'smith, jo'    last name 'smith...', first name 'jo...'
+#   'jo smith'     first and last name in either order
+#
+# Results are ranked, exact names first, and bounded by
+# `PATIENT_SEARCH_LIMIT`. With `PATIENT_SEARCH_TRIGRAM` on
+# PostgreSQL, names similar to the keyword (typos) match
+# too and rank by pg_trgm similarity.
+#
+##########################################################
+
+NAME_FIELDS = {
+    'first_name': 'norm_first_name',
+    'last_name': 'norm_last_name',
+}
+
+# Sorts after every character, closes prefix ranges
+MAX_CHAR = chr(0x10FFFF)
+
+
+def normalize_name(value):
+    """Lowercase, strip accents and collapse spaces, ' Zoë  Ann' -> 'zoe ann'"""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return re.sub(r'\s+', ' ', value).strip().casefold()
+
+
+def update_name_columns(patient):
+    """Set the normalized name attributes of a patient"""
+    for field, column in NAME_FIELDS.items():
+        setattr(patient, column, normalize_name(getattr(patient, field)))
+
+
+def _prefix(column, value):
+    return models.Q(**{f'{column}__gte': value, f'{column}__lt': value + MAX_CHAR,
+                       f'{column}__startswith': value})
+
+
+def _name_terms(keyword):
+    """Build `(prefix match, exact match)` pairs of the keyword
+
+    Returns:
+        list: Pairs of Q objects, the keyword matches if any prefix matches
+    """
+    if ',' in keyword:
+        last, _, first = (normalize_name(part) for part in keyword.partition(','))
+        if not first:
+            return [(_prefix('norm_last_name', last), models.Q(norm_last_name=last))]
+        return [(_prefix('norm_last_name', last) & _prefix('norm_first_name', first),
+                 models.Q(norm_last_name=last, norm_first_name=first))]
+    keyword = normalize_name(keyword)
+    terms = [(_prefix('norm_last_name', keyword), models.Q(norm_last_name=keyword))]
+    if ' ' not in keyword:
+        terms.append((_prefix('norm_first_name', keyword), models.Q(norm_first_name=keyword)))
+    else:
+        # First word as one name, the rest as the other. Multi word last
+        # names match as a whole above.
+        head, tail = keyword.split(' ', 1)
+        for first, last in ((head, tail), (tail, head)):
+            terms.append((_prefix('norm_last_name', last) & models.Q(norm_first_name__startswith=first),
+                          models.Q(norm_first_name=first, norm_last_name=last)))
+    return terms
+
+
+def trigram_enabled():
+    return PATIENT_SEARCH_TRIGRAM and connection.vendor == 'postgresql'
+
+
+def trigram_indexes():
+    """GIN trigram indexes of the name columns, only with `PATIENT_SEARCH_TRIGRAM`
+
+    The pg_trgm extension must exist before they are migrated:
+    `CREATE EXTENSION IF NOT EXISTS pg_trgm;`
+    """
+    if not PATIENT_SEARCH_TRIGRAM:
+        return []
+    from django.contrib.postgres.indexes import GinIndex
+    return [GinIndex(fields=[column], name=f'patient_{column}_trgm',
+                     opclasses=['gin_trgm_ops'])
+            for column in NAME_FIELDS.values()]
+
+
+def search_names(queryset, keyword, limit=PATIENT_SEARCH_LIMIT):
+    """Match patients by name and rank them
+
+    Args:
+        queryset (QuerySet): Patients to search, e.g. of one organization
+        keyword (str): See the module comment
+        limit (int, optional): Max number of results
+
+    Returns:
+        QuerySet: Best matches first
+    """
+    terms = _name_terms(keyword)
+    match = models.Q()
+    exact = models.Q()
+    for prefix, equal in terms:
+        match |= prefix
+        exact |= equal
+    rank = models.Case(models.When(exact, then=0), default=1,
+                       output_field=models.IntegerField())
+    ordering = ['search_rank', 'norm_last_name', 'norm_first_name', 'id']
+    if trigram_enabled():
+        from django.contrib.postgres.search import TrigramSimilarity
+        from django.db.models.functions import Greatest
+        query = normalize_name(keyword.replace(',', ' '))
+        # `trigram_similar` is served by the GIN indexes of the name columns
+        match |= models.Q(norm_last_name__trigram_similar=query) | models.Q(
+            norm_first_name__trigram_similar=query)
+        queryset = queryset.annotate(search_similarity=Greatest(
+            TrigramSimilarity('norm_last_name', query),
+            TrigramSimilarity('norm_first_name', query)))
+        ordering.insert(1, '-search_similarity')
+    return queryset.filter(match).annotate(search_rank=rank).order_by(*ordering)[:limit]
@@ -32,6 +32,17 @@ class PatientSerializer(serializers.ModelSerializer):
             'last_name': {'required': True}}
 
 
+class PatientFieldsSerializer(PatientSerializer):
+    """PatientSerializer limited to the given `fields`, so only those
+    need to be loaded and decrypted"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class SearchPatientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
@@ -0,0 +1,88 @@
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from organizations.models import Organization
+from .models import Patient
+from .search import normalize_name, search_names
+from .blind_index import blind_index, keyword_indexes, normalize_phone
+
+
+def names(patients):
+    return [(patient.first_name, patient.last_name) for patient in patients]
+
+
+class NormalizeNameTest(SimpleTestCase):
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name(' Zoë  Ann\t'), 'zoe ann')
+        self.assertEqual(normalize_name('GARCÍA'), 'garcia')
+        self.assertEqual(normalize_name(None), '')
+
+
+class SearchNamesTest(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create()
+        for first_name, last_name in (('Grace', 'Hopper'), ('Ada', 'Lovelace'), ('Hop', 'Smith'),
+                                      ('María', 'García'), ('Anna', 'Van Dyke'), ('Alan', 'Hop')):
+            Patient.objects.create(first_name=first_name, last_name=last_name,
+                                   organization=self.organization)
+        # Other organizations are filtered by the caller
+        Patient.objects.create(first_name='Grace', last_name='Hopper', organization=Organization.objects.create())
+        self.patients = Patient.objects.filter(organization=self.organization)
+
+    def search(self, keyword, **kwargs):
+        return names(search_names(self.patients, keyword, **kwargs))
+
+    def test_columns_kept_in_step(self):
+        patient = Patient.objects.get(first_name='María')
+        self.assertEqual((patient.norm_first_name, patient.norm_last_name), ('maria', 'garcia'))
+        patient.last_name = 'Gómez'
+        patient.save(update_fields=['last_name'])
+        patient.refresh_from_db()
+        self.assertEqual(patient.norm_last_name, 'gomez')
+
+    def test_prefix_of_either_name_exact_first(self):
+        self.assertEqual(self.search('hop'), [('Alan', 'Hop'), ('Hop', 'Smith'), ('Grace', 'Hopper')])
+
+    def test_accents_and_case(self):
+        self.assertEqual(self.search('GARCIA'), [('María', 'García')])
+        self.assertEqual(self.search('maría'), [('María', 'García')])
+
+    def test_last_comma_first(self):
+        self.assertEqual(self.search('Hopper, Gr'), [('Grace', 'Hopper')])
+        self.assertEqual(self.search('hopper,'), [('Grace', 'Hopper')])
+        self.assertEqual(self.search('Hopper, Ada'), [])
+
+    def test_first_last_in_either_order(self):
+        self.assertEqual(self.search('grace hopper'), [('Grace', 'Hopper')])
+        self.assertEqual(self.search('hopper grace'), [('Grace', 'Hopper')])
+        self.assertEqual(self.search('van dy'), [('Anna', 'Van Dyke')])
+
+    def test_limit(self):
+        self.assertEqual(len(self.search('a', limit=2)), 2)
+
+
+class BlindIndexTest(TestCase):
+    def test_phone_forms_match(self):
+        for phone in ('+1 (604) 555-0100', '1-604-555-0100', '604.555.0100', '001 604 555 0100'):
+            self.assertEqual(normalize_phone(phone), '16045550100')
+        self.assertEqual(normalize_phone('+44 20 7946 0958'), '442079460958')
+        self.assertEqual(normalize_phone('1'), '')
+        with mock.patch.multiple('app.patients.blind_index', PATIENT_PHONE_COUNTRY_CODE='44',
+                                 PATIENT_PHONE_TRUNK_PREFIX='0'):
+            self.assertEqual(normalize_phone('020 7946 0958'), '442079460958')
+            self.assertEqual(normalize_phone('+44 20 7946 0958'), '442079460958')
+
+    def test_keyword_indexes(self):
+        self.assertEqual(keyword_indexes(' Ada@Example.com'),
+                         {'email_index': blind_index('email', 'ada@example.com')})
+        self.assertEqual(keyword_indexes('+1 (604) 555-0100'),
+                         {'phone_index': blind_index('phone', '16045550100')})
+        self.assertEqual(keyword_indexes('Ada'), {})
+        self.assertIsNone(blind_index('phone', '()'))
+
+    def test_exact_match_without_decrypting(self):
+        patient = Patient.objects.create(first_name='Ada', last_name='Lovelace', phone='604 555 0100',
+                                         email='Ada@Example.com', organization=Organization.objects.create())
+        self.assertEqual(list(Patient.objects.filter(**keyword_indexes('(604) 555-0100'))), [patient])
+        self.assertEqual(list(Patient.objects.filter(**keyword_indexes('+1 604 555 0100'))), [patient])
+        self.assertEqual(list(Patient.objects.filter(**keyword_indexes('ada@example.com'))), [patient])
+        self.assertFalse(Patient.objects.filter(**keyword_indexes('604 555 0101')).exists())
@@ -6,15 +6,70 @@ from users.permissions import HasSessionOrTokenActive
 from roles.permissions import HasPermission
 from .base_permissions import VIEW_ALL_PATIENTS, CREATE_PATIENTS, UPDATE_PATIENTS, DELETE_PATIENTS
 from .models import Patient
-from .serializers import PatientSerializer, SearchPatientSerializer
+from .serializers import PatientSerializer, PatientFieldsSerializer, SearchPatientSerializer
 from utils.error_handling.error_message import ErrorMessage
+from utils.pagination.keyset import KeysetPaginator
+from utils.encryption.fields import decrypt_instances
+
+
+# Fields of `listPatients` when `fields` is not given
+PATIENT_SUMMARY_FIELDS = ('id', 'first_name', 'last_name', 'dob', 'phone', 'email')
+# By name, id breaks ties of the same name
+patient_list_paginator = KeysetPaginator(ordering=('norm_last_name', 'norm_first_name', 'id'))
 
 
 @api_view(['GET'])
 @permission_classes([HasSessionOrTokenActive, HasPermission(VIEW_ALL_PATIENTS)])
 def listPatients(request):
-    patients = Patient.objects.list_patients(request)
-    return Response(PatientSerializer(patients, many=True).data, status=200)
+    """List patients of the organization by name, one page at a time
+
+    Query parameters:
+        fields: Comma separated patient fields, or `all`. Defaults to a summary.
+            Encrypted fields that are not requested are not decrypted.
+        cursor: `next` of the previous page
+        limit: Page size, max 200
+    """
+    try:
+        fields = _list_fields(request.GET.get('fields'))
+        # Ordering fields are needed for the cursor
+        patients = Patient.objects.list_patients(request).only(
+            *fields, *patient_list_paginator.fields)
+        page, next_cursor = patient_list_paginator.paginate(
+            patients,
+            cursor=request.GET.get('cursor'),
+            limit=request.GET.get('limit'),
+        )
+    except ValueError as error:
+        return ErrorMessage(
+            title='Invalid query parameters',
+            detail=str(error),
+            status=400,
+            instance=request.build_absolute_uri(),
+            code='InvalidQueryParameters'
+        ).to_response()
+    return Response(dict(
+        # The requested encrypted fields of the page, one column at a time
+        results=PatientFieldsSerializer(decrypt_instances(page, *fields), many=True, fields=fields).data,
+        next=next_cursor,
+    ), status=200)
+
+
+def _list_fields(value):
+    """Parse the `fields` query parameter
+
+    Raises:
+        ValueError: If a field is unknown
+    """
+    if not value:
+        return PATIENT_SUMMARY_FIELDS
+    if value == 'all':
+        return tuple(PatientSerializer.Meta.fields)
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in PatientSerializer.Meta.fields]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}.')
+    # Always identify the patient
+    return ('id', *(field for field in fields if field != 'id'))
 
 
 @api_view(['POST'])
@@ -1,4 +1,9 @@
-from django.db import models
+from contextlib import contextmanager
+from django.db import models, router, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from users.models import User
+from .schedule_cache import invalidate_schedule
 
 
 class AppointmentManager(models.Manager):
@@ -43,6 +48,7 @@ class AppointmentManager(models.Manager):
         appointment = self.create(
             **extra_fields
         )
+        invalidate_schedule(appointment.assigned_to_id)
         return appointment
 
     def cancel_appointment(self, organization, appointment_id):
@@ -57,5 +63,57 @@ class AppointmentManager(models.Manager):
         """
         appointment = self.get_appointment(organization, appointment_id)
         appointment.status = 'cancelled'
+        # The calendar feed is versioned by `updated_at`
+        appointment.updated_at = now()
         appointment.save()
+        invalidate_schedule(appointment.assigned_to_id)
         return appointment
+
+    def overlapping(self, assigned_to, start_time, end_time, exclude_id=None):
+        """Get appointments of a user that are not cancelled and overlap a time range
+
+        Args:
+            assigned_to (User | uuid): The user the appointments are assigned to
+            start_time (datetime): Start of the range
+            end_time (datetime): End of the range, exclusive
+            exclude_id (uuid, optional): Appointment to ignore, e.g. the one being rescheduled
+
+        Returns:
+            QuerySet: Overlapping appointments, none without an assignee
+        """
+        # `assigned_to=None` would match unassigned appointments of every organization
+        if assigned_to is None:
+            return self.none()
+        appointments = self.filter(
+            Q(end_time_expected__gt=start_time) |
+            Q(end_time_expected__isnull=True, start_time__gte=start_time),
+            assigned_to=assigned_to,
+            start_time__lt=end_time,
+        ).exclude(status='cancelled')
+        if exclude_id is not None:
+            appointments = appointments.exclude(id=exclude_id)
+        return appointments
+
+    @contextmanager
+    def booking_lock(self, assigned_to):
+        """Transaction in which bookings of a user are serialized, so that
+        checking `overlapping` and saving cannot race with another booking.
+
+        On PostgreSQL the user row is locked. SQLite has no row locks,
+        so the database write lock is taken before reading.
+
+        Args:
+            assigned_to (User | uuid): The user being booked
+        """
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            connection = transaction.get_connection(using)
+            if connection.vendor == 'sqlite':
+                # A write that changes nothing still takes the write lock
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'UPDATE {self.model._meta.db_table} SET id = id WHERE 0')
+            else:
+                list(User.objects.select_for_update().filter(
+                    id=getattr(assigned_to, 'pk', assigned_to)).values_list('id', flat=True))
+            yield
@@ -44,6 +44,11 @@ class Appointment(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['start_time', 'status', 'type']),
+            # Keyset pagination of list_appointments and my_appointments
+            models.Index(fields=['organization', 'created_at', 'id']),
+            models.Index(fields=['assigned_to', 'created_at', 'id']),
+            # Overlap checks of a user's bookings
+            models.Index(fields=['assigned_to', 'start_time', 'end_time_expected']),
         ]
         # constraint that end_time and end_time_expected should be greater than start_time
         # constraint that start_time should be greater than current time
@@ -0,0 +1,114 @@
+import uuid
+import datetime
+import pytz
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from core.settings import SCHEDULE_CACHE, SCHEDULE_CACHE_TTL, SCHEDULE_LOCAL_CACHE_TTL
+
+##########################################################
+#
+#                 Daily schedule of a provider
+#
+# Formatted appointments of a provider for one local day,
+# cached per (provider, timezone, date) and built on first
+# read. The day summary and week views are served from it.
+# Entries are summaries with the patient's id and name
+# only, see `format_schedule_entries`: patient contact data
+# is not kept in the cache.
+#
+# Keys carry the provider's version. Creating, cancelling
+# or changing an appointment must call
+# `invalidate_schedule`, which moves the provider to a new
+# version so every cached day is rebuilt on next read.
+# Patient names inside entries may be stale for up to
+# `SCHEDULE_CACHE_TTL` seconds.
+#
+# Versions are only seen by all workers in a shared cache.
+# A per process cache cannot see invalidations made by
+# other workers, its days live `SCHEDULE_LOCAL_CACHE_TTL`
+# seconds at most.
+#
+##########################################################
+
+SCHEDULE_KEY_PREFIX = 'day_schedule'
+VERSION_KEY_PREFIX = 'day_schedule_ver'
+
+
+def _get_cache():
+    return caches[SCHEDULE_CACHE]
+
+
+def _get_ttl(cache):
+    if isinstance(cache, LocMemCache):
+        return min(SCHEDULE_CACHE_TTL, SCHEDULE_LOCAL_CACHE_TTL)
+    return SCHEDULE_CACHE_TTL
+
+
+def _get_version(cache, user_id):
+    version = cache.get(f'{VERSION_KEY_PREFIX}:{user_id}')
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(f'{VERSION_KEY_PREFIX}:{user_id}', version, None)
+    return version
+
+
+def _schedule_key(user_id, version, timezone, date):
+    return f'{SCHEDULE_KEY_PREFIX}:{user_id}:{version}:{timezone}:{date.isoformat()}'
+
+
+def get_day_schedules(user, dates, formatter):
+    """Get appointments of a provider for each local date
+
+    Args:
+        user (User): The provider, dates are in `user.timezone`
+        dates (list): `datetime.date` objects
+        formatter (callable): Formats a list of appointments, e.g. `format_schedule_entries`
+
+    Returns:
+        dict: `{date: [appointment, ...]}` ordered by start time
+    """
+    cache = _get_cache()
+    version = _get_version(cache, user.id)
+    keys = {date: _schedule_key(user.id, version, user.timezone, date)
+            for date in dates}
+    cached = cache.get_many(keys.values())
+    schedules = {date: cached[key] for date, key in keys.items() if key in cached}
+    missing = [date for date in dates if date not in schedules]
+    if missing:
+        built = _build_day_schedules(user, missing, formatter)
+        ttl = _get_ttl(cache)
+        if ttl > 0:
+            cache.set_many({keys[date]: built[date] for date in missing}, ttl)
+        schedules.update(built)
+    return {date: schedules[date] for date in dates}
+
+
+def _build_day_schedules(user, dates, formatter):
+    # Imported here, the appointment manager imports this module
+    from .models import Appointment
+    # One range query for all missing days, then split by local date
+    tz = pytz.timezone(user.timezone)
+    start = tz.localize(datetime.datetime.combine(min(dates), datetime.time.min))
+    end = tz.localize(datetime.datetime.combine(
+        max(dates) + datetime.timedelta(days=1), datetime.time.min))
+    appointments = list(Appointment.objects.filter(
+        assigned_to=user, start_time__gte=start, start_time__lt=end
+    ).order_by('start_time'))
+    schedules = {date: [] for date in dates}
+    for appointment, formatted in zip(appointments, formatter(appointments)):
+        date = appointment.start_time.astimezone(tz).date()
+        if date in schedules:
+            schedules[date].append(formatted)
+    return schedules
+
+
+def invalidate_schedule(user):
+    """Make every cached day of the provider stale
+
+    Args:
+        user (User | uuid): Provider or provider id, None is ignored
+    """
+    if user is None:
+        return
+    user_id = getattr(user, 'pk', user)
+    _get_cache().set(f'{VERSION_KEY_PREFIX}:{user_id}', uuid.uuid4().hex, None)
@@ -26,7 +26,8 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'status': {'required': True}}
 
     def validate(self, attrs):
-        if attrs['end_time_expected'] <= attrs['start_time']:
+        # Partial updates leave out the times unless rescheduling
+        if 'start_time' in attrs and attrs['end_time_expected'] <= attrs['start_time']:
             raise serializers.ValidationError(
                 "End date must be greater than start date.")
         return super().validate(attrs)
@@ -17,6 +17,10 @@ urlpatterns = [
 
     # date: '06-13-2024' (format: MM-DD-YYYY)
     path('my/date/<str:date>/', views.my_appointments_for_date),
+    # Same day, schedule entries without patient contact data
+    path('my/date/<str:date>/summary/', views.my_schedule_for_date),
+    # 7 days from date (format: MM-DD-YYYY)
+    path('my/week/<str:date>/', views.my_appointments_for_week),
 
     path('my/list/<str:appointment_id>/', views.MyAppointmentView.as_view()),
     path('my/list/<str:appointment_id>/patient/', views.get_appointment_patient),
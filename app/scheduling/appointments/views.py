@@ -1,20 +1,36 @@
+import uuid
 import datetime
 import pytz
+from django.utils.dateparse import parse_date, parse_datetime
+from django.core.exceptions import ValidationError
+from django.db.models import QuerySet
 from django.utils.encoding import force_str
+from django.utils.timezone import now
+from rest_framework.fields import DateTimeField
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from users.permissions import HasSessionOrTokenActive
 from users.api import get_request_user
+from users.models import User
 from users.serializers import UserSerializer
 from organizations.api import get_user_org
 from roles.permissions import HasPermission
 from ..base_permissions import MODIFY_ALL_APPOINTMENTS, VIEW_ALL_APPOINTMENTS
 from .models import Appointment, Cancellation
 from .serializers import AppointmentSerializer
+from .schedule_cache import get_day_schedules, invalidate_schedule
 from utils.error_handling.error_message import ErrorMessage
+from utils.pagination.keyset import KeysetPaginator
+from utils.encryption.fields import ciphertext_values, decrypt_rows, values_decrypted
+from app.patients.models import Patient
 from app.patients.serializers import PatientSerializer
 
+# Newest first, id breaks ties of the same created_at
+appointment_paginator = KeysetPaginator(ordering=('-created_at', '-id'))
+# By name, id breaks ties of the same name
+patient_roster_paginator = KeysetPaginator(ordering=('first_name', 'last_name', 'id'))
+
 
 @api_view(['POST'])
 @permission_classes([HasSessionOrTokenActive, HasPermission(MODIFY_ALL_APPOINTMENTS)])
@@ -36,16 +52,7 @@ def _create_appointment(request, self=False):
         assigned_to = created_by.id
     else:
         assigned_to = force_str(request.data['assigned_to'])
-    # Format: 'date': '2024-06-13T07:00:00.000Z', 'start_time': '10:30', 'duration': 30,
-    start_at = datetime.datetime.strptime(
-        force_str(request.data['date']),
-        '%Y-%m-%dT%H:%M:%S.%fZ'
-    ) + datetime.timedelta(
-        hours=int(force_str(request.data['start_time']).split(':')[0]),
-        minutes=int(force_str(request.data['start_time']).split(':')[1])
-    )
-    end_at = start_at + \
-        datetime.timedelta(minutes=int(force_str(request.data['duration'])))
+    start_at, end_at = _parse_schedule(request.data)
     # Create appointment
     serializer = AppointmentSerializer(data=dict(
         patient=force_str(request.data['patient']),
@@ -60,20 +67,83 @@ def _create_appointment(request, self=False):
         created_by=created_by.id,
     ))
     if serializer.is_valid():
-        serializer.save()
+        if not _save_booking(serializer):
+            return _conflict_response(request)
+        invalidate_schedule(serializer.instance.assigned_to_id)
         appointment_obj = serializer.instance
         return Response(format_appointments([appointment_obj])[0], status=201)
     else:
         return Response(serializer.errors, status=400)
 
 
+def _parse_schedule(data):
+    """Start and expected end of an appointment in a request body.
+
+    Format: 'date': '2024-06-13T07:00:00.000Z', 'start_time': '10:30', 'duration': 30
+    """
+    start_at = datetime.datetime.strptime(
+        force_str(data['date']),
+        '%Y-%m-%dT%H:%M:%S.%fZ'
+    ) + datetime.timedelta(
+        hours=int(force_str(data['start_time']).split(':')[0]),
+        minutes=int(force_str(data['start_time']).split(':')[1])
+    )
+    end_at = start_at + \
+        datetime.timedelta(minutes=int(force_str(data['duration'])))
+    return start_at, end_at
+
+
+def _save_booking(serializer, **fields):
+    """Save a valid appointment serializer unless the assignee is already booked.
+
+    The check and the save run under `booking_lock`, so that two requests
+    cannot both book the same time. Appointments without an assignee and
+    cancelled ones book nobody, and are saved without a check.
+
+    Args:
+        serializer (AppointmentSerializer): Validated serializer, new or of an existing appointment
+        **fields: Extra fields passed to `serializer.save`
+
+    Returns:
+        bool: False if the appointment overlaps another one of the assignee
+    """
+    # On updates, fields not in the request keep the instance's values
+    def value(field):
+        if field in serializer.validated_data:
+            return serializer.validated_data[field]
+        return getattr(serializer.instance, field, None)
+    # The user resolved by the serializer, not the raw request value
+    assignee_id = getattr(value('assigned_to'), 'pk', None)
+    if assignee_id is None or value('status') == 'cancelled':
+        serializer.save(**fields)
+        return True
+    with Appointment.objects.booking_lock(assignee_id):
+        if Appointment.objects.overlapping(
+                assignee_id,
+                value('start_time'),
+                value('end_time_expected'),
+                exclude_id=getattr(serializer.instance, 'id', None)).exists():
+            return False
+        serializer.save(**fields)
+    return True
+
+
+def _conflict_response(request):
+    return ErrorMessage(
+        title='Appointment conflict',
+        detail='The user already has an appointment at this time',
+        status=409,
+        instance=request.build_absolute_uri(),
+        code='AppointmentConflict'
+    ).to_response()
+
+
 @api_view(['GET'])
 @permission_classes([HasSessionOrTokenActive, HasPermission(VIEW_ALL_APPOINTMENTS)])
 def list_appointments(request):
     organization = get_user_org(get_request_user(request))
-    appointments = Appointment.objects.select_related('patient', 'assigned_to', 'created_by', 'updated_by').filter(
-        organization=organization).order_by('-created_at')
-    return Response(format_appointments(appointments), status=200)
+    appointments = Appointment.objects.filter(organization=organization)
+    return _paginated_appointments(request, appointments, allow_assignee=True)
 
 
 class AdminAppointmentView(APIView):
@@ -119,6 +189,59 @@ class AdminAppointmentView(APIView):
                 code='AppointmentNotFound'
             ).to_response()
 
+    def put(self, request, *args, **kwargs):
+        """Reschedule, reassign or update an appointment.
+
+        Body fields are those of `create_appointment`, all optional.
+        `date`, `start_time` and `duration` reschedule together.
+        """
+        appointment_id = self.kwargs.get('appointment_id')
+        organization = get_user_org(get_request_user(request))
+        try:
+            appointment = Appointment.objects.get(
+                id=appointment_id, organization=organization)
+        except (Appointment.DoesNotExist, ValidationError):
+            return ErrorMessage(
+                title='Appointment not found',
+                detail='The appointment you are looking for does not exist',
+                status=404,
+                instance=request.build_absolute_uri(),
+                code='AppointmentNotFound'
+            ).to_response()
+        if not isinstance(request.data, dict):
+            return ErrorMessage(
+                title='Bad Request',
+                detail='The request body must be an object',
+                status=400,
+                instance=request.build_absolute_uri(),
+                code='BadRequest'
+            ).to_response()
+        data = {field: force_str(request.data[field])
+                for field in ('patient', 'reason', 'assigned_to', 'status', 'type')
+                if field in request.data}
+        if any(field in request.data for field in ('date', 'start_time', 'duration')):
+            try:
+                data['start_time'], data['end_time_expected'] = _parse_schedule(request.data)
+            except (KeyError, ValueError, IndexError):
+                return ErrorMessage(
+                    title='Bad Request',
+                    detail='date, start_time and duration are required to reschedule',
+                    status=400,
+                    instance=request.build_absolute_uri(),
+                    code='BadRequest'
+                ).to_response()
+        previous_assignee_id = appointment.assigned_to_id
+        serializer = AppointmentSerializer(appointment, data=data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        # The calendar feed is versioned by `updated_at`
+        if not _save_booking(serializer, updated_by=get_request_user(request), updated_at=now()):
+            return _conflict_response(request)
+        invalidate_schedule(previous_assignee_id)
+        if serializer.instance.assigned_to_id != previous_assignee_id:
+            invalidate_schedule(serializer.instance.assigned_to_id)
+        return Response(format_appointments([serializer.instance])[0], status=200)
+
     def delete(self, request, *args, **kwargs):
         # Set the appointment to cancel status
         appointment_id = self.kwargs.get('appointment_id')
@@ -186,39 +309,168 @@ class MyAppointmentView(APIView):
 @permission_classes([HasSessionOrTokenActive])
 def my_appointments(request):
     organization = get_user_org(get_request_user(request))
-    appointments = Appointment.objects.select_related('patient', 'assigned_to', 'created_by').filter(
-        organization=organization, assigned_to=get_request_user(request)).order_by('-created_at')
-    return Response(format_appointments(appointments), status=200)
+    appointments = Appointment.objects.filter(
+        organization=organization, assigned_to=get_request_user(request))
+    return _paginated_appointments(request, appointments)
+
+
+def _paginated_appointments(request, appointments, allow_assignee=False):
+    """Filter appointments by query parameters and respond with one page
+
+    Query parameters:
+        status, type: Comma separated values
+        assigned_to: User id, only if `allow_assignee`
+        start_from, start_to: Start time range. ISO 8601 datetime, or date
+            in the user's timezone (`start_to` date is inclusive).
+        cursor: `next` of the previous page
+        limit: Page size, max 200
+    """
+    try:
+        appointments = _filter_appointments(
+            request, appointments, allow_assignee)
+        page, next_cursor = appointment_paginator.paginate(
+            appointments.values(*APPOINTMENT_FIELDS),
+            cursor=request.GET.get('cursor'),
+            limit=request.GET.get('limit'),
+        )
+    except ValueError as error:
+        return ErrorMessage(
+            title='Invalid query parameters',
+            detail=str(error),
+            status=400,
+            instance=request.build_absolute_uri(),
+            code='InvalidQueryParameters'
+        ).to_response()
+    return Response(dict(
+        results=format_appointments(page),
+        next=next_cursor,
+    ), status=200)
+
+
+def _filter_appointments(request, appointments, allow_assignee=False):
+    for field in ('status', 'type'):
+        if request.GET.get(field):
+            values = request.GET.get(field).split(',')
+            choices = [choice for choice, _ in Appointment._meta.get_field(field).choices]
+            for value in values:
+                if value not in choices:
+                    raise ValueError(f'Unknown {field}: {value}')
+            appointments = appointments.filter(**{f'{field}__in': values})
+    if allow_assignee and request.GET.get('assigned_to'):
+        try:
+            assigned_to = uuid.UUID(request.GET.get('assigned_to'))
+        except ValueError:
+            raise ValueError('assigned_to must be a user id.')
+        appointments = appointments.filter(assigned_to=assigned_to)
+    user_tz = None
+    for param, lookup in (('start_from', 'start_time__gte'), ('start_to', 'start_time__lt')):
+        value = request.GET.get(param)
+        if not value:
+            continue
+        date = parse_date(value)
+        if date is not None:
+            if param == 'start_to':
+                # Include the whole day
+                date += datetime.timedelta(days=1)
+            if user_tz is None:
+                user_tz = _get_user_timezone(get_request_user(request))
+            moment = user_tz.localize(
+                datetime.datetime.combine(date, datetime.time.min))
+        else:
+            moment = parse_datetime(value)
+            if moment is None:
+                raise ValueError(f'{param} must be an ISO 8601 date or datetime.')
+            if moment.tzinfo is None:
+                raise ValueError(f'{param} must include a timezone.')
+            if param == 'start_to':
+                lookup = 'start_time__lte'
+        appointments = appointments.filter(**{lookup: moment})
+    return appointments
+
+
+def _get_user_timezone(user):
+    """
+    Raises:
+        ValueError: If the user's saved timezone is unknown
+    """
+    try:
+        return pytz.timezone(user.timezone)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f'Unknown timezone of the user: {user.timezone}. '
+                         'Use an ISO 8601 datetime with an offset instead of a date.')
 
 
 @api_view(['GET'])
 @permission_classes([HasSessionOrTokenActive])
 def my_appointments_for_date(request, date):
-    organization = get_user_org(get_request_user(request))
-    user_tz = get_request_user(request).timezone
+    user = get_request_user(request)
+    organization = get_user_org(user)
+    tz = pytz.timezone(user.timezone)
     date_obj = datetime.datetime.strptime(force_str(date), '%m-%d-%Y').date()
-    today_min = datetime.datetime.combine(
-        date_obj, datetime.time.min, pytz.timezone(user_tz))
-    today_max = datetime.datetime.combine(
-        date_obj, datetime.time.max, pytz.timezone(user_tz))
-    appointments = Appointment.objects.select_related('patient', 'assigned_to', 'created_by').filter(
-        organization=organization, assigned_to=get_request_user(request), start_time__range=(today_min, today_max)).order_by('start_time')
+    appointments = Appointment.objects.filter(
+        organization=organization,
+        assigned_to=user,
+        start_time__gte=tz.localize(datetime.datetime.combine(date_obj, datetime.time.min)),
+        start_time__lt=tz.localize(datetime.datetime.combine(
+            date_obj + datetime.timedelta(days=1), datetime.time.min)),
+    ).order_by('start_time')
     return Response(format_appointments(appointments), status=200)
 
 
+@api_view(['GET'])
+@permission_classes([HasSessionOrTokenActive])
+def my_schedule_for_date(request, date):
+    """Schedule entries of one day, see `format_schedule_entries`"""
+    user = get_request_user(request)
+    date_obj = datetime.datetime.strptime(force_str(date), '%m-%d-%Y').date()
+    schedules = get_day_schedules(user, [date_obj], format_schedule_entries)
+    return Response(schedules[date_obj], status=200)
+
+
+@api_view(['GET'])
+@permission_classes([HasSessionOrTokenActive])
+def my_appointments_for_week(request, date):
+    """Schedule entries of 7 days from `date`, keyed by date (YYYY-MM-DD),
+    see `format_schedule_entries`"""
+    user = get_request_user(request)
+    date_obj = datetime.datetime.strptime(force_str(date), '%m-%d-%Y').date()
+    dates = [date_obj + datetime.timedelta(days=day) for day in range(7)]
+    schedules = get_day_schedules(user, dates, format_schedule_entries)
+    return Response({date.isoformat(): appointments for date, appointments in schedules.items()}, status=200)
+
+
 @api_view(['GET'])
 @permission_classes([HasSessionOrTokenActive])
 def my_appointment_patient_list(request):
+    """Patients the user has appointments with, each once, by name
+
+    Query parameters:
+        cursor: `next` of the previous page
+        limit: Page size, max 200
+    """
     organization = get_user_org(get_request_user(request))
-    # TODO: This should be distinct in PostgreSQL
-    appointments = Appointment.objects.select_related('patient').filter(
+    patient_ids = Appointment.objects.filter(
         organization=organization,
         assigned_to=get_request_user(request)
-    ).order_by('patient__first_name', 'patient__last_name')
-    patients = []
-    for appointment in appointments:
-        patients.append(appointment.patient)
-    return Response(PatientSerializer(patients, many=True).data, status=200)
+    ).values('patient_id')
+    # Only the summary columns, phone and email are decrypted per page
+    patients = ciphertext_values(Patient.objects.filter(id__in=patient_ids),
+                                 'id', 'first_name', 'last_name', 'phone', 'email')
+    try:
+        page, next_cursor = patient_roster_paginator.paginate(
+            patients,
+            cursor=request.GET.get('cursor'),
+            limit=request.GET.get('limit'),
+        )
+    except ValueError as error:
+        return ErrorMessage(
+            title='Invalid query parameters',
+            detail=str(error),
+            status=400,
+            instance=request.build_absolute_uri(),
+            code='InvalidQueryParameters'
+        ).to_response()
+    return Response(dict(results=decrypt_rows(Patient, page), next=next_cursor), status=200)
 
 
 @api_view(['GET'])
@@ -240,46 +492,104 @@ def get_appointment_patient(request, appointment_id):
         ).to_response()
 
 
+# Columns of the appointment data, foreign keys as ids
+APPOINTMENT_FIELDS = ('id', 'patient_id', 'start_time', 'end_time', 'end_time_expected', 'type',
+                      'reason', 'status', 'assigned_to_id', 'logs',
+                      'created_at', 'updated_at', 'created_by_id', 'updated_by_id', 'organization_id')
+
+# Columns of a schedule entry, see `format_schedule_entries`
+SCHEDULE_FIELDS = ('id', 'patient_id', 'start_time', 'end_time', 'end_time_expected', 'type', 'status')
+
+# Same output as AppointmentSerializer datetime fields
+datetime_field = DateTimeField()
+
+
+def _appointment_rows(appointments, fields):
+    if isinstance(appointments, QuerySet):
+        return list(appointments.values(*fields))
+    return [appointment if isinstance(appointment, dict) else
+            {field: getattr(appointment, field) for field in fields}
+            for appointment in appointments]
+
+
+def format_schedule_entries(appointments):
+    """Format appointments for the cached day summary and week views.
+
+    Entries hold times, type, status and the patient's id and name,
+    no patient contact data or reason. Details are read with
+    `my/list/<appointment_id>/`.
+
+    Args:
+        appointments (QuerySet | list): Appointment queryset, objects, or
+            rows of `SCHEDULE_FIELDS`
+
+    Returns:
+        list: Appointment dicts
+    """
+    rows = _appointment_rows(appointments, SCHEDULE_FIELDS)
+    if not rows:
+        return []
+    patients = {patient['id']: patient for patient in values_decrypted(
+        Patient.objects.filter(id__in={row['patient_id'] for row in rows}),
+        'id', 'first_name', 'last_name')}
+    return [{
+        'id': str(row['id']),
+        'patient': patients.get(row['patient_id']),
+        'start_time': datetime_field.to_representation(row['start_time']),
+        'end_time': datetime_field.to_representation(row['end_time']),
+        'end_time_expected': datetime_field.to_representation(row['end_time_expected']),
+        'type': row['type'],
+        'status': row['status'],
+    } for row in rows]
+
+
 # Fomat the appointment data
 def format_appointments(appointments):
+    """Format appointments with patient and user summaries.
+
+    Only the needed columns are fetched. Patients and users are fetched
+    once per distinct id, so each patient is decrypted once however many
+    appointments they have.
+
+    Args:
+        appointments (QuerySet | list): Appointment queryset, objects, or
+            rows of `APPOINTMENT_FIELDS`
+
+    Returns:
+        list: Appointment dicts in the shape of AppointmentSerializer
+    """
+    rows = _appointment_rows(appointments, APPOINTMENT_FIELDS)
+    if not rows:
+        return []
+    # Get patient data
+    patients = {patient['id']: patient for patient in values_decrypted(
+        Patient.objects.filter(id__in={row['patient_id'] for row in rows}),
+        'id', 'first_name', 'last_name', 'phone', 'email')}
+    # Get assigned_to, created_by, updated_by data
+    user_ids = set()
+    for row in rows:
+        user_ids.update((row['assigned_to_id'], row['created_by_id'], row['updated_by_id']))
+    user_ids.discard(None)
+    users = {user['id']: user for user in User.objects.filter(
+        id__in=user_ids).values('id', 'first_name', 'last_name')}
     result = []
-    for appointment in appointments:
-        # Get appointment data
-        serialized = AppointmentSerializer(appointment).data
-        # Get patient data
-        patient = dict(
-            id=appointment.patient.id,
-            first_name=appointment.patient.first_name,
-            last_name=appointment.patient.last_name,
-            phone=appointment.patient.phone,
-            email=appointment.patient.email,
-        )
-        assigned_to, created_by, updated_by = None, None, None
-        # Get assigned_to, created_by, updated_by data
-        if appointment.assigned_to:
-            assigned_to = dict(
-                id=appointment.assigned_to.id,
-                first_name=appointment.assigned_to.first_name,
-                last_name=appointment.assigned_to.last_name,
-            )
-        if appointment.created_by:
-            created_by = dict(
-                id=appointment.created_by.id,
-                first_name=appointment.created_by.first_name,
-                last_name=appointment.created_by.last_name,
-            )
-        if appointment.updated_by:
-            updated_by = dict(
-                id=appointment.updated_by.id,
-                first_name=appointment.updated_by.first_name,
-                last_name=appointment.updated_by.last_name,
-            )
+    for row in rows:
         # Append the data to the result
         result.append({
-            **serialized,
-            'assigned_to': assigned_to,
-            'patient': patient,
-            'created_by': created_by,
-            'updated_by': updated_by
+            'id': str(row['id']),
+            'patient': patients.get(row['patient_id']),
+            'start_time': datetime_field.to_representation(row['start_time']),
+            'end_time': datetime_field.to_representation(row['end_time']),
+            'end_time_expected': datetime_field.to_representation(row['end_time_expected']),
+            'type': row['type'],
+            'reason': row['reason'],
+            'status': row['status'],
+            'assigned_to': users.get(row['assigned_to_id']),
+            'logs': row['logs'],
+            'created_at': datetime_field.to_representation(row['created_at']),
+            'updated_at': datetime_field.to_representation(row['updated_at']),
+            'created_by': users.get(row['created_by_id']),
+            'updated_by': users.get(row['updated_by_id']),
+            'organization': row['organization_id'],
         })
     return result
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+from django.db import models, router, transaction
+from users.models import User
+
+
+class AvailabilityManager(models.Manager):
+    @contextmanager
+    def rules_lock(self, user_ids):
+        """Transaction in which rule changes of the users are serialized, so
+        that checking overlaps and saving cannot race with another request,
+        see `AppointmentManager.booking_lock`.
+
+        On PostgreSQL the user rows are locked, in id order so that two
+        requests for the same users cannot deadlock. SQLite has no row
+        locks, so the database write lock is taken before reading.
+
+        Args:
+            user_ids (Iterable[uuid]): The users whose rules change
+        """
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            connection = transaction.get_connection(using)
+            if connection.vendor == 'sqlite':
+                # A write that changes nothing still takes the write lock
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'UPDATE {self.model._meta.db_table} SET id = id WHERE 0')
+            else:
+                list(User.objects.select_for_update().filter(
+                    id__in=user_ids).order_by('id').values_list('id', flat=True))
+            yield
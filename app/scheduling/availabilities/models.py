@@ -1,6 +1,7 @@
 import uuid
 from django.db import models
 from users.models import User
+from .managers import AvailabilityManager
 
 
 class Availability(models.Model):
@@ -16,6 +17,8 @@ class Availability(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AvailabilityManager()
+
     class Meta:
         indexes = [
             models.Index(fields=['start_time']),
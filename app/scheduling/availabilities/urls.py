@@ -6,6 +6,7 @@ api/scheduling/availabilities/
 """
 urlpatterns = [
     path('admin/new/', views.add_availability),
+    path('admin/bulk/', views.add_availabilities),
     path('admin/<str:user_id>/list/', views.list_all),
     path('admin/<str:user_id>/list/<str:availability_id>/',
          views.AvailabilityView.as_view()),
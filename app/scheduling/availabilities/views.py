@@ -1,15 +1,21 @@
+import uuid
+from collections import defaultdict
+from django.db.models import Q
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from datetime import datetime
+from datetime import datetime, timedelta
 from rest_framework.views import APIView
 from users.permissions import HasSessionOrTokenActive
 from users.api import get_request_user
 from organizations.api import get_user_org, get_org_user_from_id
+from organizations.models import OrgUser
 from roles.permissions import HasPermission
 from utils.error_handling.error_message import ErrorMessage
 from ..base_permissions import VIEW_ALL_AVAILABILITIES, MODIFY_ALL_AVAILABILITIES
 from .models import Availability
 from .serializers import AvailabilitySerializer
+from ..slots import RULE_FIELDS, rules_overlap
+from ..rule_cache import invalidate_rules
 
 
 @api_view(['GET'])
@@ -33,20 +39,51 @@ def list_all(request, user_id):
 @api_view(['POST'])
 @permission_classes([HasSessionOrTokenActive, HasPermission(MODIFY_ALL_AVAILABILITIES)])
 def add_availability(request):
+    """Add availability of one user, one rule per weekday in `days`
+    or a one-off range if `days` is empty"""
+    return _create_availabilities(request, [request.data])
+
+
+@api_view(['POST'])
+@permission_classes([HasSessionOrTokenActive, HasPermission(MODIFY_ALL_AVAILABILITIES)])
+def add_availabilities(request):
+    """Add many availability rules at once, e.g. a weekly template.
+
+    Body: `{"rules": [...]}`, each rule in the format of `add_availability`.
+    Rules are validated together and saved in one transaction, or none are.
+    """
+    # A list body has no `rules`
+    rules = request.data.get('rules') if isinstance(request.data, dict) else None
+    if not isinstance(rules, list) or len(rules) == 0:
+        return ErrorMessage(
+            detail='rules must be a non-empty list',
+            status=400,
+            code='BadRequest',
+            instance=request.build_absolute_uri(),
+            title='Bad Request'
+        ).to_response()
+    return _create_availabilities(request, rules)
+
+
+def _create_availabilities(request, rules):
     org = get_user_org(get_request_user(request))
-    print(request.data)
-    start_time = request.data.get('start_time')  # 2024-07-03T18:00:00.000Z
-    start_time = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%fZ').time()
-    end_time = request.data.get('end_time')
-    end_time = datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S.%fZ').time()
-    start_date = request.data.get('start_date')  # 2024-07-03
-    start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-    end_date = request.data.get('end_date')
-    if end_date:
-        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-    days = request.data.get('days')
-    user = get_org_user_from_id(request.data.get('user'), org)
-    if user is None:
+    try:
+        availabilities = [availability
+                          for index, rule in enumerate(rules)
+                          for availability in _parse_rule(index, rule)]
+    except ValueError as error:
+        return ErrorMessage(
+            detail=str(error),
+            status=400,
+            code='BadRequest',
+            instance=request.build_absolute_uri(),
+            title='Bad Request'
+        ).to_response()
+    # All users must belong to the organization
+    user_ids = {availability.user_id for availability in availabilities}
+    org_user_ids = set(OrgUser.objects.filter(
+        organization=org, user_id__in=user_ids).values_list('user_id', flat=True))
+    if user_ids - org_user_ids:
         return ErrorMessage(
             detail='User not found',
             status=404,
@@ -54,51 +91,83 @@ def add_availability(request):
             instance=request.build_absolute_uri(),
             title='Not Found'
         ).to_response()
-    user = user.id
-    response = []
-    if len(days) > 0:
-        for day in days:
-            serializer = AvailabilitySerializer(data={
-                'user': user,
-                'start_time': start_time,
-                'end_time': end_time,
-                'start_date': start_date,
-                'end_date': end_date,
-                'day': day
-            })
-            if serializer.is_valid():
-                serializer.save()
-                response.append(serializer.data)
-            else:
-                return ErrorMessage(
-                    detail=serializer.errors,
-                    status=400,
-                    code='BadRequest',
-                    instance=request.build_absolute_uri(),
-                    title='Bad Request'
-                ).to_response()
-    else:
-        if end_date is None:
-            end_date = start_date
-        serializer = AvailabilitySerializer(data={
-            'user': user,
-            'start_time': start_time,
-            'end_time': end_time,
-            'start_date': start_date,
-            'end_date': end_date
-        })
-        if serializer.is_valid():
-            serializer.save()
-            response.append(serializer.data)
-        else:
+    # Locked before checking, so that concurrent requests for the same
+    # users cannot both pass the check
+    with Availability.objects.rules_lock(user_ids):
+        conflict = _find_overlap(availabilities)
+        if conflict is not None:
             return ErrorMessage(
-                detail=serializer.errors,
-                status=400,
-                code='BadRequest',
+                detail=conflict,
+                status=409,
+                code='AvailabilityConflict',
                 instance=request.build_absolute_uri(),
-                title='Bad Request'
+                title='Availability Conflict'
             ).to_response()
-    return Response(response, status=201)
+        Availability.objects.bulk_create(availabilities)
+    for user_id in user_ids:
+        invalidate_rules(user_id)
+    return Response(AvailabilitySerializer(availabilities, many=True).data, status=201)
+
+
+def _parse_rule(index, rule):
+    """Build unsaved Availability objects of a rule
+
+    Raises:
+        ValueError: If the rule is invalid
+    """
+    try:
+        start_time = datetime.strptime(
+            rule.get('start_time'), '%Y-%m-%dT%H:%M:%S.%fZ').time()  # 2024-07-03T18:00:00.000Z
+        end_time = datetime.strptime(
+            rule.get('end_time'), '%Y-%m-%dT%H:%M:%S.%fZ').time()
+        start_date = datetime.strptime(
+            rule.get('start_date'), '%Y-%m-%d').date()  # 2024-07-03
+        end_date = rule.get('end_date')
+        if end_date:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        user_id = uuid.UUID(str(rule.get('user')))
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError(f'Rule {index}: invalid user, time or date format.')
+    days = rule.get('days') or []
+    if not isinstance(days, list) or any(day not in range(7) for day in days):
+        raise ValueError(f'Rule {index}: days must be weekdays from 0 (Monday) to 6.')
+    if start_time == end_time:
+        raise ValueError(f'Rule {index}: end time must differ from start time.')
+    if len(days) == 0 and not end_date:
+        end_date = start_date
+    if end_date and end_date < start_date:
+        raise ValueError(f'Rule {index}: end date must not be before start date.')
+    return [Availability(user_id=user_id, start_time=start_time, end_time=end_time,
+                         start_date=start_date, end_date=end_date or None, day=day)
+            for day in (days or [None])]
+
+
+def _find_overlap(availabilities):
+    """Check new rules against each other and against saved rules
+    of the same users, in one query. Saved rules are read from the
+    database, not the rule cache, which may lag behind other processes.
+
+    Returns:
+        str: Description of the first overlap or None
+    """
+    # A day earlier for rules that run past midnight
+    first_day = min(availability.start_date for availability in availabilities) \
+        - timedelta(days=1)
+    existing = Availability.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=first_day),
+        user_id__in={availability.user_id for availability in availabilities},
+    ).values('id', *RULE_FIELDS)
+    by_user = defaultdict(list)
+    for rule in existing:
+        by_user[rule['user_id']].append(rule)
+    for availability in availabilities:
+        for rule in by_user[availability.user_id]:
+            if rules_overlap(availability, rule):
+                if isinstance(rule, Availability):
+                    return 'Rules in the request overlap each other.'
+                return f'Overlaps existing availability {rule["id"]}.'
+        by_user[availability.user_id].append(availability)
+    return None
 
 
 class AvailabilityView(APIView):
@@ -0,0 +1,243 @@
+import uuid
+import hashlib
+import datetime
+from django.core import signing
+from django.core.cache import caches
+from django.db.models import Q, Count, Max
+from django.utils import timezone
+from core.settings import SCHEDULE_CACHE, CALENDAR_FEED_TTL, CALENDAR_FEED_PAST_DAYS
+from .appointments.models import Appointment
+from .breaks.models import Break
+from .leaves.models import Leave
+from .models import CalendarFeed
+from .slots import UTC, RULE_FIELDS
+
+##########################################################
+#
+#                 iCalendar feed of a provider
+#
+# Appointments, breaks and leaves of a provider as an
+# RFC 5545 calendar, for calendar apps that subscribe to
+# a URL. The URL carries a signed token of the user id and
+# the key of their `CalendarFeed`, as these apps cannot log
+# in. `reset_feed_token` replaces the key, which revokes
+# the URLs handed out before.
+#
+# The ETag is derived from the rows of the feed in the
+# database, their count and latest `updated_at` per table,
+# so every worker agrees on it. Writes to appointments,
+# breaks and leaves must set `updated_at`. Unchanged feeds
+# are answered with 304 without reading the rows. Built
+# feeds are streamed and kept for `CALENDAR_FEED_TTL`
+# seconds under their ETag. Patients are left out, no
+# decryption is needed.
+#
+##########################################################
+
+FEED_SALT = 'app.scheduling.calendar_feed'
+FEED_KEY_PREFIX = 'calendar_feed'
+CONTENT_TYPE = 'text/calendar; charset=utf-8'
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def _get_cache():
+    return caches[SCHEDULE_CACHE]
+
+
+def _sign(user_id, key):
+    return signing.Signer(salt=FEED_SALT).sign(f'{user_id}:{key}')
+
+
+def make_feed_token(user):
+    """Get the token of the user's feed URL"""
+    feed, _ = CalendarFeed.objects.get_or_create(user_id=user.pk)
+    return _sign(user.pk, feed.key)
+
+
+def reset_feed_token(user):
+    """Give the user's feed a new key, URLs with older tokens stop working
+
+    Returns:
+        str: The new token
+    """
+    key = uuid.uuid4()
+    CalendarFeed.objects.update_or_create(
+        user_id=user.pk, defaults=dict(key=key, updated_at=timezone.now()))
+    return _sign(user.pk, key)
+
+
+def read_feed_token(token):
+    """Get the user id of a feed token
+
+    Returns:
+        str: User id, None if the token is not valid, was reset,
+            or the user is not active
+    """
+    try:
+        user_id, key = signing.Signer(salt=FEED_SALT).unsign(token).split(':')
+        user_id, key = uuid.UUID(user_id), uuid.UUID(key)
+    except (signing.BadSignature, ValueError):
+        return None
+    if not CalendarFeed.objects.filter(
+            user_id=user_id, key=key, user__is_active=True).exists():
+        return None
+    return str(user_id)
+
+
+def _feed_since():
+    # Whole days, so the feed does not change within a day
+    today = timezone.now().astimezone(UTC).date()
+    return UTC.localize(datetime.datetime.combine(
+        today - datetime.timedelta(days=CALENDAR_FEED_PAST_DAYS), datetime.time.min))
+
+
+def _feed_querysets(user_id, since):
+    return (
+        Appointment.objects.filter(assigned_to_id=user_id, start_time__gte=since),
+        Break.objects.filter(Q(end_date__isnull=True) | Q(end_date__gte=since.date()),
+                             user_id=user_id),
+        Leave.objects.filter(user_id=user_id, end_date__gte=since.date()),
+    )
+
+
+def get_feed_etag(user_id):
+    """Get the ETag of the user's feed, from the count and latest
+    `updated_at` of its rows"""
+    since = _feed_since()
+    state = [since.isoformat()]
+    for queryset in _feed_querysets(user_id, since):
+        rows = queryset.aggregate(count=Count('pk'), updated_at=Max('updated_at'))
+        state.append(f'{rows["count"]}:{rows["updated_at"]}')
+    return '"%s"' % hashlib.sha1(':'.join(state).encode()).hexdigest()
+
+
+def _feed_key(user_id, etag):
+    return '%s:%s:%s' % (FEED_KEY_PREFIX, user_id, etag.strip('"'))
+
+
+def get_cached_feed(user_id, etag):
+    """Get a built feed
+
+    Returns:
+        dict: `body` and `last_modified` (epoch seconds), None if not cached
+    """
+    return _get_cache().get(_feed_key(user_id, etag))
+
+
+def stream_feed(user_id, etag, last_modified):
+    """Build the feed, one event at a time, and cache it once complete
+
+    Args:
+        user_id (str): The provider
+        etag (str): From `get_feed_etag`, before reading the rows
+        last_modified (int): Epoch seconds sent with the feed
+    """
+    chunks = []
+    for chunk in _feed_chunks(user_id):
+        chunks.append(chunk)
+        yield chunk
+    _get_cache().set(_feed_key(user_id, etag),
+                     dict(body=''.join(chunks), last_modified=last_modified),
+                     CALENDAR_FEED_TTL)
+
+
+def _escape(text):
+    return str(text).replace('\\', '\\\\').replace(';', '\\;') \
+        .replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    # Lines longer than 75 octets continue on the next line after a space
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        size = 75 if not parts else 74
+        # Do not split a UTF-8 sequence
+        while size < len(encoded) and encoded[size] & 0xC0 == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode('utf-8'))
+        encoded = encoded[size:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _datetime(value):
+    return value.astimezone(UTC).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(uid, stamp, summary, properties):
+    lines = ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{_datetime(stamp)}',
+             f'SUMMARY:{_escape(summary)}', *properties, 'END:VEVENT']
+    return ''.join(_fold(line) for line in lines)
+
+
+def _appointment_events(appointments):
+    labels = dict(Appointment._meta.get_field('type').choices)
+    appointments = appointments.order_by('start_time').values(
+        'id', 'type', 'status', 'start_time', 'end_time', 'end_time_expected',
+        'updated_at').iterator(chunk_size=500)
+    for appointment in appointments:
+        properties = [f'DTSTART:{_datetime(appointment["start_time"])}']
+        end = appointment['end_time'] or appointment['end_time_expected']
+        if end is not None:
+            properties.append(f'DTEND:{_datetime(end)}')
+        properties.append('STATUS:CANCELLED' if appointment['status'] == 'cancelled'
+                          else 'STATUS:CONFIRMED')
+        yield _event(f'{appointment["id"]}@appointments', appointment['updated_at'],
+                     f'{labels.get(appointment["type"], appointment["type"])} appointment',
+                     properties)
+
+
+def _break_events(breaks):
+    labels = dict(Break._meta.get_field('reason').choices)
+    breaks = breaks.values('id', 'reason', 'updated_at', *RULE_FIELDS).iterator(chunk_size=500)
+    for rule in breaks:
+        # Same rules as `expand_rules`: times of day in UTC, recurring
+        # rules are weekly and open ended, one-off rules are daily
+        first = rule['start_date']
+        if rule['day'] is not None:
+            first += datetime.timedelta(days=(rule['day'] - first.weekday()) % 7)
+            last = rule['end_date']
+            repeat = f'FREQ=WEEKLY;BYDAY={WEEKDAYS[rule["day"]]}'
+        else:
+            last = rule['end_date'] or rule['start_date']
+            repeat = 'FREQ=DAILY' if last > first else None
+        if last is not None and first > last:
+            continue
+        start = UTC.localize(datetime.datetime.combine(first, rule['start_time']))
+        end = UTC.localize(datetime.datetime.combine(first, rule['end_time']))
+        if end <= start:
+            end += datetime.timedelta(days=1)
+        properties = [f'DTSTART:{_datetime(start)}', f'DTEND:{_datetime(end)}']
+        if repeat is not None:
+            if last is not None:
+                until = UTC.localize(datetime.datetime.combine(last, rule['start_time']))
+                repeat += f';UNTIL={_datetime(until)}'
+            properties.append(f'RRULE:{repeat}')
+        yield _event(f'{rule["id"]}@breaks', rule['updated_at'],
+                     f'Break ({labels.get(rule["reason"], rule["reason"])})', properties)
+
+
+def _leave_events(leaves):
+    leaves = leaves.values('id', 'start_date', 'end_date', 'updated_at').iterator(chunk_size=500)
+    for leave in leaves:
+        # Whole days, the end of an all day event is exclusive
+        end = leave['end_date'] + datetime.timedelta(days=1)
+        yield _event(f'{leave["id"]}@leaves', leave['updated_at'], 'Leave', [
+            f'DTSTART;VALUE=DATE:{leave["start_date"].strftime("%Y%m%d")}',
+            f'DTEND;VALUE=DATE:{end.strftime("%Y%m%d")}',
+            'TRANSP:OPAQUE',
+        ])
+
+
+def _feed_chunks(user_id):
+    appointments, breaks, leaves = _feed_querysets(user_id, _feed_since())
+    yield ''.join(_fold(line) for line in (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Pluto Care//Scheduling//EN',
+        'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', 'X-WR-CALNAME:Schedule'))
+    yield from _appointment_events(appointments)
+    yield from _break_events(breaks)
+    yield from _leave_events(leaves)
+    yield _fold('END:VCALENDAR')
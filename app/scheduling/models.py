@@ -0,0 +1,28 @@
+import uuid
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.timezone import now
+from users.models import User
+from .availabilities.models import Availability
+from .breaks.models import Break
+from .rule_cache import invalidate_rules
+
+
+class CalendarFeed(models.Model):
+    """Secret of a provider's calendar feed URL, see `calendar_feed.py`.
+    A new key revokes every URL handed out before."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    key = models.UUIDField(default=uuid.uuid4)
+    updated_at = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return f"{self.pk}"
+
+
+@receiver([post_save, post_delete], sender=Availability)
+@receiver([post_save, post_delete], sender=Break)
+def invalidate_user_rules(sender, instance, **kwargs):
+    # Every write to a rule, from views, the admin or the shell, see rule_cache.py.
+    # After commit, so that no request caches the old rules again
+    transaction.on_commit(lambda: invalidate_rules(instance.user_id))
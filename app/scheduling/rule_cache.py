@@ -0,0 +1,169 @@
+import uuid
+import datetime
+from collections import defaultdict
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from core.settings import SCHEDULE_CACHE, RULE_CACHE_TTL, SCHEDULE_LOCAL_CACHE_TTL
+from .availabilities.models import Availability
+from .breaks.models import Break
+from .slots import UTC, RULE_FIELDS, expand_rules, merge_intervals, clip_intervals
+
+##########################################################
+#
+#          Compiled availability and break rules
+#
+# Rules of a user are cached as rows, and expanded into
+# sorted, merged UTC intervals one week (Monday to Monday,
+# UTC) at a time. Compiled weeks are cached too, so slot
+# search and provider search do not query or expand the
+# rules again until they change. Cached rules are for
+# reads only: a cache of another process may be stale, so
+# checks before writes, like availability overlaps, query
+# the database.
+#
+# Keys carry the user's version. Creating, changing or
+# deleting an availability or break calls
+# `invalidate_rules` from the model signals, which moves
+# the user to a new version so rows and weeks are rebuilt
+# on next read. `bulk_create` sends no signals, callers
+# invalidate themselves.
+#
+# Versions are only seen by all workers in a shared cache.
+# A per process cache cannot see invalidations made by
+# other workers, its entries live
+# `SCHEDULE_LOCAL_CACHE_TTL` seconds at most.
+#
+##########################################################
+
+RULES_KEY_PREFIX = 'rules'
+WEEK_KEY_PREFIX = 'rule_week'
+VERSION_KEY_PREFIX = 'rules_ver'
+
+RULE_KINDS = (('availabilities', Availability), ('breaks', Break))
+
+
+def _get_cache():
+    return caches[SCHEDULE_CACHE]
+
+
+def _get_ttl(cache):
+    if isinstance(cache, LocMemCache):
+        return min(RULE_CACHE_TTL, SCHEDULE_LOCAL_CACHE_TTL)
+    return RULE_CACHE_TTL
+
+
+def _get_versions(cache, user_ids):
+    keys = {user_id: f'{VERSION_KEY_PREFIX}:{user_id}' for user_id in user_ids}
+    found = cache.get_many(keys.values())
+    versions, created = {}, {}
+    for user_id, key in keys.items():
+        if key not in found:
+            found[key] = created[key] = uuid.uuid4().hex
+        versions[user_id] = found[key]
+    if created:
+        cache.set_many(created, None)
+    return versions
+
+
+def _get_rules(cache, user_ids, versions):
+    keys = {user_id: f'{RULES_KEY_PREFIX}:{user_id}:{versions[user_id]}'
+            for user_id in user_ids}
+    cached = cache.get_many(keys.values())
+    rules = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+    missing = [user_id for user_id in user_ids if user_id not in rules]
+    if missing:
+        built = _load_rules(missing)
+        ttl = _get_ttl(cache)
+        if ttl > 0:
+            cache.set_many({keys[user_id]: built[user_id] for user_id in missing}, ttl)
+        rules.update(built)
+    return rules
+
+
+def _load_rules(user_ids):
+    # One query per rule model for all users
+    rules = defaultdict(lambda: {kind: [] for kind, _ in RULE_KINDS})
+    for kind, model in RULE_KINDS:
+        for row in model.objects.filter(user_id__in=user_ids).values('id', *RULE_FIELDS):
+            rules[row['user_id']][kind].append(row)
+    return {user_id: rules[user_id] for user_id in user_ids}
+
+
+def get_rules(user_ids):
+    """Get availability and break rules of the users
+
+    Args:
+        user_ids (iterable): User ids
+
+    Returns:
+        dict: `{user_id: {'availabilities': rows, 'breaks': rows}}`,
+            rows have `id` and `RULE_FIELDS`
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    cache = _get_cache()
+    return _get_rules(cache, user_ids, _get_versions(cache, user_ids))
+
+
+def _week_start(date):
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def _compile_week(rules, week):
+    start = UTC.localize(datetime.datetime.combine(week, datetime.time.min))
+    end = start + datetime.timedelta(days=7)
+    return {kind: merge_intervals(clip_intervals(expand_rules(rules[kind], start, end), start, end))
+            for kind, _ in RULE_KINDS}
+
+
+def get_rule_intervals(user_ids, start, end):
+    """Get availability and break intervals of the users in a window
+
+    Args:
+        user_ids (iterable): User ids
+        start (datetime): Window start, aware
+        end (datetime): Window end, aware
+
+    Returns:
+        dict: `{user_id: {'availabilities': intervals, 'breaks': intervals}}`,
+            sorted, non-overlapping UTC intervals within the window
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    start, end = start.astimezone(UTC), end.astimezone(UTC)
+    weeks = []
+    week = _week_start(start.date())
+    while UTC.localize(datetime.datetime.combine(week, datetime.time.min)) < end:
+        weeks.append(week)
+        week += datetime.timedelta(days=7)
+    cache = _get_cache()
+    versions = _get_versions(cache, user_ids)
+    keys = {(user_id, week): f'{WEEK_KEY_PREFIX}:{user_id}:{versions[user_id]}:{week.isoformat()}'
+            for user_id in user_ids for week in weeks}
+    cached = cache.get_many(keys.values())
+    compiled = {pair: cached[key] for pair, key in keys.items() if key in cached}
+    missing = [pair for pair in keys if pair not in compiled]
+    if missing:
+        rules = _get_rules(cache, list(dict.fromkeys(
+            user_id for user_id, _ in missing)), versions)
+        built = {(user_id, week): _compile_week(rules[user_id], week)
+                 for user_id, week in missing}
+        ttl = _get_ttl(cache)
+        if ttl > 0:
+            cache.set_many({keys[pair]: built[pair] for pair in missing}, ttl)
+        compiled.update(built)
+    # Weeks are in order, merging joins intervals that cross Monday midnight
+    return {user_id: {kind: clip_intervals(merge_intervals(
+        interval for week in weeks for interval in compiled[(user_id, week)][kind]), start, end)
+        for kind, _ in RULE_KINDS}
+        for user_id in user_ids}
+
+
+def invalidate_rules(user):
+    """Make cached rules and weeks of the user stale
+
+    Args:
+        user (User | uuid): User or user id, None is ignored
+    """
+    if user is None:
+        return
+    user_id = getattr(user, 'pk', user)
+    _get_cache().set(f'{VERSION_KEY_PREFIX}:{user_id}', uuid.uuid4().hex, None)
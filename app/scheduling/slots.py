@@ -0,0 +1,350 @@
+import datetime
+from collections import defaultdict
+import pytz
+from django.db.models import Q
+from .leaves.models import Leave
+from .appointments.models import Appointment
+
+##########################################################
+#
+#                   Free time slot engine
+#
+# Intervals are `(start, end)` tuples of aware UTC
+# datetimes, half open, kept sorted by start.
+#
+# Free time of a provider is their availability, minus
+# breaks, leaves and appointments that are not cancelled:
+#
+#   free = merge(availability) - merge(breaks + leaves + appointments)
+#
+# Both sides are merged with a sweep over sorted intervals
+# and subtracted in one more linear pass, so the cost grows
+# with the number of occurrences in the window, not with its
+# length in minutes.
+#
+# Availability and break rules store times of day in UTC,
+# as `add_availability` keeps the UTC time of the submitted
+# datetime, and apply to UTC calendar dates. A rule whose end
+# time is not after its start time ends on the next day.
+# Recurring rules (`day` set, 0=Monday) repeat weekly from
+# `start_date` to `end_date` (open ended if not set), one-off
+# rules cover every day from `start_date` to `end_date`.
+# Leaves block whole days, both ends inclusive, in the
+# provider's timezone.
+#
+# Rules are expanded once per week and cached, see
+# `rule_cache.get_rule_intervals`.
+#
+##########################################################
+
+UTC = pytz.utc
+
+RULE_FIELDS = ('user_id', 'start_time', 'end_time',
+               'start_date', 'end_date', 'day')
+
+
+def merge_intervals(intervals):
+    """Merge overlapping and touching intervals
+
+    Args:
+        intervals (iterable): `(start, end)` tuples in any order
+
+    Returns:
+        list: Sorted, non-overlapping intervals
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(intervals, cuts):
+    """Remove `cuts` from `intervals`
+
+    Args:
+        intervals (list): Sorted, non-overlapping intervals
+        cuts (list): Sorted, non-overlapping intervals
+
+    Returns:
+        list: Sorted, non-overlapping intervals
+    """
+    result = []
+    index = 0
+    for start, end in intervals:
+        # Skip cuts that end before this interval
+        while index < len(cuts) and cuts[index][1] <= start:
+            index += 1
+        position = index
+        while position < len(cuts) and cuts[position][0] < end:
+            cut_start, cut_end = cuts[position]
+            if cut_start > start:
+                result.append((start, cut_start))
+            start = max(start, cut_end)
+            if start >= end:
+                break
+            position += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def clip_intervals(intervals, start, end):
+    """Keep the parts of sorted intervals that fall in `[start, end)`"""
+    return [(max(s, start), min(e, end)) for s, e in intervals
+            if e > start and s < end]
+
+
+def _value(rule, field):
+    return rule[field] if isinstance(rule, dict) else getattr(rule, field)
+
+
+def expand_rules(rules, start, end):
+    """Expand availability or break rules into intervals
+
+    Args:
+        rules (iterable): Rows or objects with `RULE_FIELDS`
+        start (datetime): Window start, aware
+        end (datetime): Window end, aware
+
+    Returns:
+        list: Unsorted intervals that may overlap the window
+    """
+    # One day earlier for rules that run past midnight
+    first_day = start.astimezone(UTC).date() - datetime.timedelta(days=1)
+    last_day = end.astimezone(UTC).date()
+    intervals = []
+    for rule in rules:
+        rule_start = max(_value(rule, 'start_date'), first_day)
+        rule_end = _value(rule, 'end_date')
+        day = _value(rule, 'day')
+        if rule_end is None:
+            # Recurring rules are open ended, one-off rules cover a single day
+            rule_end = last_day if day is not None else _value(rule, 'start_date')
+        rule_end = min(rule_end, last_day)
+        if rule_start > rule_end:
+            continue
+        step = 1
+        if day is not None:
+            # Jump to the first matching weekday
+            rule_start += datetime.timedelta(days=(day - rule_start.weekday()) % 7)
+            step = 7
+        start_time, end_time = _value(rule, 'start_time'), _value(rule, 'end_time')
+        # Ends after midnight
+        overnight = datetime.timedelta(days=1 if end_time <= start_time else 0)
+        date = rule_start
+        while date <= rule_end:
+            intervals.append((
+                UTC.localize(datetime.datetime.combine(date, start_time)),
+                UTC.localize(datetime.datetime.combine(date + overnight, end_time)),
+            ))
+            date += datetime.timedelta(days=step)
+    return intervals
+
+
+def leave_intervals(leaves, timezone):
+    """Convert leaves into intervals of whole days in `timezone`
+
+    Args:
+        leaves (iterable): Rows or objects with `start_date` and `end_date`
+        timezone (tzinfo): Timezone of the provider
+    """
+    intervals = []
+    for leave in leaves:
+        intervals.append((
+            timezone.localize(datetime.datetime.combine(
+                _value(leave, 'start_date'), datetime.time.min)).astimezone(UTC),
+            timezone.localize(datetime.datetime.combine(
+                _value(leave, 'end_date') + datetime.timedelta(days=1), datetime.time.min)).astimezone(UTC),
+        ))
+    return intervals
+
+
+def appointment_intervals(appointments):
+    """Convert appointments into intervals. Appointments that ended
+    use `end_time`, others `end_time_expected`."""
+    intervals = []
+    for appointment in appointments:
+        end = _value(appointment, 'end_time') or _value(appointment, 'end_time_expected')
+        if end is not None:
+            intervals.append((_value(appointment, 'start_time'), end))
+    return intervals
+
+
+def free_intervals(schedule, start, end, timezone=UTC):
+    """Compute free time of a provider
+
+    Args:
+        schedule (dict): Intervals and rows of one provider, see `load_schedules`
+        start (datetime): Window start, aware
+        end (datetime): Window end, aware
+        timezone (tzinfo, optional): Timezone of the provider, for leaves
+
+    Returns:
+        list: Sorted, non-overlapping free intervals in UTC within the window
+    """
+    start, end = start.astimezone(UTC), end.astimezone(UTC)
+    available = clip_intervals(schedule['availabilities'], start, end)
+    busy = merge_intervals(
+        schedule['breaks']
+        + leave_intervals(schedule['leaves'], timezone)
+        + appointment_intervals(schedule['appointments']))
+    return subtract_intervals(available, busy)
+
+
+def split_slots(intervals, duration, step=None, timezone=UTC):
+    """Split free intervals into bookable slots
+
+    Slots start on multiples of `step` counted from midnight in
+    `timezone`, e.g. on the hour and half hour for 30 minutes.
+
+    Args:
+        intervals (list): Sorted free intervals
+        duration (timedelta): Length of a slot
+        step (timedelta, optional): Distance between slot starts. Defaults to duration.
+        timezone (tzinfo, optional): Timezone of the slot grid
+
+    Returns:
+        list: `(start, end)` slots in `timezone`
+    """
+    step = step or duration
+    slots = []
+    for start, end in intervals:
+        local = start.astimezone(timezone)
+        midnight = timezone.localize(datetime.datetime.combine(
+            local.date(), datetime.time.min))
+        # Round up to the grid
+        offset = (local - midnight) % step
+        slot_start = local + (step - offset if offset else datetime.timedelta())
+        while slot_start + duration <= end:
+            slots.append((slot_start, timezone.normalize(slot_start + duration)))
+            slot_start = timezone.normalize(slot_start + step)
+    return slots
+
+
+def load_schedules(user_ids, start, end):
+    """Load availability and break intervals of the users from the
+    rule cache, and leaves and appointments that may fall in the
+    window in one query each.
+
+    Args:
+        user_ids (iterable): User ids
+        start (datetime): Window start, aware
+        end (datetime): Window end, aware
+
+    Returns:
+        dict: `{user_id: {'availabilities', 'breaks', 'leaves', 'appointments'}}`,
+            availabilities and breaks are intervals, the others rows
+    """
+    # Imported here, the rule cache imports this module
+    from .rule_cache import get_rule_intervals
+    user_ids = list(user_ids)
+    schedules = defaultdict(lambda: dict(
+        availabilities=[], breaks=[], leaves=[], appointments=[]))
+    for user_id, intervals in get_rule_intervals(user_ids, start, end).items():
+        schedules[user_id].update(intervals)
+    first_day = start.astimezone(UTC).date() - datetime.timedelta(days=1)
+    last_day = end.astimezone(UTC).date()
+    # Leaves are in local days, allow a day on both sides
+    for row in Leave.objects.filter(
+            user_id__in=user_ids,
+            start_date__lte=last_day + datetime.timedelta(days=1),
+            end_date__gte=first_day).values('user_id', 'start_date', 'end_date'):
+        schedules[row['user_id']]['leaves'].append(row)
+    for row in Appointment.objects.filter(
+            assigned_to_id__in=user_ids,
+            start_time__lt=end,
+    ).filter(
+        Q(end_time_expected__gt=start) | Q(end_time__gt=start)
+    ).exclude(status='cancelled').values(
+            'assigned_to_id', 'start_time', 'end_time', 'end_time_expected'):
+        schedules[row['assigned_to_id']]['appointments'].append(row)
+    return {user_id: schedules[user_id] for user_id in user_ids}
+
+
+def rank_free_providers(users, start, end, min_duration=None):
+    """Compute free time of many providers in one pass and rank them
+
+    Args:
+        users (list): Dicts with `id` and `timezone`, extra keys are kept
+        start (datetime): Window start, aware
+        end (datetime): Window end, aware
+        min_duration (timedelta, optional): Ignore free intervals shorter than this
+
+    Returns:
+        list: `(user, free intervals)` of providers with free time,
+            earliest opening first, then most free time
+    """
+    schedules = load_schedules([user['id'] for user in users], start, end)
+    ranked = []
+    for user in users:
+        free = free_intervals(schedules[user['id']], start, end,
+                              pytz.timezone(user['timezone']))
+        if min_duration:
+            free = [(s, e) for s, e in free if e - s >= min_duration]
+        if free:
+            total = sum((e - s for s, e in free), datetime.timedelta())
+            ranked.append((free[0][0], -total, user, free))
+    ranked.sort(key=lambda item: (item[0], item[1]))
+    return [(user, free) for _, _, user, free in ranked]
+
+
+def _rule_minutes(rule):
+    # Time of day as `(day offset, start, end)` minute ranges,
+    # overnight rules spill into the next day
+    start = _value(rule, 'start_time').hour * 60 + _value(rule, 'start_time').minute
+    end = _value(rule, 'end_time').hour * 60 + _value(rule, 'end_time').minute
+    if end > start:
+        return [(0, start, end)]
+    return [(0, start, 24 * 60), (1, 0, end)]
+
+
+def _rule_dates(rule, offset):
+    # Days a range with this offset from the rule's dates falls on
+    start_date, end_date = _value(rule, 'start_date'), _value(rule, 'end_date')
+    if end_date is None:
+        # Recurring rules are open ended, one-off rules cover a single day
+        end_date = datetime.date.max - datetime.timedelta(days=1) \
+            if _value(rule, 'day') is not None else start_date
+    return (start_date + datetime.timedelta(days=offset),
+            end_date + datetime.timedelta(days=offset))
+
+
+def _rule_weekdays(rule, offset, first_day, last_day):
+    if _value(rule, 'day') is not None:
+        return {(_value(rule, 'day') + offset) % 7}
+    if (last_day - first_day).days >= 6:
+        return set(range(7))
+    return {(first_day + datetime.timedelta(days=day)).weekday()
+            for day in range((last_day - first_day).days + 1)}
+
+
+def rules_overlap(rule, other):
+    """Check if two availability or break rules share any time.
+    The part of an overnight rule after midnight is compared on
+    the next day.
+
+    Args:
+        rule, other: Rows or objects with `RULE_FIELDS`
+
+    Returns:
+        bool
+    """
+    for offset, start, end in _rule_minutes(rule):
+        for other_offset, other_start, other_end in _rule_minutes(other):
+            if not (start < other_end and other_start < end):
+                continue
+            rule_first, rule_last = _rule_dates(rule, offset)
+            other_first, other_last = _rule_dates(other, other_offset)
+            first_day, last_day = max(rule_first, other_first), min(rule_last, other_last)
+            if first_day > last_day:
+                continue
+            if _rule_weekdays(rule, offset, first_day, last_day) \
+                    & _rule_weekdays(other, other_offset, first_day, last_day):
+                return True
+    return False
@@ -0,0 +1,671 @@
+import datetime
+import random
+import threading
+import time
+import uuid
+from io import StringIO
+from unittest import mock
+import jwt
+import pytz
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, RequestFactory
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from core.settings import SCHEDULE_CACHE, ALLOW_ORIGINS, SECRET_KEY
+from organizations.api import new_organization
+from users.api import add_user, get_user
+from users.users_sessions.api import create_session
+from app.patients.models import Patient
+from .appointments.models import Appointment
+from .availabilities.models import Availability
+from .breaks.models import Break
+from .leaves.models import Leave
+from .availabilities import views as availability_views
+from .availabilities.views import _find_overlap
+from .rule_cache import get_rules, get_rule_intervals
+from .calendar_feed import make_feed_token, reset_feed_token, read_feed_token
+from .slots import (UTC, merge_intervals, subtract_intervals, clip_intervals, expand_rules,
+                    leave_intervals, free_intervals, split_slots, rank_free_providers, rules_overlap)
+
+MONDAY = datetime.date(2024, 6, 3)
+
+
+def at(day, hour, minute=0, timezone=UTC):
+    return timezone.localize(datetime.datetime.combine(day, datetime.time(hour, minute)))
+
+
+def rule(start, end, start_date=MONDAY, end_date=None, day=None):
+    return dict(user_id=None, start_time=datetime.time(*start), end_time=datetime.time(*end),
+                start_date=start_date, end_date=end_date, day=day)
+
+
+class IntervalTest(SimpleTestCase):
+    def test_merge_sorts_and_joins_overlapping_and_touching(self):
+        self.assertEqual(merge_intervals([
+            (at(MONDAY, 12), at(MONDAY, 13)),
+            (at(MONDAY, 9), at(MONDAY, 10)),
+            (at(MONDAY, 10), at(MONDAY, 11)),
+            (at(MONDAY, 12, 30), at(MONDAY, 12, 45)),
+            (at(MONDAY, 15), at(MONDAY, 15)),
+        ]), [(at(MONDAY, 9), at(MONDAY, 11)), (at(MONDAY, 12), at(MONDAY, 13))])
+
+    def test_subtract(self):
+        self.assertEqual(subtract_intervals(
+            [(at(MONDAY, 9), at(MONDAY, 12)), (at(MONDAY, 13), at(MONDAY, 17))],
+            [(at(MONDAY, 8), at(MONDAY, 9, 30)), (at(MONDAY, 10), at(MONDAY, 10, 30)),
+             (at(MONDAY, 11, 30), at(MONDAY, 14)), (at(MONDAY, 16), at(MONDAY, 18))],
+        ), [(at(MONDAY, 9, 30), at(MONDAY, 10)), (at(MONDAY, 10, 30), at(MONDAY, 11, 30)),
+            (at(MONDAY, 14), at(MONDAY, 16))])
+
+    def test_clip(self):
+        self.assertEqual(clip_intervals(
+            [(at(MONDAY, 8), at(MONDAY, 10)), (at(MONDAY, 11), at(MONDAY, 12))],
+            at(MONDAY, 9), at(MONDAY, 11, 30),
+        ), [(at(MONDAY, 9), at(MONDAY, 10)), (at(MONDAY, 11), at(MONDAY, 11, 30))])
+
+
+class ExpandRulesTest(SimpleTestCase):
+    def test_recurring_rule_repeats_weekly(self):
+        intervals = expand_rules([rule((9,), (17,), day=2)], at(MONDAY, 0),
+                                 at(MONDAY + datetime.timedelta(days=14), 0))
+        self.assertEqual(sorted(intervals), [
+            (at(MONDAY + datetime.timedelta(days=2), 9), at(MONDAY + datetime.timedelta(days=2), 17)),
+            (at(MONDAY + datetime.timedelta(days=9), 9), at(MONDAY + datetime.timedelta(days=9), 17)),
+        ])
+
+    def test_one_off_rule_covers_its_days(self):
+        intervals = expand_rules([rule((9,), (10,), end_date=MONDAY + datetime.timedelta(days=1))],
+                                 at(MONDAY, 0), at(MONDAY + datetime.timedelta(days=7), 0))
+        self.assertEqual(len(intervals), 2)
+
+    def test_overnight_rule_ends_next_day(self):
+        intervals = expand_rules([rule((22,), (2,), day=0)], at(MONDAY, 0),
+                                 at(MONDAY + datetime.timedelta(days=2), 0))
+        self.assertEqual(intervals, [(at(MONDAY, 22), at(MONDAY + datetime.timedelta(days=1), 2))])
+
+
+class FreeIntervalsTest(SimpleTestCase):
+    def test_availability_minus_breaks_leaves_and_appointments(self):
+        tuesday = MONDAY + datetime.timedelta(days=1)
+        schedule = dict(
+            availabilities=[(at(MONDAY, 9), at(MONDAY, 17)), (at(tuesday, 9), at(tuesday, 17))],
+            breaks=[(at(MONDAY, 12), at(MONDAY, 13))],
+            leaves=[dict(start_date=tuesday, end_date=tuesday)],
+            appointments=[
+                dict(start_time=at(MONDAY, 9), end_time=None, end_time_expected=at(MONDAY, 9, 30)),
+                # Ended early, the rest of the booking is free again
+                dict(start_time=at(MONDAY, 15), end_time=at(MONDAY, 15, 15),
+                     end_time_expected=at(MONDAY, 16)),
+            ],
+        )
+        self.assertEqual(free_intervals(schedule, at(MONDAY, 0), at(MONDAY, 0) + datetime.timedelta(days=2)), [
+            (at(MONDAY, 9, 30), at(MONDAY, 12)),
+            (at(MONDAY, 13), at(MONDAY, 15)),
+            (at(MONDAY, 15, 15), at(MONDAY, 17)),
+        ])
+
+    def test_leaves_are_whole_local_days(self):
+        vancouver = pytz.timezone('America/Vancouver')
+        (start, end), = leave_intervals([dict(start_date=MONDAY, end_date=MONDAY)], vancouver)
+        self.assertEqual((start, end), (at(MONDAY, 7), at(MONDAY + datetime.timedelta(days=1), 7)))
+
+
+class SplitSlotsTest(SimpleTestCase):
+    def test_slots_start_on_the_grid(self):
+        slots = split_slots([(at(MONDAY, 9, 10), at(MONDAY, 11))], datetime.timedelta(minutes=30))
+        self.assertEqual([start.time() for start, _ in slots],
+                         [datetime.time(9, 30), datetime.time(10), datetime.time(10, 30)])
+
+    def test_step_and_timezone(self):
+        vancouver = pytz.timezone('America/Vancouver')
+        slots = split_slots([(at(MONDAY, 16), at(MONDAY, 17, 30))], datetime.timedelta(minutes=60),
+                            step=datetime.timedelta(minutes=15), timezone=vancouver)
+        self.assertEqual([start.strftime('%H:%M') for start, _ in slots], ['09:00', '09:15', '09:30'])
+        self.assertEqual(slots[0][0].utcoffset(), datetime.timedelta(hours=-7))
+
+    def test_slots_keep_their_length_across_dst(self):
+        vancouver = pytz.timezone('America/Vancouver')
+        night = datetime.date(2024, 11, 3)
+        slots = split_slots([(at(night, 7), at(night, 12))], datetime.timedelta(hours=1), timezone=vancouver)
+        self.assertTrue(all(end - start == datetime.timedelta(hours=1) for start, end in slots))
+
+
+class RankFreeProvidersTest(TestCase):
+    def setUp(self):
+        caches[SCHEDULE_CACHE].clear()
+        self.user = add_user('ada@example.com', 'Passw0rd!', 'Ada', 'Lovelace')
+
+    def test_rules_and_leaves_from_the_database(self):
+        Availability.objects.create(user=self.user, start_time=datetime.time(9), end_time=datetime.time(17),
+                                    start_date=MONDAY, day=0)
+        Break.objects.create(user=self.user, start_time=datetime.time(12), end_time=datetime.time(13),
+                             start_date=MONDAY, day=0, reason='lunch')
+        Leave.objects.create(user=self.user, start_date=MONDAY + datetime.timedelta(days=7),
+                             end_date=MONDAY + datetime.timedelta(days=8))
+        users = [dict(id=self.user.id, timezone='UTC')]
+        (user, free), = rank_free_providers(users, at(MONDAY, 0), at(MONDAY, 0) + datetime.timedelta(days=14))
+        self.assertEqual(free, [(at(MONDAY, 9), at(MONDAY, 12)), (at(MONDAY, 13), at(MONDAY, 17))])
+
+
+class SweepReferenceTest(SimpleTestCase):
+    """Random intervals in whole minutes of a day, against sets of minutes"""
+
+    def setUp(self):
+        self.random = random.Random(2024)
+
+    def intervals(self, count):
+        intervals = []
+        for _ in range(count):
+            start = self.random.randrange(24 * 60)
+            intervals.append((start, start + self.random.randrange(0, 180)))
+        return intervals
+
+    def to_datetimes(self, intervals):
+        return [(at(MONDAY, 0) + datetime.timedelta(minutes=start),
+                 at(MONDAY, 0) + datetime.timedelta(minutes=end)) for start, end in intervals]
+
+    def minutes(self, intervals):
+        return {minute for start, end in intervals for minute in range(start, end)}
+
+    def runs(self, minutes):
+        # Maximal runs of consecutive minutes, as datetime intervals
+        runs = []
+        for minute in sorted(minutes):
+            if runs and runs[-1][1] == minute:
+                runs[-1][1] = minute + 1
+            else:
+                runs.append([minute, minute + 1])
+        return self.to_datetimes(runs)
+
+    def test_merge(self):
+        for _ in range(200):
+            intervals = self.intervals(self.random.randrange(12))
+            self.assertEqual(merge_intervals(self.to_datetimes(intervals)), self.runs(self.minutes(intervals)))
+
+    def test_subtract(self):
+        for _ in range(200):
+            intervals, cuts = self.intervals(self.random.randrange(8)), self.intervals(self.random.randrange(8))
+            self.assertEqual(
+                subtract_intervals(merge_intervals(self.to_datetimes(intervals)),
+                                   merge_intervals(self.to_datetimes(cuts))),
+                self.runs(self.minutes(intervals) - self.minutes(cuts)))
+
+    def test_free_intervals(self):
+        for _ in range(200):
+            availabilities, breaks, appointments = (self.intervals(self.random.randrange(6)) for _ in range(3))
+            window = sorted(self.random.sample(range(26 * 60), 2))
+            schedule = dict(
+                availabilities=merge_intervals(self.to_datetimes(availabilities)),
+                breaks=self.to_datetimes(breaks),
+                leaves=[],
+                appointments=[dict(start_time=start, end_time=None, end_time_expected=end)
+                              for start, end in self.to_datetimes(appointments)],
+            )
+            (start, end), = self.to_datetimes([window])
+            self.assertEqual(
+                free_intervals(schedule, start, end),
+                self.runs(self.minutes(availabilities) & set(range(*window))
+                          - self.minutes(breaks) - self.minutes(appointments)))
+
+
+class RulesOverlapTest(SimpleTestCase):
+    def test_same_day(self):
+        self.assertTrue(rules_overlap(rule((9,), (12,), day=0), rule((11,), (13,), day=0)))
+        self.assertFalse(rules_overlap(rule((9,), (12,), day=0), rule((12,), (13,), day=0)))
+        self.assertFalse(rules_overlap(rule((9,), (12,), day=0), rule((9,), (12,), day=1)))
+
+    def test_overnight_spills_into_the_next_day(self):
+        tuesday = MONDAY + datetime.timedelta(days=1)
+        monday_night = rule((22,), (2,), day=0)
+        self.assertTrue(rules_overlap(monday_night, rule((1,), (3,), day=1)))
+        self.assertTrue(rules_overlap(rule((1,), (3,), day=1), monday_night))
+        self.assertTrue(rules_overlap(monday_night, rule((1,), (3,), start_date=tuesday)))
+        self.assertFalse(rules_overlap(monday_night, rule((1,), (3,), day=0)))
+        self.assertFalse(rules_overlap(monday_night, rule((2,), (3,), day=1)))
+
+    def test_sunday_night_spills_into_monday(self):
+        self.assertTrue(rules_overlap(rule((23,), (1,), day=6), rule((0,), (2,), day=0)))
+
+    def test_date_ranges(self):
+        first_week = rule((9,), (12,), end_date=MONDAY + datetime.timedelta(days=6), day=0)
+        next_week = rule((9,), (12,), start_date=MONDAY + datetime.timedelta(days=7), day=0)
+        self.assertFalse(rules_overlap(first_week, next_week))
+        # The last night spills over past the end date
+        last_night = rule((22,), (2,), start_date=MONDAY - datetime.timedelta(days=7),
+                          end_date=MONDAY - datetime.timedelta(days=1), day=0)
+        self.assertTrue(rules_overlap(last_night, rule((1,), (3,), start_date=MONDAY - datetime.timedelta(days=6))))
+        self.assertFalse(rules_overlap(last_night, rule((1,), (3,), start_date=MONDAY + datetime.timedelta(days=1))))
+
+
+class FindOverlapTest(TestCase):
+    def setUp(self):
+        caches[SCHEDULE_CACHE].clear()
+        self.user = add_user('ada@example.com', 'Passw0rd!', 'Ada', 'Lovelace')
+
+    def test_saved_rules_come_from_the_database(self):
+        # Cached while empty, another process then saves a rule
+        get_rules([self.user.id])
+        saved = Availability.objects.create(user=self.user, start_time=datetime.time(22),
+                                            end_time=datetime.time(2), start_date=MONDAY, day=0)
+        new = Availability(user_id=self.user.id, start_time=datetime.time(1), end_time=datetime.time(3),
+                           start_date=MONDAY + datetime.timedelta(days=8))
+        self.assertEqual(_find_overlap([new]), f'Overlaps existing availability {saved.id}.')
+
+    def test_rules_in_the_request(self):
+        rules = [Availability(user_id=self.user.id, start_time=datetime.time(9), end_time=datetime.time(12),
+                              start_date=MONDAY, day=day) for day in (0, 1, 0)]
+        self.assertEqual(_find_overlap(rules), 'Rules in the request overlap each other.')
+        self.assertIsNone(_find_overlap(rules[:2]))
+
+
+class CalendarFeedTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        caches[SCHEDULE_CACHE].clear()
+        patcher = mock.patch('logs.middlewares.write_log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = add_user('ada@example.com', 'Passw0rd!', 'Ada', 'Lovelace')
+        self.url = reverse('calendar_feed', args=[make_feed_token(self.user)])
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, HTTP_ORIGIN=ALLOW_ORIGINS[0], **headers)
+
+    def body(self, response):
+        if response.streaming:
+            return b''.join(response.streaming_content).decode()
+        return response.content.decode()
+
+    def add_leave(self):
+        today = timezone.now().date()
+        return Leave.objects.create(user=self.user, start_date=today,
+                                    end_date=today + datetime.timedelta(days=1))
+
+    def test_token(self):
+        token = make_feed_token(self.user)
+        self.assertEqual(token, make_feed_token(self.user))
+        self.assertEqual(read_feed_token(token), str(self.user.id))
+        self.assertIsNone(read_feed_token(token + 'x'))
+        self.assertIsNone(read_feed_token('not a token'))
+
+    def test_reset_revokes_previous_urls(self):
+        token = make_feed_token(self.user)
+        new_token = reset_feed_token(self.user)
+        self.assertIsNone(read_feed_token(token))
+        self.assertEqual(read_feed_token(new_token), str(self.user.id))
+        self.assertEqual(self.get().status_code, 404)
+        self.assertEqual(self.get(reverse('calendar_feed', args=[new_token])).status_code, 200)
+
+    def test_etag_follows_the_database(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('VEVENT', self.body(response))
+        etag = response['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # No cache is invalidated, as by a write in another process
+        leave = self.add_leave()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'{leave.id}@leaves', self.body(response))
+        self.assertNotEqual(response['ETag'], etag)
+        # Served from the cache under the new ETag
+        response = self.get()
+        self.assertFalse(response.streaming)
+        self.assertIn(f'{leave.id}@leaves', self.body(response))
+        leave.delete()
+        self.assertNotIn('VEVENT', self.body(self.get()))
+
+    def test_inactive_user(self):
+        etag = self.get()['ETag']
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 404)
+        self.assertEqual(self.get().status_code, 404)
+
+
+class RuleCacheTest(TestCase):
+    def setUp(self):
+        caches[SCHEDULE_CACHE].clear()
+        self.user = add_user('ada@example.com', 'Passw0rd!', 'Ada', 'Lovelace')
+        self.window = (at(MONDAY, 0), at(MONDAY + datetime.timedelta(days=7), 0))
+
+    def breaks(self):
+        return get_rule_intervals([self.user.id], *self.window)[self.user.id]['breaks']
+
+    def test_rule_writes_invalidate(self):
+        self.assertEqual(self.breaks(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            rule = Break.objects.create(user=self.user, start_time=datetime.time(12), end_time=datetime.time(13),
+                                        start_date=MONDAY, day=0, reason='lunch')
+        self.assertEqual(self.breaks(), [(at(MONDAY, 12), at(MONDAY, 13))])
+        rule.end_time = datetime.time(14)
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.save()
+        self.assertEqual(self.breaks(), [(at(MONDAY, 12), at(MONDAY, 14))])
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.delete()
+        self.assertEqual(self.breaks(), [])
+
+    def test_local_cache_lifetime_is_capped(self):
+        with mock.patch.object(caches[SCHEDULE_CACHE], 'set_many',
+                               wraps=caches[SCHEDULE_CACHE].set_many) as set_many:
+            self.breaks()
+        # Versions never expire, rows and weeks do
+        timeouts = [timeout for values, timeout in (call.args for call in set_many.call_args_list)
+                    if not any(key.startswith('rules_ver:') for key in values)]
+        self.assertEqual(timeouts, [10, 10])
+        with mock.patch('app.scheduling.rule_cache.SCHEDULE_LOCAL_CACHE_TTL', 0):
+            caches[SCHEDULE_CACHE].clear()
+            self.breaks()
+            self.assertEqual([key for key in caches[SCHEDULE_CACHE]._cache
+                              if 'rules:' in key or 'rule_week:' in key], [])
+
+
+class ApiTestCase(TestCase):
+    """Signed in member of an organization, with one patient"""
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_base_roles', stdout=StringIO())
+
+    def setUp(self):
+        caches[SCHEDULE_CACHE].clear()
+        patcher = mock.patch('logs.middlewares.write_log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.organization = new_organization('admin@example.com', 'Passw0rd!', 'Ada', 'Admin')
+        self.user = get_user('admin@example.com')
+        self.sign_in(self.user)
+        self.patient = Patient.objects.create(first_name='Grace', last_name='Hopper', phone='6045550100',
+                                              email='grace@example.com', organization=self.organization)
+
+    def sign_in(self, user):
+        key, _ = create_session(user, RequestFactory().get('/', HTTP_USER_AGENT='tests'))
+        self.client.cookies['auth'] = jwt.encode({'session_key': key}, SECRET_KEY, algorithm='HS256')
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_ORIGIN=ALLOW_ORIGINS[0], HTTP_USER_AGENT='tests')
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type='application/json',
+                                HTTP_ORIGIN=ALLOW_ORIGINS[0], HTTP_USER_AGENT='tests')
+
+    def put(self, url, data):
+        return self.client.put(url, data, content_type='application/json',
+                               HTTP_ORIGIN=ALLOW_ORIGINS[0], HTTP_USER_AGENT='tests')
+
+    def appointment(self, start, minutes=30, **fields):
+        return Appointment.objects.create(
+            patient=self.patient, reason='Checkup', start_time=start,
+            end_time_expected=start + datetime.timedelta(minutes=minutes),
+            organization=self.organization, created_by=self.user,
+            **{'assigned_to': self.user, **fields})
+
+
+class DayScheduleViewTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.timezone = 'UTC'
+        self.user.save()
+        self.first = self.appointment(at(MONDAY, 9))
+        self.appointment(at(MONDAY, 8))
+        self.appointment(at(MONDAY + datetime.timedelta(days=1), 9))
+
+    def test_day_keeps_the_full_appointment(self):
+        response = self.get('/api/scheduling/appointments/my/date/06-03-2024/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[1]['id'], str(self.first.id))
+        self.assertEqual(data[1]['reason'], 'Checkup')
+        self.assertEqual(data[1]['patient']['phone'], '6045550100')
+        self.assertEqual(data[1]['assigned_to']['id'], str(self.user.id))
+        self.assertEqual(data[1]['created_by']['id'], str(self.user.id))
+        self.assertEqual(data[1]['organization'], str(self.organization.id))
+
+    def test_summary_and_week_leave_out_contact_data(self):
+        day = self.get('/api/scheduling/appointments/my/date/06-03-2024/summary/').json()['data']
+        self.assertEqual(day[1]['id'], str(self.first.id))
+        self.assertEqual(day[1]['patient'], dict(id=str(self.patient.id), first_name='Grace', last_name='Hopper'))
+        self.assertNotIn('reason', day[1])
+        week = self.get('/api/scheduling/appointments/my/week/06-03-2024/').json()['data']
+        self.assertEqual(week['2024-06-03'], day)
+        self.assertEqual(len(week['2024-06-04']), 1)
+        self.assertNotIn('6045550100', str(caches[SCHEDULE_CACHE]._cache))
+
+    def test_local_cache_lifetime_is_capped(self):
+        cache = caches[SCHEDULE_CACHE]
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            self.get('/api/scheduling/appointments/my/week/06-03-2024/')
+        (_, timeout), = [call.args for call in set_many.call_args_list]
+        self.assertEqual(timeout, 10)
+
+    def test_new_appointment_shows_up(self):
+        self.get('/api/scheduling/appointments/my/date/06-03-2024/summary/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.make_appointment(
+                patient=self.patient, reason='x', start_time=at(MONDAY, 11), organization=self.organization,
+                assigned_to=self.user)
+        day = self.get('/api/scheduling/appointments/my/date/06-03-2024/summary/').json()['data']
+        self.assertEqual(len(day), 3)
+
+
+# Bookings must start in the future
+BOOKING_DAY = datetime.date(2030, 1, 7)
+
+
+def booking(patient, assigned_to, start_time, duration=30, **fields):
+    return {'patient': str(patient.id), 'reason': 'Checkup', 'status': 'confirmed', 'type': 'phone',
+            'date': f'{BOOKING_DAY}T00:00:00.000Z', 'start_time': start_time, 'duration': duration,
+            'assigned_to': str(assigned_to.id) if assigned_to else '', **fields}
+
+
+class BookingTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = self.appointment(at(BOOKING_DAY, 9))
+
+    def book(self, start_time, assigned_to=None, **fields):
+        return self.post('/api/scheduling/appointments/admin/new/',
+                         booking(self.patient, assigned_to or self.user, start_time, **fields))
+
+    def reschedule(self, appointment, data):
+        return self.put(f'/api/scheduling/appointments/admin/list/{appointment.id}/', data)
+
+    def test_overlap_is_rejected(self):
+        response = self.book('09:15')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['errors']['code'], 'AppointmentConflict')
+        self.assertEqual(self.book('09:30').status_code, 201)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_cancelled_and_other_users_do_not_conflict(self):
+        other = add_user('grace@example.com', 'Passw0rd!', 'Grace', 'Hopper')
+        self.assertEqual(self.book('09:00', assigned_to=other).status_code, 201)
+        self.first.status = 'cancelled'
+        self.first.save()
+        self.assertEqual(self.book('09:00').status_code, 201)
+
+    def test_unassigned_appointments_do_not_conflict(self):
+        self.assertFalse(Appointment.objects.overlapping(
+            None, at(BOOKING_DAY, 0), at(BOOKING_DAY, 23)).exists())
+        self.appointment(at(BOOKING_DAY, 10), assigned_to=None)
+        response = self.post('/api/scheduling/appointments/admin/new/',
+                             booking(self.patient, None, '10:00'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.book('10:00').status_code, 201)
+
+    def test_reschedule_into_another_appointment_is_rejected(self):
+        second = self.appointment(at(BOOKING_DAY, 10))
+        response = self.reschedule(second, {'date': f'{BOOKING_DAY}T00:00:00.000Z',
+                                            'start_time': '09:15', 'duration': 30})
+        self.assertEqual(response.status_code, 409)
+        second.refresh_from_db()
+        self.assertEqual(second.start_time, at(BOOKING_DAY, 10))
+
+    def test_reassign_into_another_appointment_is_rejected(self):
+        other = add_user('grace@example.com', 'Passw0rd!', 'Grace', 'Hopper')
+        second = self.appointment(at(BOOKING_DAY, 9), assigned_to=other)
+        self.assertEqual(self.reschedule(second, {'assigned_to': str(self.user.id)}).status_code, 409)
+
+    def test_reschedule(self):
+        # Overlapping its own old time is fine
+        response = self.reschedule(self.first, {'date': f'{BOOKING_DAY}T00:00:00.000Z',
+                                                'start_time': '09:15', 'duration': 60})
+        self.assertEqual(response.status_code, 200)
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.start_time, self.first.end_time_expected),
+                         (at(BOOKING_DAY, 9, 15), at(BOOKING_DAY, 10, 15)))
+        self.assertEqual(self.first.updated_by, self.user)
+        self.assertEqual(self.reschedule(self.first, {'reason': 'Follow-up'}).status_code, 200)
+        self.assertEqual(self.reschedule(self.first, {'start_time': '11:00'}).status_code, 400)
+        self.assertEqual(self.reschedule(self.first, ['reason']).status_code, 400)
+
+
+class AvailabilitiesViewTest(ApiTestCase):
+    def rule(self, start_time, end_time, **fields):
+        return {'user': str(self.user.id), 'start_time': f'2024-07-03T{start_time}:00.000Z',
+                'end_time': f'2024-07-03T{end_time}:00.000Z', 'start_date': '2024-07-01', 'days': [0], **fields}
+
+    def test_bulk(self):
+        response = self.post('/api/scheduling/availabilities/admin/bulk/',
+                             {'rules': [self.rule('09:00', '12:00'), self.rule('13:00', '17:00')]})
+        self.assertEqual(response.status_code, 201)
+        response = self.post('/api/scheduling/availabilities/admin/bulk/',
+                             {'rules': [self.rule('11:00', '14:00')]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Availability.objects.count(), 2)
+
+    def test_body_must_be_an_object(self):
+        for body in ([self.rule('09:00', '12:00')], {'rules': []}, {'rules': 'x'}):
+            response = self.post('/api/scheduling/availabilities/admin/bulk/', body)
+            self.assertEqual(response.status_code, 400)
+        response = self.post('/api/scheduling/availabilities/admin/new/', [self.rule('09:00', '12:00')])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Availability.objects.exists())
+
+
+class ConcurrencyTest(TransactionTestCase):
+    """Requests in threads, each with its own database connection"""
+    databases = '__all__'
+
+    def setUp(self):
+        call_command('setup_base_roles', stdout=StringIO())
+        patcher = mock.patch('logs.middlewares.write_log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        organization = new_organization('admin@example.com', 'Passw0rd!', 'Ada', 'Admin')
+        self.user = get_user('admin@example.com')
+        self.patient = Patient.objects.create(first_name='Grace', last_name='Hopper', organization=organization)
+
+    def post_concurrently(self, url, bodies, owner, check):
+        """Post the bodies at once, with `owner.check` slowed down so that,
+        without a lock, every request checks before any saves.
+
+        Returns:
+            list: Status codes, sorted
+        """
+        key, _ = create_session(self.user, RequestFactory().get('/', HTTP_USER_AGENT='tests'))
+        token = jwt.encode({'session_key': key}, SECRET_KEY, algorithm='HS256')
+        barrier = threading.Barrier(len(bodies))
+        statuses = []
+        original = getattr(owner, check)
+
+        def slow_check(*args, **kwargs):
+            time.sleep(0.2)
+            return original(*args, **kwargs)
+
+        def post(body):
+            try:
+                client = Client()
+                client.cookies['auth'] = token
+                barrier.wait()
+                statuses.append(client.post(url, body, content_type='application/json',
+                                            HTTP_ORIGIN=ALLOW_ORIGINS[0], HTTP_USER_AGENT='tests').status_code)
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(owner, check, slow_check):
+            threads = [threading.Thread(target=post, args=(body,)) for body in bodies]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return sorted(statuses)
+
+    def test_two_bookings_of_the_same_time(self):
+        statuses = self.post_concurrently(
+            '/api/scheduling/appointments/admin/new/',
+            [booking(self.patient, self.user, start_time) for start_time in ('09:00', '09:15')],
+            Appointment.objects, 'overlapping')
+        self.assertEqual(statuses, [201, 409])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_two_bulk_availabilities_of_the_same_time(self):
+        rule = {'user': str(self.user.id), 'start_time': '2024-07-03T09:00:00.000Z',
+                'end_time': '2024-07-03T12:00:00.000Z', 'start_date': '2024-07-01', 'days': [0]}
+        statuses = self.post_concurrently(
+            '/api/scheduling/availabilities/admin/bulk/', [{'rules': [rule]}] * 2,
+            availability_views, '_find_overlap')
+        self.assertEqual(statuses, [201, 409])
+        self.assertEqual(Availability.objects.count(), 1)
+
+
+class AvailableTimeSlotsViewTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.timezone = 'UTC'
+        self.user.save()
+        Availability.objects.create(user=self.user, start_time=datetime.time(9), end_time=datetime.time(12),
+                                    start_date=MONDAY, day=0)
+        self.appointment(at(MONDAY, 10), minutes=30)
+
+    def slots(self, user_id=None, timezone='UTC', **params):
+        return self.get(f'/api/scheduling/slots/{user_id or self.user.id}/{timezone}/',
+                        **{'start': '2024-06-03', 'end': '2024-06-03', **params})
+
+    def test_slots(self):
+        response = self.slots(duration=60)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'], [
+            dict(start_time='2024-06-03T09:00:00+00:00', end_time='2024-06-03T10:00:00+00:00'),
+            dict(start_time='2024-06-03T11:00:00+00:00', end_time='2024-06-03T12:00:00+00:00'),
+        ])
+        data = self.slots(timezone='America/Vancouver', start='2024-06-03', duration=30).json()['data']
+        self.assertEqual(data[0]['start_time'], '2024-06-03T02:00:00-07:00')
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.slots(user_id='not-a-uuid').status_code, 400)
+        self.assertEqual(self.slots(timezone='Mars/Olympus').status_code, 400)
+        self.assertEqual(self.slots(duration='0').status_code, 400)
+        self.assertEqual(self.slots(user_id=uuid.uuid4()).status_code, 404)
+        self.user.timezone = 'Mars/Olympus'
+        self.user.save()
+        self.assertEqual(self.slots().status_code, 400)
+
+
+class ListAppointmentsViewTest(ApiTestCase):
+    def test_date_filters_in_the_user_timezone(self):
+        first = self.appointment(at(MONDAY, 9))
+        self.appointment(at(MONDAY + datetime.timedelta(days=1), 9))
+        self.user.timezone = 'America/Vancouver'
+        self.user.save()
+        response = self.get('/api/scheduling/appointments/admin/list/', start_from='2024-06-03', start_to='2024-06-03')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['data']['results']], [str(first.id)])
+
+    def test_unknown_user_timezone(self):
+        self.appointment(at(MONDAY, 9))
+        self.user.timezone = 'Mars/Olympus'
+        self.user.save()
+        response = self.get('/api/scheduling/appointments/admin/list/', start_from='2024-06-03')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['code'], 'InvalidQueryParameters')
+        # Datetimes with an offset do not need it
+        response = self.get('/api/scheduling/appointments/admin/list/', start_from='2024-06-03T00:00:00Z')
+        self.assertEqual(response.status_code, 200)
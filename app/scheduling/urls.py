@@ -9,4 +9,12 @@ urlpatterns = [
     path('availabilities/', include('app.scheduling.availabilities.urls')),
     path('breaks/', include('app.scheduling.breaks.urls')),
     path('leaves/', include('app.scheduling.leaves.urls')),
+    # timezone: 'America/Vancouver'
+    path('slots/<str:user_id>/<path:timezone>/', views.getAvailableTimeSlots),
+    # Providers free in a window, e.g. ?start=2024-07-02T14:00&end=2024-07-02T16:00
+    path('free/<path:timezone>/', views.search_free_providers),
+    # URL of the user's iCalendar feed
+    path('feed/', views.my_calendar_feed),
+    # New URL, the previous ones stop working
+    path('feed/reset/', views.reset_my_calendar_feed),
 ]
@@ -1,13 +1,248 @@
+import time
+import uuid
+import datetime
+import pytz
+from django.http import HttpResponse, StreamingHttpResponse, Http404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
 from app.scheduling.base_permissions import MODIFY_ALL_APPOINTMENTS
 from users.permissions import HasSessionOrTokenActive
 from users.api import get_request_user
+from users.models import User
 from organizations.api import get_user_org, get_org_user_from_id
 from roles.permissions import HasPermission
+from utils.error_handling.error_message import ErrorMessage
+from .slots import load_schedules, free_intervals, split_slots, rank_free_providers
+from .calendar_feed import (
+    CONTENT_TYPE as CALENDAR_CONTENT_TYPE,
+    make_feed_token,
+    reset_feed_token,
+    read_feed_token,
+    get_feed_etag,
+    get_cached_feed,
+    stream_feed,
+)
+
+# Longest window a slot query may cover
+MAX_SLOT_WINDOW_DAYS = 62
 
 
 @api_view(['GET'])
 @permission_classes([HasSessionOrTokenActive, HasPermission(MODIFY_ALL_APPOINTMENTS)])
 def getAvailableTimeSlots(request, timezone, user_id):
+    """Bookable slots of a provider
+
+    Query parameters:
+        start: First date, YYYY-MM-DD in `timezone`. Defaults to today.
+        end: Last date, inclusive. Defaults to 7 days from start.
+        duration: Slot length in minutes. Defaults to 30.
+        step: Minutes between slot starts. Defaults to duration.
+    """
+    try:
+        user_id = uuid.UUID(user_id)
+    except ValueError:
+        return ErrorMessage(
+            detail='user_id must be a UUID',
+            status=400,
+            code='BadRequest',
+            instance=request.build_absolute_uri(),
+            title='Bad Request'
+        ).to_response()
     org = get_user_org(get_request_user(request))
     user = get_org_user_from_id(user_id, org)
+    if user is None:
+        return ErrorMessage(
+            detail='User not found',
+            status=404,
+            code='UserNotFound',
+            instance=request.build_absolute_uri(),
+            title='User Not Found'
+        ).to_response()
+    try:
+        tz, start, end, duration, step = _parse_slot_query(request, timezone)
+        user_tz = _get_timezone(user.timezone)
+    except ValueError as error:
+        return ErrorMessage(
+            title='Invalid query parameters',
+            detail=str(error),
+            status=400,
+            instance=request.build_absolute_uri(),
+            code='InvalidQueryParameters'
+        ).to_response()
+    schedule = load_schedules([user.id], start, end)[user.id]
+    free = free_intervals(schedule, start, end, user_tz)
+    slots = split_slots(free, duration, step, tz)
+    return Response([
+        dict(start_time=slot_start.isoformat(), end_time=slot_end.isoformat())
+        for slot_start, slot_end in slots
+    ], status=200)
+
+
+def _get_timezone(name):
+    """
+    Raises:
+        ValueError: If the timezone is unknown, also for a user's
+            saved timezone, which is not validated
+    """
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f'Unknown timezone: {name}')
+
+
+def _parse_slot_query(request, timezone):
+    """Parse the slot window and sizes from query parameters
+
+    Raises:
+        ValueError: If a parameter is invalid
+
+    Returns:
+        tuple: (tzinfo, window start, window end, duration, step)
+    """
+    tz = _get_timezone(timezone)
+    today = datetime.datetime.now(tz).date()
+    start_date = parse_date(request.GET.get('start') or today.isoformat())
+    if start_date is None:
+        raise ValueError('start must be a date (YYYY-MM-DD).')
+    end_date = parse_date(request.GET.get(
+        'end') or (start_date + datetime.timedelta(days=7)).isoformat())
+    if end_date is None:
+        raise ValueError('end must be a date (YYYY-MM-DD).')
+    if end_date < start_date:
+        raise ValueError('end must not be before start.')
+    if (end_date - start_date).days >= MAX_SLOT_WINDOW_DAYS:
+        raise ValueError(
+            f'The window cannot be longer than {MAX_SLOT_WINDOW_DAYS} days.')
+    duration = int(request.GET.get('duration') or 30)
+    step = int(request.GET.get('step') or duration)
+    if duration < 1 or step < 1:
+        raise ValueError('duration and step must be positive minutes.')
+    start = tz.localize(datetime.datetime.combine(start_date, datetime.time.min))
+    end = tz.localize(datetime.datetime.combine(
+        end_date + datetime.timedelta(days=1), datetime.time.min))
+    return tz, start, end, datetime.timedelta(minutes=duration), datetime.timedelta(minutes=step)
+
+
+@api_view(['GET'])
+@permission_classes([HasSessionOrTokenActive, HasPermission(MODIFY_ALL_APPOINTMENTS)])
+def search_free_providers(request, timezone):
+    """Providers of the organization who are free in a window,
+    earliest opening first
+
+    Query parameters:
+        start, end: ISO 8601 datetimes, in `timezone` if no offset is given
+        duration: Minimum free minutes to count. Defaults to any.
+    """
+    org = get_user_org(get_request_user(request))
+    try:
+        tz, start, end, min_duration = _parse_search_query(request, timezone)
+    except ValueError as error:
+        return ErrorMessage(
+            title='Invalid query parameters',
+            detail=str(error),
+            status=400,
+            instance=request.build_absolute_uri(),
+            code='InvalidQueryParameters'
+        ).to_response()
+    users = list(User.objects.filter(orguser__organization=org, is_active=True).values(
+        'id', 'first_name', 'last_name', 'timezone'))
+    ranked = rank_free_providers(users, start, end, min_duration)
+    return Response([
+        dict(
+            user=dict(id=user['id'], first_name=user['first_name'],
+                      last_name=user['last_name']),
+            free=[dict(start_time=free_start.astimezone(tz).isoformat(),
+                       end_time=free_end.astimezone(tz).isoformat())
+                  for free_start, free_end in free],
+        )
+        for user, free in ranked
+    ], status=200)
+
+
+def _parse_search_query(request, timezone):
+    """Parse the search window from query parameters
+
+    Raises:
+        ValueError: If a parameter is invalid
+
+    Returns:
+        tuple: (tzinfo, window start, window end, minimum duration or None)
+    """
+    tz = _get_timezone(timezone)
+    window = []
+    for param in ('start', 'end'):
+        moment = parse_datetime(request.GET.get(param) or '')
+        if moment is None:
+            raise ValueError(f'{param} must be an ISO 8601 datetime.')
+        if moment.tzinfo is None:
+            moment = tz.localize(moment)
+        window.append(moment)
+    start, end = window
+    if end <= start:
+        raise ValueError('end must be after start.')
+    if end - start > datetime.timedelta(days=MAX_SLOT_WINDOW_DAYS):
+        raise ValueError(
+            f'The window cannot be longer than {MAX_SLOT_WINDOW_DAYS} days.')
+    duration = request.GET.get('duration')
+    min_duration = None
+    if duration:
+        if int(duration) < 1:
+            raise ValueError('duration must be positive minutes.')
+        min_duration = datetime.timedelta(minutes=int(duration))
+    return tz, start, end, min_duration
+
+
+@api_view(['GET'])
+@permission_classes([HasSessionOrTokenActive])
+def my_calendar_feed(request):
+    """URL of the user's iCalendar feed, to subscribe from calendar apps"""
+    token = make_feed_token(get_request_user(request))
+    return Response(dict(
+        url=request.build_absolute_uri(reverse('calendar_feed', args=[token]))
+    ), status=200)
+
+
+@api_view(['POST'])
+@permission_classes([HasSessionOrTokenActive])
+def reset_my_calendar_feed(request):
+    """New URL of the user's iCalendar feed, the previous URLs stop working"""
+    token = reset_feed_token(get_request_user(request))
+    return Response(dict(
+        url=request.build_absolute_uri(reverse('calendar_feed', args=[token]))
+    ), status=200)
+
+
+@require_safe
+def calendar_feed(request, token):
+    """iCalendar feed of a provider, see `calendar_feed.py`.
+
+    Served outside of /api, calendar apps send neither the
+    auth cookie nor an Origin header.
+    """
+    # Also checks that the user is active
+    user_id = read_feed_token(token)
+    if user_id is None:
+        raise Http404
+    etag = get_feed_etag(user_id)
+    cached = get_cached_feed(user_id, etag)
+    last_modified = cached['last_modified'] if cached else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+    if cached:
+        response = HttpResponse(cached['body'], content_type=CALENDAR_CONTENT_TYPE)
+    else:
+        last_modified = int(time.time())
+        response = StreamingHttpResponse(
+            stream_feed(user_id, etag, last_modified), content_type=CALENDAR_CONTENT_TYPE)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Calendar apps must revalidate, the feed holds private schedules
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -2,6 +2,8 @@ import json
 from django.http import JsonResponse
 from core.settings import ALLOW_ORIGINS, DEBUG
 from utils.error_handling.error_message import ErrorMessage
+from .renderers import build_envelope, attach_envelope, get_envelope, get_log_id
+from .parsers import attach_json_payload, loads
 
 
 class APIRequestFormatMiddleware:
@@ -33,9 +35,10 @@ class APIRequestFormatMiddleware:
     def validate_json_payload(self, request):
         if request.method in ['POST', 'PUT', 'PATCH']:
             try:
-                request.data = json.loads(request.body)
+                # Decoded once here and reused by DRF's parser
+                attach_json_payload(request, loads(request.body))
                 return True
-            except json.JSONDecodeError:
+            except ValueError:
                 return False
         return True
 
@@ -113,6 +116,14 @@ def is_web(request):
 
 
 class FormulateResponseMiddleware:
+    """
+    Wraps API responses into `{success, data, errors, status, id}`.
+
+    Responses rendered by DRF are already wrapped by `EnvelopeJSONRenderer`
+    and are passed through untouched. Only responses created outside of
+    DRF rendering (e.g. `JsonResponse`) are parsed and wrapped here.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
@@ -123,33 +134,27 @@ class FormulateResponseMiddleware:
         response = self.get_response(request)
         # Code to be executed for each request/response after
         # the view is called.
-        if request.path.startswith('/api') and "Content-Type" in response.headers and response.headers["Content-Type"] in ['application/json', 'application/problem+json']:
-            response_format = dict(
-                success=None,
-                data=None,
-                errors=None,
-                status=response.status_code
-            )
-            if response.status_code > 399 and response.status_code < 500:
-                response_format['success'] = False
-                response_format['errors'] = json.loads(
-                    response.content.decode('utf8'))
-            elif response.status_code < 300:
-                response_format['success'] = True
-                if response.status_code != 204 and response.content:
-                    response_format['data'] = json.loads(
-                        response.content.decode('utf8'))
-                if response.status_code == 204:
-                    response.status_code = 200
-                    response_format['status'] = 200
-            response.content = json.dumps(response_format)
-        elif request.path.startswith('/api') and "Content-Type" not in response.headers:
-            response_format = dict(
+        if not request.path.startswith('/api') or get_envelope(request) is not None:
+            return response
+        if "Content-Type" in response.headers and response.headers["Content-Type"] in ['application/json', 'application/problem+json']:
+            payload = None
+            if response.content:
+                payload = json.loads(response.content.decode('utf8'))
+            envelope = build_envelope(
+                response.status_code, payload, get_log_id(request))
+            response.status_code = envelope['status']
+            response.content = json.dumps(envelope)
+            attach_envelope(request, envelope)
+        elif "Content-Type" not in response.headers:
+            envelope = dict(
                 success=response.status_code < 300,
                 data=None,
                 errors=None,
                 status=200
             )
-            response.content = json.dumps(response_format)
+            if get_log_id(request) is not None:
+                envelope['id'] = str(get_log_id(request))
+            response.content = json.dumps(envelope)
             response.status_code = 200
+            attach_envelope(request, envelope)
         return response
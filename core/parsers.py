@@ -0,0 +1,58 @@
+import json
+from rest_framework.parsers import JSONParser
+from rest_framework.exceptions import ParseError
+
+# Optional fast decoder. Falls back to the standard library if not installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Request attribute holding the JSON body decoded by APIRequestFormatMiddleware
+REQUEST_JSON_FIELD = 'json_payload'
+
+
+def loads(body):
+    """Decode a JSON document with the fastest available backend
+
+    Args:
+        body (bytes | str): JSON document
+
+    Raises:
+        ValueError: If the document is not valid JSON
+
+    Returns:
+        Decoded object
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body, parse_constant=_strict_constant)
+
+
+def _strict_constant(value):
+    # Same as DRF's JSONParser, reject NaN and Infinity
+    raise ValueError('Out of range float values are not JSON compliant: ' + value)
+
+
+def attach_json_payload(request, payload):
+    setattr(request, REQUEST_JSON_FIELD, payload)
+
+
+class PreparsedJSONParser(JSONParser):
+    """
+    JSON parser that reuses the body already decoded and validated by
+    `APIRequestFormatMiddleware`, so each payload is decoded only once.
+    Requests that were not decoded by the middleware are parsed here.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context.get('request')
+        # DRF request wraps the Django request, which middlewares see
+        request = getattr(request, '_request', request)
+        if request is not None and hasattr(request, REQUEST_JSON_FIELD):
+            return getattr(request, REQUEST_JSON_FIELD)
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,76 @@
+from rest_framework.renderers import JSONRenderer
+
+# Request attribute holding the pre-generated API call log id
+REQUEST_LOG_ID_FIELD = 'api_log_id'
+# Request attribute holding the response envelope once it is built
+REQUEST_ENVELOPE_FIELD = 'response_envelope'
+
+
+def build_envelope(status, payload=None, log_id=None):
+    """Build the API response envelope
+
+    Args:
+        status (int): HTTP status code of the response
+        payload (optional): Response data. Goes to `errors` for 4xx, `data` for 2xx.
+        log_id (uuid, optional): API call log id
+
+    Returns:
+        dict: `{success, data, errors, status, id}`
+    """
+    envelope = dict(
+        success=None,
+        data=None,
+        errors=None,
+        status=status
+    )
+    if status > 399 and status < 500:
+        envelope['success'] = False
+        envelope['errors'] = payload
+    elif status < 300:
+        envelope['success'] = True
+        if status == 204:
+            envelope['status'] = 200
+        else:
+            envelope['data'] = payload
+    if log_id is not None:
+        envelope['id'] = str(log_id)
+    return envelope
+
+
+def attach_envelope(request, envelope):
+    """Keep the envelope on the request so that the log middleware
+    can read it without parsing the response body.
+    """
+    setattr(request, REQUEST_ENVELOPE_FIELD, envelope)
+
+
+def get_envelope(request):
+    return getattr(request, REQUEST_ENVELOPE_FIELD, None)
+
+
+def get_log_id(request):
+    return getattr(request, REQUEST_LOG_ID_FIELD, None)
+
+
+class EnvelopeJSONRenderer(JSONRenderer):
+    """
+    JSON renderer that wraps response data into the API envelope
+    before rendering, so the body is serialized exactly once.
+
+    Responses that do not come from DRF views (e.g. `JsonResponse`)
+    are wrapped by `FormulateResponseMiddleware` instead.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        response = renderer_context.get('response')
+        request = renderer_context.get('request')
+        if response is None or request is None or not request.path.startswith('/api'):
+            return super().render(data, accepted_media_type, renderer_context)
+        # DRF request wraps the Django request, which middlewares see
+        request = request._request
+        envelope = build_envelope(
+            response.status_code, data, get_log_id(request))
+        response.status_code = envelope['status']
+        attach_envelope(request, envelope)
+        return super().render(envelope, accepted_media_type, renderer_context)
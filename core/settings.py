@@ -10,6 +10,11 @@ PROJECT_BASE_DIR = BASE_DIR
 SECRET_KEY = config(
     'SECRET_KEY', default='django-insecure$&!9x6t7m7q2^q1l7c@z5@2!&1!v1c7zq^r#_b2z9#q^w3q9z')
 
+# Key of the HMAC blind indexes that make encrypted patient fields searchable.
+# Required, and not derived from SECRET_KEY, so that rotating one does not
+# change the other. Changing it requires `python manage.py rebuild_patient_search`.
+BLIND_INDEX_KEY = config('BLIND_INDEX_KEY')
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=False, cast=bool)
 
@@ -19,6 +24,18 @@ ALLOWED_HOSTS = ['*']
 
 FORGET_PASSWORD_LINK_TIMEOUT = 30  # minutes
 
+# Max results of patient search
+PATIENT_SEARCH_LIMIT = config('PATIENT_SEARCH_LIMIT', default=50, cast=int)
+# Match patient names by pg_trgm similarity too (PostgreSQL only).
+# Run `CREATE EXTENSION IF NOT EXISTS pg_trgm;` before migrating.
+PATIENT_SEARCH_TRIGRAM = config('PATIENT_SEARCH_TRIGRAM', default=False, cast=bool)
+# Patient phone numbers without '+' or '00' are national numbers of this
+# country, e.g. '604 555 0100' and '1-604-555-0100' are '+1 604 555 0100'.
+# The trunk prefix is what national numbers may start with, '0' in most
+# countries. Changing either requires `python manage.py rebuild_patient_search`.
+PATIENT_PHONE_COUNTRY_CODE = config('PATIENT_PHONE_COUNTRY_CODE', default='1')
+PATIENT_PHONE_TRUNK_PREFIX = config('PATIENT_PHONE_TRUNK_PREFIX', default='1')
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -53,6 +70,10 @@ INSTALLED_APPS = [
     'app.scheduling.leaves',
 ]
 
+if PATIENT_SEARCH_TRIGRAM:
+    # Trigram lookups and indexes
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -77,6 +98,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'core.urls'
 
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -99,6 +122,17 @@ WSGI_APPLICATION = 'core.wsgi.application'
 
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'utils.error_handling.drf_exception.drf_exception_handler',
+    # Wraps API responses into the response envelope while rendering
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.EnvelopeJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Reuses JSON bodies decoded by APIRequestFormatMiddleware
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.PreparsedJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 # Security
@@ -134,14 +168,37 @@ ALLOW_ORIGINS = [config('FRONTEND_URL')]
 
 
 # Database
+
+# Applied on every new SQLite connection by the core.sqlite3 backend.
+# WAL lets readers run while a worker writes, busy_timeout waits for the
+# write lock instead of failing with "database is locked".
+# https://www.sqlite.org/pragma.html
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='WAL'),
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL'),
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),  # milliseconds
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=134217728, cast=int),  # bytes
+    # Negative values are in KiB, positive values in pages
+    'cache_size': config('SQLITE_CACHE_SIZE', default=-20000, cast=int),
+}
+
+
 def get_database():
     if config('DB_HOST', default=None) is None or config('DB_HOST', default=None) == '':
         Path(str(PROJECT_BASE_DIR) +
              "/db").mkdir(parents=True, exist_ok=True)
         return {
             'default': {
-                'ENGINE': 'django.db.backends.sqlite3',
+                'ENGINE': 'core.sqlite3',
                 'NAME': PROJECT_BASE_DIR / 'db' / 'db.sqlite3',
+                'OPTIONS': {
+                    'pragmas': SQLITE_PRAGMAS,
+                },
+                # A file rather than in memory, so that tests of concurrent
+                # requests can run them in threads
+                'TEST': {
+                    'NAME': PROJECT_BASE_DIR / 'db' / 'test_db.sqlite3',
+                },
             }
         }
     else:
@@ -160,14 +217,80 @@ def get_database():
 # If no database is provided, use sqlite3
 DATABASES = {
     'logs_db': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.sqlite3',
         'NAME': PROJECT_BASE_DIR / 'db' / 'logs.sqlite3',
+        'OPTIONS': {
+            'pragmas': SQLITE_PRAGMAS,
+        },
     },
     **get_database()
 }
 
 DATABASE_ROUTERS = ["core.database_router.DatabaseRouter"]
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Local memory cache is per process. When running multiple workers, set
+# CACHE_BACKEND and CACHE_LOCATION to a shared backend, e.g.
+# django.core.cache.backends.redis.RedisCache and redis://127.0.0.1:6379,
+# so that invalidations reach all of them.
+
+CACHE_BACKEND = config(
+    'CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default=''),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+        } if CACHE_BACKEND.endswith('LocMemCache') else {},
+    }
+}
+
+# Cache alias and lifetime (seconds) of authenticated session/token context.
+# Logout, revoke and permission changes only reach other workers through a
+# shared cache. With a per process backend, entries live at most
+# AUTH_CONTEXT_LOCAL_CACHE_TTL seconds instead, 0 disables the cache.
+AUTH_CONTEXT_CACHE = config('AUTH_CONTEXT_CACHE', default='default')
+AUTH_CONTEXT_CACHE_TTL = config('AUTH_CONTEXT_CACHE_TTL', default=300, cast=int)
+AUTH_CONTEXT_LOCAL_CACHE_TTL = config('AUTH_CONTEXT_LOCAL_CACHE_TTL', default=5, cast=int)
+
+# Cache alias and lifetime (seconds) of providers' daily schedules
+SCHEDULE_CACHE = config('SCHEDULE_CACHE', default='default')
+SCHEDULE_CACHE_TTL = config('SCHEDULE_CACHE_TTL', default=300, cast=int)
+# Lifetime (seconds) of providers' compiled availability and break rules,
+# in the SCHEDULE_CACHE. Rules are invalidated when they change.
+RULE_CACHE_TTL = config('RULE_CACHE_TTL', default=3600, cast=int)
+# Invalidations only reach other workers through a shared cache. With a per
+# process backend, schedules and rules live at most SCHEDULE_LOCAL_CACHE_TTL
+# seconds instead, 0 disables their cache.
+SCHEDULE_LOCAL_CACHE_TTL = config('SCHEDULE_LOCAL_CACHE_TTL', default=10, cast=int)
+
+# iCalendar feed of providers, cached in the SCHEDULE_CACHE.
+# Appointments that started more than CALENDAR_FEED_PAST_DAYS ago are left out.
+CALENDAR_FEED_TTL = config('CALENDAR_FEED_TTL', default=900, cast=int)  # seconds
+CALENDAR_FEED_PAST_DAYS = config('CALENDAR_FEED_PAST_DAYS', default=90, cast=int)
+
+# API call logs
+# Logs are written to logs_db in batches by a background thread.
+# Set API_LOG_ASYNC=False to write each log on the request thread.
+
+API_LOG_ASYNC = config('API_LOG_ASYNC', default=True, cast=bool)
+API_LOG_BATCH_SIZE = config('API_LOG_BATCH_SIZE', default=100, cast=int)
+API_LOG_FLUSH_INTERVAL = config('API_LOG_FLUSH_INTERVAL', default=500, cast=int)  # milliseconds
+API_LOG_QUEUE_SIZE = config('API_LOG_QUEUE_SIZE', default=10000, cast=int)
+# Time to wait for room in a full queue before dropping the log
+API_LOG_ENQUEUE_TIMEOUT = config('API_LOG_ENQUEUE_TIMEOUT', default=0, cast=int)  # milliseconds
+# Retries of a batch that failed to be written before its logs are dropped
+API_LOG_WRITE_RETRIES = config('API_LOG_WRITE_RETRIES', default=2, cast=int)
+# Retention, see `python manage.py archive_logs`.
+# Logs are partitioned by 'day' or 'month'. Partitions older than the
+# last API_LOG_RETENTION_KEEP ones are archived to API_LOG_ARCHIVE_DIR.
+API_LOG_RETENTION_PERIOD = config('API_LOG_RETENTION_PERIOD', default='month')
+API_LOG_RETENTION_KEEP = config('API_LOG_RETENTION_KEEP', default=3, cast=int)
+API_LOG_ARCHIVE_DIR = config('API_LOG_ARCHIVE_DIR', default=str(PROJECT_BASE_DIR / 'db' / 'archive'))
+
 # Email
 # https://docs.djangoproject.com/en/5.0/topics/email/
 
@@ -0,0 +1,34 @@
+import re
+from django.db.backends.sqlite3 import base
+
+# Only plain pragma names and values, they are formatted into the statement
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend that applies the pragmas given in the database
+    `OPTIONS['pragmas']` on every new connection.
+    https://www.sqlite.org/pragma.html
+
+    Example:
+        'OPTIONS': {
+            'pragmas': {'journal_mode': 'WAL', 'busy_timeout': 5000},
+        }
+    """
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # Not a sqlite3.connect() argument
+        kwargs.pop('pragmas', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            value = str(value)
+            if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(value):
+                raise ValueError(f'Invalid SQLite pragma: {name} = {value}')
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
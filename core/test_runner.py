@@ -0,0 +1,15 @@
+from importlib import import_module
+from django.test.runner import DiscoverRunner
+from core.settings import ROOT_URLCONF
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Imports the URLconf before creating the test databases. Some models,
+    e.g. patient notes, are only imported through their views and would
+    otherwise have no tables.
+    """
+
+    def setup_databases(self, **kwargs):
+        import_module(ROOT_URLCONF)
+        return super().setup_databases(**kwargs)
@@ -0,0 +1,164 @@
+import io
+import uuid
+import tempfile
+from unittest import mock
+from django.db import connections
+from django.http import JsonResponse
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.settings import ALLOW_ORIGINS, SQLITE_PRAGMAS
+from core.sqlite3.base import DatabaseWrapper
+from .renderers import build_envelope
+from .parsers import PreparsedJSONParser, attach_json_payload, loads
+
+
+class EchoView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response({'detail': 'Not here.'}, status=404)
+
+    def post(self, request):
+        return Response(request.data, status=201)
+
+
+def plain_json(request):
+    return JsonResponse({'plain': True})
+
+
+urlpatterns = [
+    path('api/echo/', EchoView.as_view()),
+    path('api/plain/', plain_json),
+]
+
+
+class BuildEnvelopeTest(SimpleTestCase):
+    def test_success(self):
+        self.assertEqual(build_envelope(201, {'a': 1}, 'log'), dict(
+            success=True, data={'a': 1}, errors=None, status=201, id='log'))
+
+    def test_no_content_is_ok_without_data(self):
+        self.assertEqual(build_envelope(204, {'a': 1}), dict(
+            success=True, data=None, errors=None, status=200))
+
+    def test_client_error(self):
+        self.assertEqual(build_envelope(404, {'detail': 'x'}), dict(
+            success=False, data=None, errors={'detail': 'x'}, status=404))
+
+    def test_server_error(self):
+        self.assertEqual(build_envelope(500, {'detail': 'x'}), dict(
+            success=None, data=None, errors=None, status=500))
+
+
+@override_settings(ROOT_URLCONF='core.tests')
+class ResponseEnvelopeTest(SimpleTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        patcher = mock.patch('logs.middlewares.write_log')
+        self.write_log = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, url):
+        return self.client.get(url, HTTP_ORIGIN=ALLOW_ORIGINS[0])
+
+    def test_drf_response_is_wrapped_while_rendering(self):
+        with mock.patch('core.middlewares.json') as middleware_json:
+            response = self.get('/api/echo/')
+        middleware_json.loads.assert_not_called()
+        body = response.json()
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(body['errors'], {'detail': 'Not here.'})
+        self.assertIs(body['success'], False)
+        # The log is written from the same envelope, with the same id
+        log = self.write_log.call_args.args[0]
+        self.assertEqual(log.id, uuid.UUID(body['id']))
+        self.assertEqual(log.status, 404)
+
+    def test_json_response_is_wrapped_by_middleware(self):
+        response = self.get('/api/plain/')
+        body = response.json()
+        self.assertEqual(body['data'], {'plain': True})
+        self.assertIs(body['success'], True)
+        self.assertEqual(self.write_log.call_args.args[0].id, uuid.UUID(body['id']))
+
+
+@override_settings(ROOT_URLCONF='core.tests')
+class JSONBodyTest(SimpleTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        patcher = mock.patch('logs.middlewares.write_log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, body):
+        return self.client.post('/api/echo/', body, content_type='application/json',
+                                HTTP_ORIGIN=ALLOW_ORIGINS[0])
+
+    def test_body_is_decoded_once(self):
+        with mock.patch('core.middlewares.loads', wraps=loads) as middleware_loads, \
+                mock.patch('core.parsers.loads', wraps=loads) as parser_loads:
+            response = self.post('{"name": "Ada", "tags": [1, 2]}')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['data'], {'name': 'Ada', 'tags': [1, 2]})
+        self.assertEqual(middleware_loads.call_count + parser_loads.call_count, 1)
+
+    def test_invalid_json_is_rejected(self):
+        for body in ('{"name": ', '{"value": NaN}'):
+            response = self.post(body)
+            self.assertEqual(response.status_code, 400)
+            # Returned before the envelope middleware, as the error itself
+            self.assertEqual(response.json()['title'], 'Invalid data provided')
+
+
+class PreparsedJSONParserTest(SimpleTestCase):
+    def parse(self, body, payload=None):
+        request = mock.Mock(spec=[])
+        if payload is not None:
+            attach_json_payload(request, payload)
+        return PreparsedJSONParser().parse(io.BytesIO(body), parser_context=dict(request=request))
+
+    def test_reuses_decoded_payload(self):
+        self.assertEqual(self.parse(b'not read', payload={'a': 1}), {'a': 1})
+
+    def test_parses_when_not_decoded(self):
+        self.assertEqual(self.parse(b'{"a": [1, 2]}'), {'a': [1, 2]})
+
+    def test_invalid_json(self):
+        for body in (b'{"a": ', b'{"a": Infinity}'):
+            with self.assertRaises(ParseError):
+                self.parse(body)
+
+
+class SQLitePragmasTest(SimpleTestCase):
+    def connect(self, pragmas):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = DatabaseWrapper({
+            **connections['logs_db'].settings_dict,
+            'NAME': f'{directory.name}/test.sqlite3',
+            'OPTIONS': {'pragmas': pragmas},
+        })
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper.connection
+
+    def pragma(self, connection, name):
+        return connection.execute(f'PRAGMA {name}').fetchone()[0]
+
+    def test_pragmas_are_applied_on_connect(self):
+        connection = self.connect(SQLITE_PRAGMAS)
+        self.assertEqual(self.pragma(connection, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(connection, 'busy_timeout'), SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma(connection, 'cache_size'), SQLITE_PRAGMAS['cache_size'])
+
+    def test_invalid_pragmas_are_rejected(self):
+        for pragmas in ({'journal_mode': 'WAL; DROP TABLE x'}, {'Journal-Mode': 'WAL'}):
+            with self.assertRaises(ValueError):
+                self.connect(pragmas)
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
+from app.scheduling.views import calendar_feed
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,4 +11,6 @@ urlpatterns = [
     path('api/patients/', include('app.patients.urls')),
     path('api/scheduling/',
          include('app.scheduling.urls')),
+    # iCalendar feeds, for calendar apps
+    path('calendar/<str:token>.ics', calendar_feed, name='calendar_feed'),
 ]
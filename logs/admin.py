@@ -58,16 +58,16 @@ class SessionTypeFilter(admin.SimpleListFilter):
 
 class ApiCallLogAdmin(admin.ModelAdmin):
     list_display = ('url', 'user_email', 'status', 'ip', 'created_at')
-    search_fields = ['id', 'session', 'app_token', 'url', 'ip']
+    search_fields = ['id', 'session', 'app_token', 'user_email', 'url', 'ip']
     list_filter = (IsAuthFilter, IsSuccessFilter,
                    SessionTypeFilter, 'created_at')
-    search_help_text = 'Search with id, URL and session id, token id, or IP address.'
+    search_help_text = 'Search with id, URL and session id, token id, user email, or IP address.'
     list_per_page = 50
     ordering = ('-created_at',)
     save_on_top = False
     save_as = False
     readonly_fields = ['id', 'url', 'context', 'session', 'ip', 'ua',
-                       'app_token', 'status', 'created_at']
+                       'app_token', 'user_id', 'user_email', 'status', 'created_at']
 
     def has_delete_permission(self, request, obj=None):
         return False
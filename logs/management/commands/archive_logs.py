@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.settings import API_LOG_RETENTION_PERIOD, API_LOG_RETENTION_KEEP, API_LOG_ARCHIVE_DIR
+from logs.retention import PERIODS, expired_partitions, archive_partition, drop_archived, vacuum
+
+
+class Command(BaseCommand):
+    help = 'Archive API call logs older than the retained partitions to compressed JSONL files and delete them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=PERIODS, default=API_LOG_RETENTION_PERIOD,
+                            help='Partition logs by day or month.')
+        parser.add_argument('--keep', type=int, default=API_LOG_RETENTION_KEEP,
+                            help='Number of most recent partitions to keep, including the current one.')
+        parser.add_argument('--output', default=str(API_LOG_ARCHIVE_DIR),
+                            help='Directory of archive files.')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows read or deleted per query.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the partitions that would be archived.')
+        parser.add_argument('--no-delete', action='store_true',
+                            help='Archive partitions without deleting them.')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Reclaim the space of deleted logs (SQLite only).')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['keep'] < 1:
+            raise CommandError('--keep must be at least 1.')
+        partitions = expired_partitions(kwargs['period'], kwargs['keep'])
+        if not partitions:
+            self.stdout.write('No partitions to archive.')
+            return
+        deleted = 0
+        for partition in partitions:
+            if kwargs['dry_run']:
+                self.stdout.write(
+                    f'{partition}: {partition.queryset().count()} logs')
+                continue
+            path, count = archive_partition(
+                partition, kwargs['output'], kwargs['batch_size'])
+            self.stdout.write(f'{partition}: archived {count} logs to {path}')
+            if not kwargs['no_delete']:
+                deleted += drop_archived(path, kwargs['batch_size'])
+        if kwargs['dry_run']:
+            return
+        if kwargs['vacuum'] and deleted:
+            vacuum()
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully archived {len(partitions)} partitions, deleted {deleted} logs.'))
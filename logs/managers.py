@@ -8,18 +8,48 @@ class LogManager(models.Manager):
     def __init__(self):
         super().__init__()
 
-    def create_log(self, request, response):
+    def create_log(self, request, response, log_id=None, user=None):
         """Create a Log entry in the database
 
         Args:
             request: HTTP request object
             response (dict): Response in format of LogResponse.serialize()
+            log_id (uuid, optional): Pre-generated id of the log. Defaults to a new id.
             user (User, optional): User who is performing the action. Defaults to logged-in user or None.
         """
+        log = self.build_log(request, response, log_id, user)
+        log.save()
+        return log
+
+    def build_log(self, request, response, log_id=None, user=None):
+        """Build a Log entry from the request without saving it.
+        Everything that reads the request happens here, so the entry
+        can be written later by `logs.writer`.
+
+        Args:
+            request: HTTP request object
+            response (dict): Response in format of LogResponse.serialize()
+            log_id (uuid, optional): Pre-generated id of the log. Defaults to a new id.
+            user (User, optional): User who is performing the action. Defaults to logged-in user or None.
+
+        Returns:
+            ApiCallLog: Unsaved log entry
+        """
         status = response['s']
         response.pop('s', None)
         session = get_active_session(request)
         app_token = get_active_token(request)
+        if user is None:
+            # Already loaded by the session/app token middleware
+            if session is not None:
+                user = session.user
+            elif app_token is not None:
+                user = app_token.user
+        if user is not None:
+            user_id, user_email = user.id, user.email
+        else:
+            # Login and signup responses carry the user email
+            user_id, user_email = None, getContextUserEmail(response)
         log = self.model(
             url=request.get_full_path(),
             status=status,
@@ -27,10 +57,13 @@ class LogManager(models.Manager):
                 response, 'm') else response),
             session=session.id if session is not None else None,
             app_token=app_token.id if app_token is not None else None,
+            user_id=user_id,
+            user_email=user_email,
             ip=getClientIP(request),
             ua=getUserAgent(request)
         )
-        log.save()
+        if log_id is not None:
+            log.id = log_id
         return log
 
 
@@ -47,3 +80,12 @@ def getClientIP(request):
 # Get User Agent
 def getUserAgent(request):
     return request.META.get('HTTP_USER_AGENT')
+
+
+# Get user email that APILogMiddleware puts in the context
+# of login and sign up requests
+def getContextUserEmail(response):
+    message = response.get('m')
+    if isinstance(message, dict) and isinstance(message.get('user'), str):
+        return message['user']
+    return None
@@ -1,6 +1,8 @@
-import json
+import uuid
+from core.renderers import REQUEST_LOG_ID_FIELD, get_envelope
 from .models import ApiCallLog
 from .log_response import LogResponse
+from .writer import write_log
 
 
 class APILogMiddleware:
@@ -10,6 +12,11 @@ class APILogMiddleware:
     def __call__(self, request):
         # Code to be executed for each request before
         # the view (and later middleware) are called.
+
+        # Pre-generate the log id so that the response envelope
+        # can carry it without editing the rendered body
+        log_id = uuid.uuid4()
+        setattr(request, REQUEST_LOG_ID_FIELD, log_id)
         response = self.get_response(request)
         # Code to be executed for each request/response after
         # the view is called.
@@ -17,47 +24,37 @@ class APILogMiddleware:
         # Don't run on non-API requests
         if not request.path.startswith('/api'):
             return response
-        # Create log
-        try:
-            content = json.loads(response.content.decode('utf8'))
-        except json.JSONDecodeError:
-            # If response is not JSON or empty
-            content = dict()
+        # Create log from the envelope built by the renderer or
+        # FormulateResponseMiddleware. Non JSON responses have none.
+        content = get_envelope(request) or dict()
         if response.status_code > 399:
-            if 'errors' in content:
-                if 'instance' in content['errors']:
+            if content.get('errors') is not None:
+                errors = content['errors']
+                if isinstance(errors, dict):
                     # Omit instance as it is from ErrorMessage class
                     # instance also carries the URL that caused the error
                     # but this information is already in model's URL column
-                    content['errors'].pop('instance')
-                if 'status' in content['errors']:
                     # Omit status as it is already in model's status column
-                    content['errors'].pop('status')
+                    errors = {key: value for key, value in errors.items()
+                              if key not in ('instance', 'status')}
                 log = LogResponse(status=response.status_code,
-                                  message=content['errors'])
+                                  message=errors)
             else:
                 log = LogResponse(status=response.status_code)
         else:
-            # check if content has key 'session_id', that means this
+            # check if content has key 'user', that means this
             # response is from login or signup API
-            if 'data' in content and content['data'] is not None and 'user' in content['data']:
+            data = content.get('data')
+            if isinstance(data, dict) and 'user' in data:
                 log = LogResponse(status=response.status_code, message=dict(
-                    user=content['data']['user']['email']))
+                    user=data['user']['email']))
             else:
                 log = LogResponse(status=response.status_code)
-        log_obj = ApiCallLog.objects.create_log(
+        # Written later by the buffered log writer
+        write_log(ApiCallLog.objects.build_log(
             request=request,
             response=log.serialize(),
-        )
-        # check if response has key 'instance', 'status' and 'code'
-        # to see if it is an error response. If it is, then set 'code'
-        # as log_id
-        if "Content-Type" in response.headers and response.headers["Content-Type"] in ['application/json', 'application/problem+json']:
-            try:
-                r = json.loads(response.content.decode('utf8'))
-                r['id'] = str(log_obj.id)
-                response.content = json.dumps(r)
-            except json.JSONDecodeError as e:
-                pass
+            log_id=log_id,
+        ))
         # Return response
         return response
@@ -1,10 +1,7 @@
 import uuid
-import json
 from django.db import models
 from django.utils.timezone import now
 from .managers import LogManager
-from users.users_app_tokens.api import get_user as get_user_from_app_token
-from users.users_sessions.api import get_user as get_user_from_session
 
 
 class ApiCallLog(models.Model):
@@ -20,6 +17,11 @@ class ApiCallLog(models.Model):
     # 'context' column will have 'user' key.
     session = models.UUIDField(null=True, blank=True)
     app_token = models.UUIDField(null=True, blank=True)
+    # User who made the request, captured when the log is built so
+    # that listing logs does not look up sessions or tokens.
+    # For login and signup, only 'user_email' is known.
+    user_id = models.UUIDField(null=True, blank=True)
+    user_email = models.EmailField(null=True, blank=True)
     status = models.IntegerField()
     ip = models.GenericIPAddressField(null=True, blank=True)
     ua = models.TextField(null=True, blank=True)
@@ -31,24 +33,15 @@ class ApiCallLog(models.Model):
         verbose_name = 'API Call Log'
         verbose_name_plural = 'API Call Logs'
         ordering = ('-created_at',)
-
-    @property
-    def user_email(self):
-        if self.app_token:
-            user = get_user_from_app_token(self.app_token)
-            if user:
-                return user.email
-        elif self.session:
-            user = get_user_from_session(self.session)
-            if user:
-                return user.email
-        else:
-            context = json.loads(self.context)
-            if 'm' in context and 'user' in context['m']:
-                """This only works for login and sign up requests as the APILogMiddleware
-                the user object and store it in log context"""
-                return context['m']['user']
-        return None
+        indexes = [
+            # Partition range scans of the retention engine
+            models.Index(fields=['created_at'], name='log_created_at_idx'),
+            # Admin filters, each combined with the default ordering
+            models.Index(fields=['status', '-created_at'], name='log_status_idx'),
+            models.Index(fields=['session', '-created_at'], name='log_session_idx'),
+            models.Index(fields=['app_token', '-created_at'], name='log_app_token_idx'),
+            models.Index(fields=['user_id', '-created_at'], name='log_user_idx'),
+        ]
 
     def __str__(self):
         return 'ID: ' + str(self.pk)
@@ -0,0 +1,193 @@
+import os
+import gzip
+import json
+from datetime import datetime, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router
+from django.utils import timezone
+from .models import ApiCallLog
+
+##########################################################
+#
+#                   API call log retention
+#
+# Logs are grouped into time partitions (a day or a month
+# of `created_at`). Partitions older than the retained
+# ones are archived to gzip compressed JSON Lines files,
+# one file per partition, and then deleted from logs_db.
+#
+# Only the logs read back from an archive are deleted.
+# The writer may still insert logs into an archived
+# partition, those are archived by the next run.
+#
+# Use `python manage.py archive_logs`.
+#
+##########################################################
+
+DAY = 'day'
+MONTH = 'month'
+PERIODS = (DAY, MONTH)
+
+# Columns written to the archive, in order
+ARCHIVE_FIELDS = ('id', 'url', 'context', 'session', 'app_token', 'user_id',
+                  'user_email', 'status', 'ip', 'ua', 'created_at')
+
+
+def partition_start(moment, period):
+    """Get the start of the partition that contains `moment`"""
+    moment = timezone.localtime(moment)
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == MONTH:
+        start = start.replace(day=1)
+    return start
+
+
+def next_partition(start, period):
+    """Get the start of the partition following the one starting at `start`"""
+    if period == DAY:
+        following = start.replace(tzinfo=None) + timedelta(days=1)
+    elif start.month == 12:
+        following = start.replace(tzinfo=None, year=start.year + 1, month=1)
+    else:
+        following = start.replace(tzinfo=None, month=start.month + 1)
+    return timezone.make_aware(following)
+
+
+def previous_partition(start, period):
+    """Get the start of the partition preceding the one starting at `start`"""
+    if period == DAY:
+        return timezone.make_aware(start.replace(tzinfo=None) - timedelta(days=1))
+    return partition_start(start - timedelta(days=1), MONTH)
+
+
+def partition_label(start, period):
+    return start.strftime('%Y-%m-%d' if period == DAY else '%Y-%m')
+
+
+class Partition:
+    def __init__(self, start, period):
+        self.period = period
+        self.start = start
+        self.end = next_partition(start, period)
+        self.label = partition_label(start, period)
+
+    def queryset(self):
+        return ApiCallLog.objects.filter(created_at__gte=self.start,
+                                         created_at__lt=self.end)
+
+    def __str__(self):
+        return self.label
+
+
+def expired_partitions(period=MONTH, keep=3, now=None):
+    """List partitions older than the `keep` most recent ones.
+    The current partition counts as one of the kept partitions.
+
+    Args:
+        period (str): `DAY` or `MONTH`
+        keep (int): Number of partitions to keep, at least 1
+        now (datetime, optional): Defaults to current time
+
+    Returns:
+        list[Partition]: Oldest first, only partitions with logs
+    """
+    if period not in PERIODS:
+        raise ValueError(f'Unknown partition period: {period}')
+    cutoff = partition_start(now or timezone.now(), period)
+    for _ in range(max(1, keep) - 1):
+        cutoff = previous_partition(cutoff, period)
+    # Only partitions that have rows
+    starts = ApiCallLog.objects.filter(created_at__lt=cutoff) \
+        .dates('created_at', period, order='ASC')
+    partitions = []
+    for day in starts:
+        start = partition_start(timezone.make_aware(
+            datetime(day.year, day.month, day.day)), period)
+        partitions.append(Partition(start, period))
+    return partitions
+
+
+def archive_path(directory, partition):
+    """Get a file path for the partition archive that does not exist yet"""
+    name = f'api_call_logs_{partition.label}'
+    path = os.path.join(directory, f'{name}.jsonl.gz')
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f'{name}.{suffix}.jsonl.gz')
+        suffix += 1
+    return path
+
+
+def archive_partition(partition, directory, batch_size=2000):
+    """Write every log of the partition to a compressed JSON Lines file
+
+    Args:
+        partition (Partition): Partition to archive
+        directory (str): Directory of archive files, created if needed
+        batch_size (int, optional): Rows fetched per query
+
+    Returns:
+        tuple: (path, number of archived logs)
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = archive_path(directory, partition)
+    temp_path = path + '.part'
+    count = 0
+    rows = partition.queryset().order_by('created_at') \
+        .values(*ARCHIVE_FIELDS).iterator(chunk_size=batch_size)
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as archive:
+        for row in rows:
+            archive.write(json.dumps(row, cls=DjangoJSONEncoder))
+            archive.write('\n')
+            count += 1
+    # Only complete archives get the final name
+    os.replace(temp_path, path)
+    return path, count
+
+
+def archived_ids(path, batch_size=2000):
+    """Read the ids of an archive file in batches
+
+    Args:
+        path (str): Archive written by `archive_partition`
+        batch_size (int, optional): Ids per batch
+
+    Yields:
+        list[str]: Ids of archived logs
+    """
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            batch.append(json.loads(line)['id'])
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def drop_archived(path, batch_size=2000):
+    """Delete the logs of an archive file in batches, so the
+    write lock is held briefly and request logging can continue.
+
+    Args:
+        path (str): Archive written by `archive_partition`
+        batch_size (int, optional): Rows deleted per query
+
+    Returns:
+        int: Number of deleted logs
+    """
+    deleted = 0
+    for ids in archived_ids(path, batch_size):
+        count, _ = ApiCallLog.objects.filter(id__in=ids).delete()
+        deleted += count
+    return deleted
+
+
+def vacuum():
+    """Give the space of deleted logs back to the file system (SQLite only)"""
+    connection = connections[router.db_for_write(ApiCallLog)]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
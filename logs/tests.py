@@ -0,0 +1,137 @@
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from .models import ApiCallLog
+from . import retention
+from .retention import DAY, MONTH, Partition
+from .writer import ApiCallLogWriter
+
+
+def aware(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class PartitionTest(SimpleTestCase):
+    def test_partition_bounds(self):
+        self.assertEqual(retention.partition_start(aware(2024, 3, 15, 13, 30), DAY), aware(2024, 3, 15))
+        self.assertEqual(retention.partition_start(aware(2024, 3, 15, 13, 30), MONTH), aware(2024, 3, 1))
+        self.assertEqual(retention.next_partition(aware(2024, 12, 1), MONTH), aware(2025, 1, 1))
+        self.assertEqual(retention.next_partition(aware(2024, 2, 29), DAY), aware(2024, 3, 1))
+        self.assertEqual(retention.previous_partition(aware(2024, 1, 1), MONTH), aware(2023, 12, 1))
+        self.assertEqual(str(Partition(aware(2024, 3, 1), MONTH)), '2024-03')
+
+
+class RetentionTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def log(self, *created_at):
+        return ApiCallLog.objects.create(url='/api/', status=200, created_at=aware(*created_at))
+
+    def read(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            return [json.loads(line) for line in archive]
+
+    def test_expired_partitions(self):
+        for month in (1, 2, 4, 5):
+            self.log(2024, month, 10)
+        partitions = retention.expired_partitions(MONTH, keep=3, now=aware(2024, 5, 20))
+        self.assertEqual([str(partition) for partition in partitions], ['2024-01', '2024-02'])
+        with self.assertRaises(ValueError):
+            retention.expired_partitions('year')
+
+    def test_archive_and_drop_only_archived_logs(self):
+        archived = [self.log(2024, 1, 10, hour) for hour in range(5)]
+        partition = Partition(aware(2024, 1, 1), MONTH)
+        path, count = retention.archive_partition(partition, self.directory, batch_size=2)
+        self.assertEqual(count, 5)
+        self.assertEqual([row['id'] for row in self.read(path)], [str(log.id) for log in archived])
+        self.assertFalse(os.path.exists(path + '.part'))
+        # Written by the async writer after the archive
+        late = self.log(2024, 1, 10, 2, 30)
+        self.assertEqual(retention.drop_archived(path, batch_size=2), 5)
+        self.assertEqual(list(partition.queryset()), [late])
+        # The next run archives it to a new file
+        path_again, count = retention.archive_partition(partition, self.directory)
+        self.assertEqual((os.path.basename(path_again), count), ('api_call_logs_2024-01.1.jsonl.gz', 1))
+
+    def test_archive_logs_command(self):
+        self.log(2024, 1, 10)
+        current = ApiCallLog.objects.create(url='/api/', status=200)
+        out = StringIO()
+        call_command('archive_logs', period=MONTH, keep=1, output=self.directory, stdout=out)
+        self.assertIn('deleted 1 logs', out.getvalue())
+        self.assertEqual(list(ApiCallLog.objects.all()), [current])
+        self.assertEqual(os.listdir(self.directory), ['api_call_logs_2024-01.jsonl.gz'])
+
+
+class WriterTest(SimpleTestCase):
+    """Writes are recorded instead of reaching logs_db"""
+
+    def setUp(self):
+        self.batches = []
+        patcher = mock.patch.object(ApiCallLog.objects, 'bulk_create',
+                                    side_effect=lambda batch: self.batches.append(list(batch)))
+        self.bulk_create = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def writer(self, batch_size=3, flush_interval=50, queue_size=100, enqueue_timeout=0, **kwargs):
+        writer = ApiCallLogWriter(batch_size, flush_interval, queue_size, enqueue_timeout, **kwargs)
+        self.addCleanup(writer.shutdown)
+        return writer
+
+    def test_batches(self):
+        writer = self.writer()
+        logs = [object() for _ in range(7)]
+        for log in logs:
+            self.assertTrue(writer.enqueue(log))
+        writer.flush(timeout=5)
+        self.assertEqual([log for batch in self.batches for log in batch], logs)
+        self.assertLessEqual(max(len(batch) for batch in self.batches), 3)
+        self.assertEqual(writer.stats(), dict(enqueued=7, written=7, dropped=0, failed=0, pending=0))
+
+    def test_full_queue_drops(self):
+        writer = self.writer(queue_size=2)
+        # No background thread, the queue only fills up
+        with mock.patch.object(writer, '_ensure_started'):
+            self.assertEqual([writer.enqueue(object()) for _ in range(3)], [True, True, False])
+        self.assertEqual(writer.stats(), dict(enqueued=2, written=0, dropped=1, failed=0, pending=2))
+        # Without a thread, flush writes on the caller thread
+        writer.flush()
+        self.assertEqual(writer.stats()['written'], 2)
+
+    def test_failed_write_is_retried_then_dropped(self):
+        writer = self.writer(write_retries=1)
+        writer.RETRY_DELAY = 0
+        self.bulk_create.side_effect = [Exception('database is locked'), None]
+        with mock.patch.object(writer, '_ensure_started'):
+            writer.enqueue(object())
+            writer.enqueue(object())
+        with self.assertLogs('logs.writer', 'ERROR'):
+            writer.flush()
+            self.bulk_create.side_effect = Exception('database is locked')
+            with mock.patch.object(writer, '_ensure_started'):
+                writer.enqueue(object())
+            writer.flush()
+        self.assertEqual(writer.stats(), dict(enqueued=3, written=2, dropped=1, failed=3, pending=0))
+
+    def test_shutdown_writes_pending_logs(self):
+        writer = self.writer(batch_size=100, flush_interval=200)
+        logs = [object() for _ in range(3)]
+        for log in logs:
+            writer.enqueue(log)
+        writer.shutdown(timeout=5)
+        self.assertIsNone(writer._thread)
+        self.assertEqual([log for batch in self.batches for log in batch], logs)
+        self.assertEqual(writer.stats()['pending'], 0)
@@ -0,0 +1,225 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from django.db import close_old_connections
+from core.settings import (
+    API_LOG_ASYNC,
+    API_LOG_BATCH_SIZE,
+    API_LOG_FLUSH_INTERVAL,
+    API_LOG_QUEUE_SIZE,
+    API_LOG_ENQUEUE_TIMEOUT,
+    API_LOG_WRITE_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+##########################################################
+#
+#                 Buffered API call log writer
+#
+# Log entries are built on the request thread and put on
+# an in-process queue. A background thread writes them to
+# logs_db with `bulk_create`, every `API_LOG_BATCH_SIZE`
+# entries or `API_LOG_FLUSH_INTERVAL` milliseconds,
+# whichever comes first. Requests no longer wait on the
+# SQLite write lock.
+#
+# When the queue is full, `enqueue` waits up to
+# `API_LOG_ENQUEUE_TIMEOUT` milliseconds and then drops
+# the entry. A batch that fails to be written, e.g. on
+# a locked database, is retried `API_LOG_WRITE_RETRIES`
+# times and then dropped. Drops and failed writes are
+# counted, see `stats()`. Pending entries are flushed on
+# shutdown.
+#
+##########################################################
+
+
+class ApiCallLogWriter:
+    # Seconds before the first retry of a failed write, doubled for each next one
+    RETRY_DELAY = 0.1
+
+    def __init__(self, batch_size, flush_interval, queue_size, enqueue_timeout, write_retries=0):
+        """
+        Args:
+            batch_size (int): Entries written per `bulk_create`
+            flush_interval (int): Max milliseconds an entry waits in the queue
+            queue_size (int): Max entries waiting to be written
+            enqueue_timeout (int): Milliseconds to wait for room in a full queue
+            write_retries (int, optional): Retries of a failed `bulk_create` before the batch is dropped
+        """
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval / 1000
+        self.enqueue_timeout = enqueue_timeout / 1000
+        self.write_retries = max(0, write_retries)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._counters = dict(enqueued=0, written=0, dropped=0, failed=0)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def stats(self):
+        """Get writer counters
+
+        Returns:
+            dict: `enqueued`, `written`, `dropped` (queue full or write
+                failed after retries), `failed` (failed `bulk_create` calls)
+                and `pending`
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        counters['pending'] = self._queue.qsize()
+        return counters
+
+    def _ensure_started(self):
+        # Start lazily and again after a fork, as threads
+        # do not survive in the child process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='api-log-writer', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, log):
+        """Queue an unsaved ApiCallLog to be written
+
+        Args:
+            log (ApiCallLog): Entry built with `ApiCallLog.objects.build_log`
+
+        Returns:
+            bool: False if the entry was dropped
+        """
+        self._ensure_started()
+        try:
+            if self.enqueue_timeout > 0:
+                self._queue.put(log, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(log)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _take_batch(self, timeout):
+        # Wait for the first entry, then collect more until the batch
+        # is full or the first entry has waited `flush_interval`
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and not self._stopping.is_set():
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        from .models import ApiCallLog
+        try:
+            for attempt in range(self.write_retries + 1):
+                try:
+                    # Atomic, a failed batch wrote nothing and can be retried
+                    ApiCallLog.objects.bulk_create(batch)
+                    self._count('written', len(batch))
+                    return
+                except Exception:
+                    self._count('failed')
+                    if attempt == self.write_retries:
+                        self._count('dropped', len(batch))
+                        logger.exception('Failed to write %d API call logs, dropped them', len(batch))
+                        return
+                    # Reconnect if the connection is broken
+                    close_old_connections()
+                    time.sleep(self.RETRY_DELAY * 2 ** attempt)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._write(self._take_batch(self.flush_interval))
+            close_old_connections()
+        self._drain()
+
+    def _drain(self):
+        while True:
+            batch = self._take_batch(0)
+            if not batch:
+                return
+            self._write(batch)
+
+    def flush(self, timeout=None):
+        """Block until every queued entry is written
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to no limit.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            # No writer in this process, write on the caller thread
+            self._drain()
+            return
+        with self._queue.all_tasks_done:
+            self._queue.all_tasks_done.wait_for(
+                lambda: self._queue.unfinished_tasks == 0, timeout)
+
+    def shutdown(self, timeout=5):
+        """Stop the background thread after writing pending entries
+
+        Args:
+            timeout (float, optional): Seconds to wait for the thread
+        """
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+
+
+writer = ApiCallLogWriter(
+    batch_size=API_LOG_BATCH_SIZE,
+    flush_interval=API_LOG_FLUSH_INTERVAL,
+    queue_size=API_LOG_QUEUE_SIZE,
+    enqueue_timeout=API_LOG_ENQUEUE_TIMEOUT,
+    write_retries=API_LOG_WRITE_RETRIES,
+)
+
+atexit.register(writer.shutdown)
+
+
+def write_log(log):
+    """Write an unsaved ApiCallLog, through the buffered writer
+    unless `API_LOG_ASYNC` is disabled.
+
+    Args:
+        log (ApiCallLog): Entry built with `ApiCallLog.objects.build_log`
+    """
+    if not API_LOG_ASYNC:
+        log.save()
+        return
+    writer.enqueue(log)
@@ -3,6 +3,12 @@ from users.api import add_user
 from roles.api import assign_permission_to_user
 from roles.base_permissions import base_permission
 
+# Attribute on the User object that memoizes its organization. The auth
+# middlewares set it from the auth context, so repeated `get_user_org`
+# calls for the request user do not query the database.
+USER_ORG_FIELD = '_active_organization'
+_NOT_RESOLVED = object()
+
 
 def new_organization(user_email, user_password, user_first_name, user_last_name):
     """
@@ -39,12 +45,29 @@ def get_user_org(user):
 
     Returns: Organization or None
     """
+    organization = getattr(user, USER_ORG_FIELD, _NOT_RESOLVED)
+    if organization is not _NOT_RESOLVED:
+        return organization
     try:
         org_user = OrgUser.objects.select_related(
             'organization').get(user=user)
-        return org_user.organization
+        organization = org_user.organization
     except OrgUser.DoesNotExist:
-        return None
+        organization = None
+    attach_user_org(user, organization)
+    return organization
+
+
+def attach_user_org(user, organization):
+    """
+    Memoize user's organization on the User object
+
+    Args:
+        user (User): User object
+        organization (Organization): Organization object or None
+    """
+    if user is not None:
+        setattr(user, USER_ORG_FIELD, organization)
 
 
 def get_org_user(user, organization):
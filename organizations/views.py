@@ -7,6 +7,7 @@ from rest_framework.views import APIView
 from users.permissions import HasSessionOrTokenActive
 from users.api import get_request_user
 from users.serializers import UserSerializer
+from users.users_utils.auth_cache import invalidate_user_auth_context
 from utils.error_handling.error_message import ErrorMessage
 from roles.permissions import HasPermission
 from roles.base_permissions import UPDATE_ORGANIZATION, READ_ALL_USERS, UPDATE_USER_PROFILE
@@ -174,6 +175,7 @@ def update_org_user_profile(request, user_id):
             org_user.user, data=data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            invalidate_user_auth_context(org_user.user)
             return Response(serializer.data, status=200)
         return ErrorMessage(
             title='Invalid User Profile Update',
@@ -10,7 +10,7 @@ from users.models import UserPasswordChange
 from utils.error_handling.error_message import ErrorMessage
 from roles.permissions import HasPermission
 from roles.base_permissions import READ_ALL_USERS, CREATE_NEW_USER, UPDATE_USER_PASSWORD, UPDATE_USER_MFA, DISABLE_USER, ENABLE_USER
-from roles.api import get_user_role, get_user_permissions
+from roles.api import resolve_user_permissions
 from .api import get_user_org, get_org_user_from_id
 from .models import OrgUser
 
@@ -78,11 +78,12 @@ class OrgUserView(APIView):
             org_user = OrgUser.objects.select_related('user', 'user__created_by', 'user__updated_by').get(
                 user_id=user_id, organization=organization)
             pswd_change_row = get_user_password_change(org_user.user)
+            role, permissions = resolve_user_permissions(org_user.user)
             return Response(
                 dict(
                     user=UserSerializer(org_user.user).data,
-                    role=get_user_role(org_user.user),
-                    permissions=get_user_permissions(org_user.user),
+                    role=role,
+                    permissions=permissions,
                     created_by=UserSerializer(
                         org_user.user.created_by).data if org_user.user.created_by else None,
                     updated_by=UserSerializer(
@@ -1,7 +1,8 @@
 from django.db.models import Q
 from .models import Role, Permission, UserRole, UserPermission
 from .base_permissions import base_permission
-from .serializers import RoleSerializer, PermissionSerializer
+from .permission_registry import compile_permission_mask
+from users.users_utils.auth_cache import invalidate_user_auth_context, flatten_permission_ids
 
 
 def assign_role_to_user(user, role_id):
@@ -12,6 +13,7 @@ def assign_role_to_user(user, role_id):
     role = Role.objects.get(id=role_id)
     user_role = UserRole(user=user, role=role)
     user_role.save()
+    invalidate_user_auth_context(user)
     return user_role
 
 
@@ -25,42 +27,70 @@ def assign_permission_to_user(user, permission_id):
     permission = Permission.objects.get(id=permission_id)
     user_permission = UserPermission(user=user, permission=permission)
     user_permission.save()
+    invalidate_user_auth_context(user)
     return user_permission
 
 
 def get_user_role(user):
     if user is None:
         raise ValueError('User is required')
-    try:
-        user_role = UserRole.objects.select_related(
-            'role').get(user=user)
-        role_serializer = RoleSerializer(user_role.role)
-        return role_serializer.data
-    except UserRole.DoesNotExist:
-        return None
+    return _query_user_role(user)
 
 
 def get_user_permissions(user):
     """Returns a list of permissions for a user as Python object
 
     Args:
-        user (_type_): _description_
+        user (User): User object
 
     Raises:
-        ValueError: _description_
+        ValueError: If user is not provided
 
     Return Example: `[{id: 1, name: 'permission1'}, {id: 2, name: 'permission2'}]`
     """
     if user is None:
         raise ValueError('User is required')
-    permissions = []
-    # Check for explicit permissions
-    user_permissions = UserPermission.objects.select_related('permission').filter(
-        user=user)
-    for user_permission in user_permissions:
-        permissions.append(PermissionSerializer(
-            user_permission.permission).data)
-    return permissions
+    return _query_user_permissions(user)
+
+
+def resolve_user_permissions(user):
+    """Returns the role and explicit permissions of a user in two queries.
+    Use this instead of calling `get_user_role` and `get_user_permissions`
+    separately.
+
+    Args:
+        user (User): User object
+
+    Raises:
+        ValueError: If user is not provided
+
+    Returns: tuple[role, permissions]
+        role: dict or None, e.g. `{id: 1, name: 'Admin', permissions: ['read:all_users']}`
+        permissions: list, e.g. `[{id: 'update:organization', name: 'Update Organization Details'}]`
+    """
+    if user is None:
+        raise ValueError('User is required')
+    return _query_user_role(user), _query_user_permissions(user)
+
+
+def _query_user_role(user):
+    # One row per permission of the role (or a single row with
+    # `None` permission if the role has no permissions)
+    rows = UserRole.objects.filter(user=user).values_list(
+        'role_id', 'role__name', 'role__permissions')
+    role = None
+    for role_id, role_name, permission_id in rows:
+        if role is None:
+            role = dict(id=role_id, name=role_name, permissions=[])
+        if permission_id is not None:
+            role['permissions'].append(permission_id)
+    return role
+
+
+def _query_user_permissions(user):
+    rows = UserPermission.objects.filter(user=user).values_list(
+        'permission_id', 'permission__name')
+    return [dict(id=permission_id, name=name) for permission_id, name in rows]
 
 
 def check_user_for_permission(user, permission_id):
@@ -70,21 +100,12 @@ def check_user_for_permission(user, permission_id):
         raise ValueError('Permission ID is required')
     if isinstance(permission_id, dict):
         permission_id = permission_id['id']
-    # Check if user has full access or has explicit permission
-    if UserPermission.objects.filter(Q(user=user), Q(permission_id=base_permission['FULL_ACCESS']['id']) | Q(permission_id=permission_id)).exists():
-        return True
-    # Check for role permission
-    try:
-        user_role = UserRole.objects.select_related(
-            'role').get(user=user)
-        if user_role:
-            # Check if role has full access or has explicit permission
-            if user_role.role.permissions.filter(Q(id=base_permission['FULL_ACCESS']['id']) | Q(id=permission_id)).exists():
-                return True
-    except UserRole.DoesNotExist:
-        pass
-    # No permission found
-    return False
+    # Check if user has full access or the permission, either
+    # explicitly or through their role
+    return Permission.objects.filter(
+        Q(id__in=[base_permission['FULL_ACCESS']['id'], permission_id]),
+        Q(userpermission__user=user) | Q(role__userrole__user=user)
+    ).exists()
 
 
 def has_full_access(user):
@@ -99,3 +120,15 @@ def get_active_user_permissions(request):
 
 def get_active_user_role(request):
     return getattr(request, 'active_user_role', None)
+
+
+def get_active_user_permission_mask(request):
+    """Returns the bitmask of the active user's effective permissions
+    (role and explicit permissions). Compiled once per request.
+    """
+    mask = getattr(request, 'active_user_permission_mask', None)
+    if mask is None:
+        mask = compile_permission_mask(flatten_permission_ids(
+            get_active_user_role(request), get_active_user_permissions(request)))
+        request.active_user_permission_mask = mask
+    return mask
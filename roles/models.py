@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.utils.timezone import now
 from users.models import User
+from users.users_utils.auth_cache import invalidate_user_auth_context, invalidate_users_auth_context
 
 
 class Permission(models.Model):
@@ -31,3 +34,28 @@ class UserPermission(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     permission = models.ForeignKey(Permission, on_delete=models.CASCADE)
     created_at = models.DateTimeField(default=now)
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def invalidate_role_users_auth_context(sender, instance, action, reverse, pk_set, **kwargs):
+    # Cached auth context holds the permissions of the user's role. Changes
+    # through either side of the relation reach every user of the roles.
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        role_ids = [instance.pk]
+    elif action == 'pre_clear':
+        role_ids = list(instance.role_set.values_list('id', flat=True))
+    else:
+        role_ids = list(pk_set)
+    # After commit, so that no request caches the old permissions again
+    transaction.on_commit(lambda: invalidate_users_auth_context(
+        UserRole.objects.filter(role_id__in=role_ids).values_list('user_id', flat=True)))
+
+
+@receiver([post_save, post_delete], sender=UserRole)
+@receiver([post_save, post_delete], sender=UserPermission)
+def invalidate_user_role_auth_context(sender, instance, **kwargs):
+    # Also edits made in the admin or the shell, not only through roles.api
+    # After commit, so that no request caches the old permissions again
+    transaction.on_commit(lambda: invalidate_user_auth_context(instance.user_id))
@@ -0,0 +1,78 @@
+import threading
+from functools import lru_cache
+from .base_permissions import base_permission, FULL_ACCESS
+from app.patients.base_permissions import base_permission as patients_base_permission
+from app.calls.base_permissions import base_permission as calls_base_permission
+from app.scheduling.base_permissions import base_permission as scheduling_base_permission
+from app.patients.patients_notes.base_permissions import base_permission as patients_notes_base_permission
+
+
+class PermissionRegistry:
+    """
+    Assigns every permission id a bit index so that a set of permissions
+    can be stored as a single integer mask and checked with one `&`.
+
+    Base permissions of all apps are registered on import. Ids that are
+    not known yet (e.g. created in the database) get the next free bit
+    the first time they are seen.
+
+    Bit indexes are per process, do not persist or share masks.
+    """
+
+    def __init__(self):
+        self._bits = dict()
+        self._lock = threading.Lock()
+
+    def register(self, permission_id):
+        if isinstance(permission_id, dict):
+            permission_id = permission_id['id']
+        bit = self._bits.get(permission_id)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.setdefault(permission_id, len(self._bits))
+        return bit
+
+    def mask(self, permission_ids):
+        """Compile permission ids into a bitmask
+
+        Args:
+            permission_ids (iterable): Permission ids or permission dicts
+
+        Returns:
+            int
+        """
+        mask = 0
+        for permission_id in permission_ids:
+            if permission_id is not None:
+                mask |= 1 << self.register(permission_id)
+        return mask
+
+
+registry = PermissionRegistry()
+
+for permissions in (
+    base_permission,
+    patients_base_permission,
+    calls_base_permission,
+    scheduling_base_permission,
+    patients_notes_base_permission,
+):
+    for permission in permissions.values():
+        registry.register(permission)
+
+FULL_ACCESS_MASK = registry.mask([FULL_ACCESS])
+
+
+@lru_cache(maxsize=1024)
+def compile_permission_mask(permission_ids: frozenset) -> int:
+    """Compile a user's effective permission ids into a bitmask.
+    Users sharing the same effective permissions share the result.
+    """
+    return registry.mask(permission_ids)
+
+
+def has_permission_mask(user_mask, required_mask):
+    """Check if the user mask grants any of the required permissions
+    or full access.
+    """
+    return bool(user_mask & (required_mask | FULL_ACCESS_MASK))
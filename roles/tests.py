@@ -0,0 +1,71 @@
+import uuid
+from django.test import TestCase
+from users.api import add_user
+from users.users_utils.auth_cache import flatten_permission_ids
+from .models import Permission, Role, UserRole, UserPermission
+from .api import resolve_user_permissions, get_user_role, get_user_permissions, check_user_for_permission
+from .base_permissions import FULL_ACCESS, READ_ALL_USERS, CREATE_NEW_USER
+from .permission_registry import compile_permission_mask, has_permission_mask, registry
+
+
+class ResolveUserPermissionsTest(TestCase):
+    def setUp(self):
+        self.user = add_user(f'{uuid.uuid4().hex[:8]}@example.com', 'Passw0rd!', 'Ada', 'Lovelace')
+        self.read = Permission.objects.create(**READ_ALL_USERS)
+        self.create = Permission.objects.create(**CREATE_NEW_USER)
+        self.full = Permission.objects.create(**FULL_ACCESS)
+        self.role = Role.objects.create(name='Manager')
+
+    def test_role_and_permissions_in_two_queries(self):
+        self.role.permissions.set([self.read, self.create])
+        UserRole.objects.create(user=self.user, role=self.role)
+        UserPermission.objects.create(user=self.user, permission=self.full)
+        with self.assertNumQueries(2):
+            role, permissions = resolve_user_permissions(self.user)
+        self.assertEqual(role['id'], self.role.id)
+        self.assertEqual(role['name'], 'Manager')
+        self.assertCountEqual(role['permissions'], [self.read.id, self.create.id])
+        self.assertEqual(permissions, [dict(id=self.full.id, name=self.full.name)])
+        self.assertEqual((get_user_role(self.user), get_user_permissions(self.user)), (role, permissions))
+
+    def test_role_without_permissions(self):
+        UserRole.objects.create(user=self.user, role=self.role)
+        role, permissions = resolve_user_permissions(self.user)
+        self.assertEqual(role, dict(id=self.role.id, name='Manager', permissions=[]))
+        self.assertEqual(permissions, [])
+
+    def test_no_role(self):
+        self.assertEqual(resolve_user_permissions(self.user), (None, []))
+
+    def test_no_user(self):
+        with self.assertRaises(ValueError):
+            resolve_user_permissions(None)
+
+    def test_check_user_for_permission_in_one_query(self):
+        self.role.permissions.set([self.read])
+        UserRole.objects.create(user=self.user, role=self.role)
+        with self.assertNumQueries(1):
+            self.assertTrue(check_user_for_permission(self.user, READ_ALL_USERS))
+        self.assertFalse(check_user_for_permission(self.user, CREATE_NEW_USER['id']))
+        UserPermission.objects.create(user=self.user, permission=self.full)
+        self.assertTrue(check_user_for_permission(self.user, CREATE_NEW_USER['id']))
+
+
+class PermissionMaskTest(TestCase):
+    def test_mask_of_role_and_explicit_permissions(self):
+        role = dict(id=1, name='Manager', permissions=[READ_ALL_USERS['id']])
+        permissions = [dict(id=CREATE_NEW_USER['id'], name=CREATE_NEW_USER['name'])]
+        mask = compile_permission_mask(flatten_permission_ids(role, permissions))
+        self.assertTrue(has_permission_mask(mask, registry.mask([READ_ALL_USERS])))
+        self.assertTrue(has_permission_mask(mask, registry.mask([CREATE_NEW_USER])))
+        self.assertFalse(has_permission_mask(mask, registry.mask([FULL_ACCESS])))
+        self.assertFalse(has_permission_mask(0, registry.mask([READ_ALL_USERS])))
+
+    def test_full_access_grants_everything(self):
+        mask = compile_permission_mask(frozenset([FULL_ACCESS['id']]))
+        self.assertTrue(has_permission_mask(mask, registry.mask([READ_ALL_USERS, CREATE_NEW_USER])))
+
+    def test_unknown_permissions_get_their_own_bit(self):
+        mask = registry.mask(['custom:permission'])
+        self.assertTrue(has_permission_mask(mask, registry.mask(['custom:permission'])))
+        self.assertFalse(has_permission_mask(mask, registry.mask([READ_ALL_USERS])))
@@ -4,6 +4,7 @@ from utils.error_handling.error_message import ErrorMessage
 from organizations.api import get_org_user_from_id, get_user_org
 from users.api import get_request_user
 from users.permissions import HasSessionOrTokenActive
+from users.users_utils.auth_cache import invalidate_user_auth_context
 from .permissions import HasPermission
 from .base_permissions import MODIFY_USER_PERMISSIONS
 from .models import UserPermission
@@ -51,6 +52,7 @@ def update_permissions(request):
                 user_permission = UserPermission(
                     user=actioned_user, permission_id=permission_id)
                 user_permission.save()
+        invalidate_user_auth_context(actioned_user)
         return Response(status=200, data={'message': 'Permissions updated successfully'})
     return ErrorMessage(
         title='Invalid Permissions',
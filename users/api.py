@@ -5,6 +5,7 @@ from .users_sessions.utils import get_active_session
 # App Token Imports
 from .users_app_tokens.utils import get_active_token
 from .serializers import UserSerializer
+from .users_utils.auth_cache import invalidate_user_auth_context
 
 
 def get_user(email):
@@ -79,6 +80,7 @@ def change_password(user, new_password):
     try:
         user.set_password(new_password)
         user.save()
+        invalidate_user_auth_context(user)
         return user
     except Exception as e:
         raise Exception(e)
@@ -97,6 +99,7 @@ def change_email(user, new_email):
     try:
         user.email = new_email
         user.save()
+        invalidate_user_auth_context(user)
         return user
     except Exception as e:
         raise Exception(e)
@@ -117,6 +120,7 @@ def change_name(user, new_first_name, new_last_name):
         user.first_name = new_first_name
         user.last_name = new_last_name
         user.save()
+        invalidate_user_auth_context(user)
         return user
     except Exception as e:
         raise Exception(e)
@@ -134,6 +138,7 @@ def disable_user(user: User):
     try:
         user.is_active = False
         user.save()
+        invalidate_user_auth_context(user)
         return user
     except Exception as e:
         raise Exception(e)
@@ -151,6 +156,7 @@ def enable_user(user):
     try:
         user.is_active = True
         user.save()
+        invalidate_user_auth_context(user)
         return user
     except Exception as e:
         raise Exception(e)
@@ -166,7 +172,10 @@ def delete_user(user):
     Returns: User or None
     """
     try:
+        # The primary key is cleared by delete()
+        user_id = user.pk
         user.delete()
+        invalidate_user_auth_context(user_id)
         return user
     except Exception as e:
         raise Exception(e)
@@ -1,7 +1,10 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.timezone import now
 from .managers import UserManager, UserPasswordChangeManager
+from .users_utils.auth_cache import invalidate_user_auth_context
 import bcrypt
 
 
@@ -52,3 +55,11 @@ class UserPasswordChange(models.Model):
     pswd_change_lock_til = models.DateTimeField(default=None, null=True)
 
     objects = UserPasswordChangeManager()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_auth_context_on_change(sender, instance, **kwargs):
+    # Cached auth context holds the user, e.g. `is_active`. Also edits
+    # made in the admin or the shell, not only through users.api.
+    # After commit, so that no request caches the old user again
+    transaction.on_commit(lambda: invalidate_user_auth_context(instance.pk))
@@ -0,0 +1,74 @@
+import uuid
+from django.core.cache import caches
+from django.test import TestCase
+from django.utils.timezone import now
+from core.settings import AUTH_CONTEXT_CACHE
+from roles.models import Permission, Role, UserPermission, UserRole
+from users.api import add_user, delete_user
+from users.users_app_tokens.models import AppToken
+from users.users_sessions.models import Session
+from users.users_utils import auth_cache
+
+
+class AuthContextCacheTest(TestCase):
+    def setUp(self):
+        caches[AUTH_CONTEXT_CACHE].clear()
+        self.user = add_user(f'{uuid.uuid4().hex[:8]}@example.com', 'Passw0rd!', 'Ada', 'Lovelace')
+
+    def _version(self, user_id):
+        return auth_cache._get_user_version(caches[AUTH_CONTEXT_CACHE], user_id, create=True)
+
+    def test_delete_user_invalidates_its_id(self):
+        user_id = self.user.pk
+        before = self._version(user_id)
+        delete_user(self.user)
+        self.assertNotEqual(self._version(user_id), before)
+        self.assertIsNone(caches[AUTH_CONTEXT_CACHE].get(auth_cache._version_key(None)))
+
+    def test_local_cache_lifetime_is_capped(self):
+        cache = caches[AUTH_CONTEXT_CACHE]
+        self.assertLessEqual(auth_cache._get_ttl(cache), auth_cache.AUTH_CONTEXT_LOCAL_CACHE_TTL)
+
+    def test_role_permission_changes_invalidate_role_users(self):
+        role = Role.objects.create(name='Nurse')
+        UserRole.objects.create(user=self.user, role=role)
+        permission = Permission.objects.create(id='read:test', name='Read test')
+        for change in (lambda: role.permissions.add(permission),
+                       lambda: role.permissions.remove(permission),
+                       lambda: permission.role_set.add(role),
+                       lambda: permission.role_set.clear()):
+            before = self._version(self.user.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertNotEqual(self._version(self.user.pk), before)
+
+    def test_model_writes_invalidate_user(self):
+        # e.g. edits made in the admin, which bypass users.api and roles.api
+        role = Role.objects.create(name='Nurse')
+        permission = Permission.objects.create(id='read:test', name='Read test')
+
+        def deactivate():
+            self.user.is_active = False
+            self.user.save()
+        for change in (deactivate,
+                       lambda: UserRole.objects.create(user=self.user, role=role),
+                       lambda: UserRole.objects.filter(user=self.user).delete(),
+                       lambda: UserPermission.objects.create(user=self.user, permission=permission),
+                       lambda: UserPermission.objects.filter(user=self.user).delete()):
+            before = self._version(self.user.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertNotEqual(self._version(self.user.pk), before)
+
+    def test_session_and_app_token_writes_evict_them(self):
+        cache = caches[AUTH_CONTEXT_CACHE]
+        session = Session.objects.create(user=self.user, key='session-hash', ip='127.0.0.1', ua='tests',
+                                         expire_at=now())
+        app_token = AppToken.objects.create(user=self.user, token='token-hash', ip='127.0.0.1', ua='tests')
+        for kind, row, key in ((auth_cache.SESSION, session, 'session-hash'),
+                               (auth_cache.APP_TOKEN, app_token, 'token-hash')):
+            for change in (lambda: setattr(row, 'is_valid', False) or row.save(), row.delete):
+                cache.set(auth_cache._context_key(kind, key), {'user_id': self.user.pk})
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                self.assertIsNone(cache.get(auth_cache._context_key(kind, key)))
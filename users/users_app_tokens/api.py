@@ -14,6 +14,7 @@
 
 from .models import AppToken
 from .serializers import AppTokenSerializer, UserAppTokenSerializer
+from ..users_utils.auth_cache import invalidate_user_auth_context
 
 
 def create_app_token(user, request) -> tuple[str, AppToken]:
@@ -97,9 +98,11 @@ def get_all_active_app_tokens(user, serialized=False):
 
 def delete_all_app_tokens(user):
     AppToken.filter(user=user, is_valid=True).delete()
+    invalidate_user_auth_context(user)
     return None
 
 
 def delete_all_app_tokens_except(user, app_token_id):
     AppToken.filter(user=user, is_valid=True).exclude(pk=app_token_id).delete()
+    invalidate_user_auth_context(user)
     return None
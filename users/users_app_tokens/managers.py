@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.timezone import now
-from .utils import generate_token, hash_this, getClientIP, getUserAgent
+from .utils import generate_token, hash_this, hash_client_key, getClientIP, getUserAgent
+from ..users_utils.auth_cache import APP_TOKEN, evict_auth_context, invalidate_user_auth_context
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
 
@@ -22,6 +23,7 @@ class AppTokenManager(models.Manager):
         # Disable previous sessions from same IP and User-Agent
         self.filter(user=user, ip=getClientIP(request),
                     ua=getUserAgent(request), is_valid=True).update(is_valid=False)
+        invalidate_user_auth_context(user)
         key = generate_token()
         token = self.create(
             user=user,
@@ -44,6 +46,7 @@ class AppTokenManager(models.Manager):
                 app_token.is_valid = False
                 app_token.updated_at = now()
                 app_token.save()
+                evict_auth_context(APP_TOKEN, app_token.token)
         except Exception as e:
             return None
         return None
@@ -58,9 +61,8 @@ class AppTokenManager(models.Manager):
             AppToken or None
         """
         try:
-            key = urlsafe_base64_decode(token).decode("ascii")
             app_token = self.select_related('user').get(
-                token=hash_this(key),
+                token=hash_client_key(token),
                 ua=ua,
                 is_valid=True
             )
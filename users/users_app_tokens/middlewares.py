@@ -2,9 +2,13 @@ import jwt
 from core.settings import SECRET_KEY
 from .models import AppToken
 from django.utils.encoding import force_str
-from .utils import getUserAgent
+from .utils import getUserAgent, hash_client_key
+from ..users_utils.auth_cache import APP_TOKEN, get_auth_context, set_auth_context
 # Roles Imports
-from roles.api import get_user_permissions, get_user_role
+from roles.api import resolve_user_permissions
+from roles.permission_registry import compile_permission_mask
+# Organization Imports
+from organizations.api import get_user_org, attach_user_org
 
 
 class AppTokenMiddleware:
@@ -15,13 +19,17 @@ class AppTokenMiddleware:
         # Code to be executed for each request before
         # the view (and later middleware) are called.
 
-        app_token = self.get_active_app_token(request)
+        context = self.get_auth_context(request)
+        app_token = context['auth'] if context else None
         # Attach the session to the request
         request.active_token = app_token
         if app_token:
-            request.active_user_role = get_user_role(app_token.user)
-            request.active_user_permissions = get_user_permissions(
-                app_token.user)
+            request.active_user_role = context['role']
+            request.active_user_permissions = context['permissions']
+            request.active_user_permission_mask = compile_permission_mask(
+                context['permission_ids'])
+            # Memoize organization for `get_user_org` calls in this request
+            attach_user_org(app_token.user, context['organization'])
 
         response = self.get_response(request)
 
@@ -30,10 +38,13 @@ class AppTokenMiddleware:
 
         return response
 
-    def get_active_app_token(self, request):
-        apptoken = None
+    def get_auth_context(self, request):
+        """Resolve the app token along with the user's role, permissions
+        and organization. Served from the auth context cache when possible,
+        otherwise authenticated against the database and cached.
+        """
         # Check if auth token is present in header
-        if apptoken is None and 'Authorization' in request.headers:
+        if 'Authorization' in request.headers:
             token = force_str(request.headers['Authorization'])
             if token is None:
                 return None
@@ -42,7 +53,26 @@ class AppTokenMiddleware:
                 decoded_jwt_token = jwt.decode(
                     token, SECRET_KEY, algorithms=['HS256'])
                 token = decoded_jwt_token.get('app_token')
-                return AppToken.objects.authenticate_app_token(token, getUserAgent(request))
-            except jwt.InvalidSignatureError:
-                apptoken = None
-        return apptoken
+                key_hash = hash_client_key(token)
+                ua = getUserAgent(request)
+                context = get_auth_context(APP_TOKEN, key_hash)
+                # App token is bound to the User-Agent it was created with
+                if context is not None and context['auth'].ua == ua:
+                    return context
+                app_token = AppToken.objects.authenticate_app_token(token, ua)
+                if app_token is None:
+                    return None
+                organization = get_user_org(app_token.user)
+                role, permissions = resolve_user_permissions(app_token.user)
+                return set_auth_context(
+                    APP_TOKEN,
+                    key_hash,
+                    auth=app_token,
+                    role=role,
+                    permissions=permissions,
+                    organization=organization,
+                )
+            except (jwt.InvalidSignatureError, ValueError, AttributeError):
+                # Invalid signature or malformed token
+                return None
+        return None
@@ -1,5 +1,6 @@
 import hashlib
 from secrets import token_urlsafe
+from django.utils.http import urlsafe_base64_decode
 
 REQUEST_TOKEN_FIELD = 'active_token'
 
@@ -24,6 +25,12 @@ def hash_this(string):
     return hashlib.sha256(str(string).encode('utf-8')).hexdigest()
 
 
+# Hash of the key as the client sends it (base64 encoded).
+# This is the value stored in the database.
+def hash_client_key(key):
+    return hash_this(urlsafe_base64_decode(key).decode("ascii"))
+
+
 # Get Client IP Address
 def getClientIP(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
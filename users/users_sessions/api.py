@@ -14,6 +14,7 @@
 
 from .models import Session
 from .serializers import SessionSerializer, UserSessionSerializer
+from ..users_utils.auth_cache import invalidate_user_auth_context
 
 
 def create_session(user, request) -> tuple[str, Session]:
@@ -97,10 +98,12 @@ def get_all_active_sessions(user, serialized=False):
 
 def delete_all_sessions(user):
     Session.filter(user=user, is_valid=True).update(is_valid=False)
+    invalidate_user_auth_context(user)
     return None
 
 
 def delete_all_sessions_except(user, session_id):
     Session.filter(user=user, is_valid=True).exclude(
         pk=session_id).update(is_valid=False)
+    invalidate_user_auth_context(user)
     return None
@@ -2,7 +2,8 @@ from django.db import models
 from django.utils.timezone import now
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from datetime import timedelta
-from .utils import generate_session_key, hash_this, getClientIP, getUserAgent
+from .utils import generate_session_key, hash_this, hash_client_key, getClientIP, getUserAgent
+from ..users_utils.auth_cache import SESSION, evict_auth_context, invalidate_user_auth_context
 
 
 class SessionManager(models.Manager):
@@ -32,6 +33,7 @@ class SessionManager(models.Manager):
         # Disable previous sessions from same IP and User-Agent
         self.filter(user=user, ip=getClientIP(request),
                     ua=getUserAgent(request), is_valid=True).update(is_valid=False)
+        invalidate_user_auth_context(user)
         # Create a new session
         key = generate_session_key()
         session = self.create(
@@ -56,6 +58,7 @@ class SessionManager(models.Manager):
                 session.is_valid = False
                 session.updated_at = now()
                 session.save()
+                evict_auth_context(SESSION, session.key)
         except Exception as e:
             return None
         return None
@@ -70,9 +73,8 @@ class SessionManager(models.Manager):
             Session or None
         """
         try:
-            key = urlsafe_base64_decode(key).decode("ascii")
             session = self.select_related('user').get(
-                key=hash_this(key),
+                key=hash_client_key(key),
                 ip=ip,
                 ua=ua,
                 is_valid=True
@@ -1,10 +1,15 @@
 import jwt
+from django.utils.timezone import now
 from core.settings import SECRET_KEY
 from decouple import config
 from .models import Session
-from .utils import getClientIP, getUserAgent
+from .utils import getClientIP, getUserAgent, hash_client_key
+from ..users_utils.auth_cache import SESSION, get_auth_context, set_auth_context
 # Roles Imports
-from roles.api import get_user_permissions, get_user_role
+from roles.api import resolve_user_permissions
+from roles.permission_registry import compile_permission_mask
+# Organization Imports
+from organizations.api import get_user_org, attach_user_org
 
 
 class SessionMiddleware:
@@ -16,13 +21,17 @@ class SessionMiddleware:
         # Code to be executed for each request before
         # the view (and later middleware) are called.
 
-        session = self.get_active_session(request)
+        context = self.get_auth_context(request)
+        session = context['auth'] if context else None
         # Attach the session to the request
         request.active_session = session
         if session:
-            request.active_user_role = get_user_role(session.user)
-            request.active_user_permissions = get_user_permissions(
-                session.user)
+            request.active_user_role = context['role']
+            request.active_user_permissions = context['permissions']
+            request.active_user_permission_mask = compile_permission_mask(
+                context['permission_ids'])
+            # Memoize organization for `get_user_org` calls in this request
+            attach_user_org(session.user, context['organization'])
 
         response = self.get_response(request)
 
@@ -31,8 +40,11 @@ class SessionMiddleware:
 
         return response
 
-    def get_active_session(self, request):
-        session = None
+    def get_auth_context(self, request):
+        """Resolve the session along with the user's role, permissions
+        and organization. Served from the auth context cache when possible,
+        otherwise authenticated against the database and cached.
+        """
         # Check if auth token is present in cookies
         try:
             key = request.COOKIES.get(self.COOKIE_NAME)
@@ -42,9 +54,26 @@ class SessionMiddleware:
             except jwt.InvalidSignatureError:
                 return None
             key = decoded_jwt_key.get('session_key')
-            session = Session.objects.authenticate_session(
-                key, getClientIP(request), getUserAgent(request))
-            return session
+            key_hash = hash_client_key(key)
+            ip, ua = getClientIP(request), getUserAgent(request)
+            context = get_auth_context(SESSION, key_hash)
+            if context is not None:
+                session = context['auth']
+                # Session is bound to the IP and User-Agent it was created with
+                if session.ip == ip and session.ua == ua and session.expire_at > now():
+                    return context
+            session = Session.objects.authenticate_session(key, ip, ua)
+            if session is None:
+                return None
+            organization = get_user_org(session.user)
+            role, permissions = resolve_user_permissions(session.user)
+            return set_auth_context(
+                SESSION,
+                key_hash,
+                auth=session,
+                role=role,
+                permissions=permissions,
+                organization=organization,
+            )
         except (KeyError, Exception) as e:
-            session = None
-        return session
+            return None
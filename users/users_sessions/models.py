@@ -1,9 +1,11 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from ..models import User
 from django.utils.timezone import now
-from django.db import models
 from .managers import SessionManager
+from ..users_utils.auth_cache import SESSION, evict_auth_context
 
 
 class Session(models.Model):
@@ -21,3 +23,11 @@ class Session(models.Model):
 
     def __str__(self):
         return f"{self.pk}"
+
+
+@receiver([post_save, post_delete], sender=Session)
+def evict_session_auth_context(sender, instance, **kwargs):
+    # Cached auth context holds the row, e.g. `is_valid`. Also edits
+    # made in the admin or the shell, not only through the manager.
+    # After commit, so that no request caches the old row again
+    transaction.on_commit(lambda: evict_auth_context(SESSION, instance.key))
@@ -0,0 +1,154 @@
+import uuid
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from core.settings import AUTH_CONTEXT_CACHE, AUTH_CONTEXT_CACHE_TTL, AUTH_CONTEXT_LOCAL_CACHE_TTL
+
+##########################################################
+#
+#                 Authentication context cache
+#
+# Holds what the auth middlewares resolve for a session or
+# app token (the row, user, role, permissions and org)
+# so that steady-state requests skip the database.
+#
+# Entries are keyed by the hashed session/token key, the
+# same value stored in the database. Every entry carries
+# the user's cache version; bumping the version with
+# `invalidate_user_auth_context` makes all entries of
+# that user stale at once. Model signals of users, roles,
+# permissions, sessions and app tokens invalidate on
+# every write, also from the admin or the shell.
+#
+# Versions are only seen by all workers in a shared cache.
+# A per process cache cannot see invalidations made by
+# other workers, its entries live
+# `AUTH_CONTEXT_LOCAL_CACHE_TTL` seconds at most.
+#
+##########################################################
+
+CONTEXT_KEY_PREFIX = 'auth_ctx'
+VERSION_KEY_PREFIX = 'auth_ctx_ver'
+
+SESSION = 'session'
+APP_TOKEN = 'app_token'
+
+
+def _get_cache():
+    return caches[AUTH_CONTEXT_CACHE]
+
+
+def _get_ttl(cache):
+    if isinstance(cache, LocMemCache):
+        return min(AUTH_CONTEXT_CACHE_TTL, AUTH_CONTEXT_LOCAL_CACHE_TTL)
+    return AUTH_CONTEXT_CACHE_TTL
+
+
+def _context_key(kind, key_hash):
+    return f'{CONTEXT_KEY_PREFIX}:{kind}:{key_hash}'
+
+
+def _version_key(user_id):
+    return f'{VERSION_KEY_PREFIX}:{user_id}'
+
+
+def _get_user_version(cache, user_id, create=False):
+    version = cache.get(_version_key(user_id))
+    if version is None and create:
+        version = uuid.uuid4().hex
+        # Versions never expire on their own. If the backend culls one,
+        # entries of that user no longer match and are rebuilt.
+        cache.set(_version_key(user_id), version, None)
+    return version
+
+
+def get_auth_context(kind, key_hash):
+    """Get cached authentication context
+
+    Args:
+        kind (str): `SESSION` or `APP_TOKEN`
+        key_hash (str): Hashed session key or app token
+
+    Returns:
+        dict or None
+    """
+    cache = _get_cache()
+    context = cache.get(_context_key(kind, key_hash))
+    if context is None:
+        return None
+    if context['version'] != _get_user_version(cache, context['user_id']):
+        cache.delete(_context_key(kind, key_hash))
+        return None
+    return context
+
+
+def set_auth_context(kind, key_hash, auth, role, permissions, organization):
+    """Cache authentication context for a session or app token
+
+    Args:
+        kind (str): `SESSION` or `APP_TOKEN`
+        key_hash (str): Hashed session key or app token
+        auth (Session | AppToken): Authenticated row with `user` loaded
+        role (dict): Serialized role of the user
+        permissions (list): Serialized explicit permissions of the user
+        organization (Organization): Organization of the user
+
+    Returns:
+        dict: The cached context
+    """
+    cache = _get_cache()
+    context = dict(
+        auth=auth,
+        user_id=auth.user_id,
+        role=role,
+        permissions=permissions,
+        permission_ids=flatten_permission_ids(role, permissions),
+        organization=organization,
+        version=_get_user_version(cache, auth.user_id, create=True),
+    )
+    ttl = _get_ttl(cache)
+    if ttl > 0:
+        cache.set(_context_key(kind, key_hash), context, ttl)
+    return context
+
+
+def flatten_permission_ids(role, permissions):
+    """Merge role and explicit permissions into a single set of ids"""
+    permission_ids = set()
+    if role:
+        permission_ids.update(role.get('permissions', []))
+    if permissions:
+        permission_ids.update(p.get('id') for p in permissions)
+    return frozenset(permission_ids)
+
+
+def evict_auth_context(kind, key_hash):
+    """Remove a single session or app token from the cache
+
+    Args:
+        kind (str): `SESSION` or `APP_TOKEN`
+        key_hash (str): Hashed session key or app token
+    """
+    _get_cache().delete(_context_key(kind, key_hash))
+
+
+def invalidate_user_auth_context(user):
+    """Make every cached session and app token of the user stale.
+    Call this whenever the user, their role or permissions change.
+
+    Args:
+        user (User | uuid): User object or user id
+    """
+    if user is None:
+        return
+    user_id = getattr(user, 'pk', user)
+    _get_cache().set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate_users_auth_context(user_ids):
+    """Make every cached session and app token of the users stale
+
+    Args:
+        user_ids (iterable): User ids
+    """
+    version = uuid.uuid4().hex
+    _get_cache().set_many({_version_key(user_id): version for user_id in user_ids}, None)
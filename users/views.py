@@ -19,7 +19,7 @@ from .users_totp.api import has_totp, authenticate_totp, create_mfa_join_token
 from .serializers import UserSerializer, LoginSerializer
 from .permissions import HasSessionOrTokenActive
 # Roles Imports
-from roles.api import get_user_permissions, get_user_role
+from roles.api import resolve_user_permissions, get_active_user_role, get_active_user_permissions
 
 
 @api_view(['POST'])
@@ -67,8 +67,7 @@ def login(request):
         last_token_session = get_last_token_session_details(
             user)  # already serialized
         # Get roles and permissions
-        role = get_user_role(user)
-        permissions = get_user_permissions(user)
+        role, permissions = resolve_user_permissions(user)
         # Respond depending on the client
         if is_web(request):
             # Session based authentication
@@ -160,8 +159,9 @@ def me(request):
     # Session-based authentication
     if is_web(request):
         session = get_active_session(request)
-        role = get_user_role(session.user)
-        permissions = get_user_permissions(session.user)
+        # Resolved by the session middleware
+        role = get_active_user_role(request)
+        permissions = get_active_user_permissions(request)
         if session is not None:
             return Response(data=dict(
                 user=UserSerializer(session.user).data,
@@ -170,8 +170,9 @@ def me(request):
             ), status=200)
     # Token-based authentication
     app_token = get_active_token(request)
-    role = get_user_role(app_token.user)
-    permissions = get_user_permissions(app_token.user)
+    # Resolved by the app token middleware
+    role = get_active_user_role(request)
+    permissions = get_active_user_permissions(request)
     if app_token is not None:
         return Response(data=dict(
             user=UserSerializer(app_token.user).data,
@@ -0,0 +1,326 @@
+import hmac
+import pickle
+import struct
+import hashlib
+from functools import lru_cache, partial
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from django.db import models
+from django.db.models import ExpressionWrapper, F
+from django.db.models.query_utils import DeferredAttribute
+from django.utils.encoding import force_bytes
+from django_cryptography import fields as cryptography_fields
+from django_cryptography.core.signing import BadSignature
+from django_cryptography.fields import EncryptedMixin
+from django_cryptography.utils.crypto import FernetBytes, InvalidToken
+
+##########################################################
+#
+#                    Encrypted model fields
+#
+# `encrypt` wraps django_cryptography's `encrypt`, so
+# columns and migrations are unchanged, and gives every
+# field of the same key one process wide cipher. The
+# cipher prepares the AES and HMAC keys once instead of on
+# every value, with the same token format.
+#
+# Loaded instances keep the ciphertext of encrypted fields
+# and decrypt a field on its first access, so code that
+# reads `id` and names pays nothing for the rest. Models
+# with encrypted fields use `EncryptedManager`, whose
+# `values()` and `values_list()` rows hold plaintext.
+#
+# For many rows, read the ciphertext with
+# `ciphertext_values` and decrypt whole columns with
+# `decrypt_rows`, or `decrypt_instances` for instances:
+# each column is verified and deciphered in one pass with
+# the prepared keys.
+#
+##########################################################
+
+# Prefix of annotations holding ciphertext, see `ciphertext_values`
+CIPHERTEXT_PREFIX = '_ciphertext_'
+
+HEADER = struct.Struct('>cQ')
+BLOCK_SIZE = 16
+
+
+class CachedFernetBytes(FernetBytes):
+    """
+    FernetBytes of django_cryptography with its key material prepared
+    once, and a `decrypt_many` for many tokens. Tokens signed with other
+    algorithms than SHA-256, or read with a TTL, go through the original
+    implementation.
+    """
+
+    def __init__(self, key=None):
+        super().__init__(key)
+        self._algorithm = algorithms.AES(force_bytes(self.key))
+        self._signing_key = force_bytes(self.signer.key)
+        self._digest_size = self.signer.hasher.digest_size
+        self._fast = self.signer.algorithm == 'sha256'
+
+    def _sign(self, value):
+        return hmac.new(self._signing_key, value, hashlib.sha256).digest()
+
+    def _encrypt_from_parts(self, data, current_time, iv):
+        if not self._fast:
+            return super()._encrypt_from_parts(data, current_time, iv)
+        pad = BLOCK_SIZE - len(data) % BLOCK_SIZE
+        encryptor = Cipher(self._algorithm, modes.CBC(iv)).encryptor()
+        ciphertext = encryptor.update(data + bytes([pad]) * pad) + encryptor.finalize()
+        payload = HEADER.pack(self.signer.version, current_time) + iv + ciphertext
+        return payload + self._sign(payload)
+
+    def _verify(self, data):
+        # Returns the IV followed by the ciphertext
+        size = self._digest_size
+        if len(data) < HEADER.size + size or data[:1] != self.signer.version:
+            raise BadSignature('Signature is not valid')
+        if not hmac.compare_digest(self._sign(data[:-size]), data[-size:]):
+            raise BadSignature('Signature does not match')
+        return data[HEADER.size:-size]
+
+    def _decrypt_payload(self, payload):
+        # Same steps as `FernetBytes.decrypt` after the signature check
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        try:
+            decryptor = Cipher(self._algorithm, modes.CBC(payload[:BLOCK_SIZE])).decryptor()
+            padded = decryptor.update(payload[BLOCK_SIZE:]) + decryptor.finalize()
+            return unpadder.update(padded) + unpadder.finalize()
+        except ValueError as error:
+            raise InvalidToken from error
+
+    def decrypt_many(self, tokens):
+        """Decrypt tokens with the prepared keys
+
+        Args:
+            tokens (list): Tokens as bytes
+
+        Raises:
+            BadSignature: If a token was not signed with this key
+            InvalidToken: If a token is malformed
+
+        Returns:
+            list: Plaintexts as bytes, in order
+        """
+        if not self._fast:
+            return [super(CachedFernetBytes, self).decrypt(token) for token in tokens]
+        return [self._decrypt_payload(self._verify(token)) for token in tokens]
+
+    def decrypt(self, data, ttl=None):
+        if not self._fast or ttl is not None:
+            return super().decrypt(data, ttl)
+        return self._decrypt_payload(self._verify(data))
+
+
+@lru_cache(maxsize=None)
+def _get_cipher(key):
+    return CachedFernetBytes(key)
+
+
+def get_cipher(key=None):
+    """Get the process wide cipher of a key
+
+    Args:
+        key (bytes, optional): Field key. Defaults to `CRYPTOGRAPHY_KEY`.
+    """
+    return _get_cipher(key)
+
+
+class Ciphertext:
+    """Value of an encrypted field as read from the database"""
+    __slots__ = ('field', 'token')
+
+    def __init__(self, field, token):
+        self.field = field
+        self.token = token
+
+    def decrypt(self):
+        return self.field._load(self.token)
+
+    def __repr__(self):
+        return f'<Ciphertext of {self.field}>'
+
+
+def _read_ciphertext(field, value, *args, **kwargs):
+    # Converter of database values, decryption waits for the first access
+    return value if value is None else Ciphertext(field, force_bytes(value))
+
+
+class LazyDecryptAttribute(DeferredAttribute):
+    """
+    Attribute of an encrypted field. Holds the `Ciphertext` of a loaded
+    instance and replaces it with the plaintext on first access.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, Ciphertext):
+            value = instance.__dict__[self.field.attname] = value.decrypt()
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+def encrypt(base_field, key=None, ttl=None):
+    """Same as django_cryptography's `encrypt`, sharing the cipher of `key`
+    and decrypting on first access, see `LazyDecryptAttribute`
+
+    Args:
+        base_field (Field): Field to encrypt, e.g. `models.CharField(max_length=15)`
+        key (bytes, optional): Field specific key
+        ttl (int, optional): Seconds after which values become unreadable
+    """
+    field = cryptography_fields.encrypt(base_field, key, ttl)
+    field._fernet = get_cipher(key)
+    field.from_db_value = partial(_read_ciphertext, field)
+    field.descriptor_class = LazyDecryptAttribute
+    return field
+
+
+def is_encrypted(field):
+    return isinstance(field, EncryptedMixin)
+
+
+def decrypt_column(field, values):
+    """Decrypt a column of ciphertexts of one encrypted field at once
+
+    Args:
+        field (Field): Encrypted model field
+        values (list): Ciphertexts as read from the database, None is kept
+
+    Returns:
+        list: Python values, in order
+    """
+    cipher = field._fernet
+    if field.ttl is not None or not isinstance(cipher, CachedFernetBytes):
+        # Expiring values are checked one by one
+        return [value if value is None else field._load(force_bytes(value))
+                for value in values]
+    present = [index for index, value in enumerate(values) if value is not None]
+    plaintexts = cipher.decrypt_many([force_bytes(values[index]) for index in present])
+    column = [None] * len(values)
+    for index, plaintext in zip(present, plaintexts):
+        column[index] = pickle.loads(plaintext)
+    return column
+
+
+def ciphertext_values(queryset, *fields):
+    """Like `queryset.values(*fields)`, but encrypted fields are read
+    as ciphertext, to be decrypted later with `decrypt_rows`
+
+    Returns:
+        QuerySet: Rows with `CIPHERTEXT_PREFIX` keys for encrypted fields
+    """
+    meta = queryset.model._meta
+    plain, encrypted = [], {}
+    for name in fields:
+        if is_encrypted(meta.get_field(name)):
+            encrypted[CIPHERTEXT_PREFIX + name] = ExpressionWrapper(
+                F(name), output_field=models.BinaryField())
+        else:
+            plain.append(name)
+    return queryset.values(*plain, **encrypted)
+
+
+def decrypt_rows(model, rows):
+    """Decrypt the ciphertext columns of rows from `ciphertext_values`,
+    in place, one `decrypt_column` call per column
+
+    Args:
+        model (Model): Model of the rows
+        rows (list): Dicts from `ciphertext_values`
+
+    Returns:
+        list: The same rows, with plaintext under the field names
+    """
+    if not rows:
+        return rows
+    for key in [key for key in rows[0] if key.startswith(CIPHERTEXT_PREFIX)]:
+        name = key[len(CIPHERTEXT_PREFIX):]
+        column = decrypt_column(model._meta.get_field(name),
+                                [row.pop(key) for row in rows])
+        for row, value in zip(rows, column):
+            row[name] = value
+    return rows
+
+
+def values_decrypted(queryset, *fields):
+    """Evaluate `queryset.values(*fields)`, decrypting column by column
+
+    Returns:
+        list: Dicts of field values
+    """
+    return decrypt_rows(queryset.model, list(ciphertext_values(queryset, *fields)))
+
+
+def decrypt_instances(instances, *fields):
+    """Decrypt encrypted fields of loaded instances column by column,
+    instead of one value on each first access
+
+    Args:
+        instances (list): Instances of one model
+        fields (str): Field names. Defaults to every encrypted field.
+
+    Returns:
+        list: The same instances
+    """
+    if not instances:
+        return instances
+    meta = instances[0]._meta
+    for field in [meta.get_field(name) for name in fields] or meta.concrete_fields:
+        if not is_encrypted(field):
+            continue
+        pending = [instance for instance in instances
+                   if isinstance(instance.__dict__.get(field.attname), Ciphertext)]
+        column = decrypt_column(field, [instance.__dict__[field.attname].token
+                                        for instance in pending])
+        for instance, value in zip(pending, column):
+            instance.__dict__[field.attname] = value
+    return instances
+
+
+def _plain(value):
+    return value.decrypt() if isinstance(value, Ciphertext) else value
+
+
+@lru_cache(maxsize=None)
+def _decrypting_iterable(iterable_class):
+    # Same rows as `iterable_class`, with encrypted values decrypted
+    class DecryptingIterable(iterable_class):
+        def __iter__(self):
+            for row in super().__iter__():
+                if isinstance(row, dict):
+                    yield {key: _plain(value) for key, value in row.items()}
+                elif isinstance(row, tuple):
+                    values = [_plain(value) for value in row]
+                    yield row._make(values) if hasattr(row, '_make') else tuple(values)
+                else:
+                    yield _plain(row)
+    return DecryptingIterable
+
+
+class EncryptedQuerySet(models.QuerySet):
+    """
+    QuerySet of a model with encrypted fields. Instances decrypt on
+    access, `values()` and `values_list()` rows as they are read.
+    Rows of other models reaching encrypted fields through a relation
+    hold `Ciphertext`, read those with `ciphertext_values` instead.
+    """
+
+    def _decrypting(self, clone):
+        clone._iterable_class = _decrypting_iterable(clone._iterable_class)
+        return clone
+
+    def values(self, *fields, **expressions):
+        return self._decrypting(super().values(*fields, **expressions))
+
+    def values_list(self, *fields, flat=False, named=False):
+        return self._decrypting(super().values_list(*fields, flat=flat, named=named))
+
+
+EncryptedManager = models.Manager.from_queryset(EncryptedQuerySet)
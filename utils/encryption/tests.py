@@ -0,0 +1,64 @@
+import time
+from django.test import SimpleTestCase
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from django.utils.encoding import force_bytes
+from django_cryptography.core.signing import BadSignature, SignatureExpired
+from django_cryptography.utils.crypto import FernetBytes, InvalidToken
+from .fields import CachedFernetBytes, get_cipher
+
+
+class CachedFernetBytesTest(SimpleTestCase):
+    def setUp(self):
+        self.library = FernetBytes()
+        self.cipher = CachedFernetBytes()
+
+    def assertBothRaise(self, exception, token, ttl=None):
+        with self.assertRaises(exception):
+            self.library.decrypt(token, ttl)
+        with self.assertRaises(exception):
+            self.cipher.decrypt(token, ttl)
+        if ttl is None:
+            with self.assertRaises(exception):
+                self.cipher.decrypt_many([token])
+
+    def test_round_trip(self):
+        values = [bytes(range(size)) for size in (*range(18), 31, 32, 33, 100)]
+        tokens = [self.library.encrypt(value) for value in values]
+        self.assertEqual([self.cipher.decrypt(token) for token in tokens], values)
+        self.assertEqual(self.cipher.decrypt_many(tokens), values)
+        self.assertEqual([self.library.decrypt(self.cipher.encrypt(value)) for value in values], values)
+        self.assertEqual(self.cipher.decrypt_many([]), [])
+
+    def test_same_token_format(self):
+        iv = bytes(range(16))
+        self.assertEqual(self.cipher._encrypt_from_parts(b'value', 1700000000, iv),
+                         self.library._encrypt_from_parts(b'value', 1700000000, iv))
+
+    def test_process_wide_cipher(self):
+        self.assertIs(get_cipher(), get_cipher(None))
+
+    def test_tampered_token(self):
+        token = bytearray(self.library.encrypt(b'secret value'))
+        for index in (0, 5, 9, 30, len(token) - 1):
+            tampered = bytearray(token)
+            tampered[index] ^= 1
+            self.assertBothRaise(BadSignature, bytes(tampered))
+        self.assertBothRaise(BadSignature, bytes(token[:-1]))
+        self.assertBothRaise(BadSignature, b'')
+
+    def test_signed_but_malformed(self):
+        # Valid signatures over ciphertexts that do not decrypt
+        iv = bytes(16)
+        encryptor = Cipher(algorithms.AES(force_bytes(self.cipher.key)), modes.CBC(iv)).encryptor()
+        bad_padding = encryptor.update(bytes(16)) + encryptor.finalize()
+        now = int(time.time())
+        for value in (iv + bad_padding, iv + bad_padding[:15]):
+            self.assertBothRaise(InvalidToken, self.library.signer.sign(value, now))
+
+    def test_ttl(self):
+        token = self.library.encrypt_at_time(b'value', int(time.time()) - 1000)
+        self.assertEqual(self.cipher.decrypt(token), b'value')
+        self.assertEqual(self.cipher.decrypt(token, ttl=2000), b'value')
+        self.assertBothRaise(SignatureExpired, token, ttl=10)
+        tampered = token[:-1] + bytes([token[-1] ^ 1])
+        self.assertBothRaise(BadSignature, tampered, ttl=2000)
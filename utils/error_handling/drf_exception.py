@@ -1,6 +1,5 @@
 from rest_framework.views import exception_handler
 from .error_message import ErrorMessage
-import json
 
 
 def drf_exception_handler(exc, context):
@@ -17,8 +16,8 @@ def drf_exception_handler(exc, context):
             instance=context['request'].build_absolute_uri(),
             code='DRF001'
         )
-        response.data = json.dumps(error.serialize())
-        response.content = json.dumps(error.serialize())
-        response['Content-Type'] = 'application/problem+json'
+        # Rendered (and wrapped into the response envelope) by the renderer
+        response.data = error.serialize()
+        response.content_type = 'application/problem+json'
 
     return response
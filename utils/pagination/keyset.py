@@ -0,0 +1,153 @@
+import json
+import uuid
+import datetime
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+
+# Longest string accepted for an ordering field that is not a CharField
+MAX_CURSOR_VALUE_LENGTH = 255
+
+NUMERIC_FIELDS = (models.IntegerField, models.FloatField, models.DecimalField)
+
+
+class KeysetPaginator:
+    """Keyset (seek) pagination over a fixed ordering.
+
+    Instead of an offset, the cursor holds the ordering values of the
+    last row of the page, and the next page starts right after them.
+    Cost per page stays the same however deep the client goes, as long
+    as an index matches the ordering. The ordering must be unique,
+    so end it with the primary key.
+
+    Attributes:
+        ordering (tuple): Model field names, prefix with `-` for descending
+        page_size (int): Rows per page when `limit` is not given
+        max_page_size (int): Upper bound of `limit`
+
+    Usage:
+        ```
+        paginator = KeysetPaginator(ordering=('-created_at', '-id'))
+        rows, next_cursor = paginator.paginate(
+            queryset, cursor=request.GET.get('cursor'), limit=request.GET.get('limit'))
+        ```
+    """
+
+    def __init__(self, ordering, page_size=50, max_page_size=200):
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+
+    def get_limit(self, limit=None):
+        """Validate the requested page size
+
+        Raises:
+            ValueError: If limit is not a positive integer
+        """
+        if limit is None or limit == '':
+            return self.page_size
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError('Limit must be a positive integer.')
+        return min(limit, self.max_page_size)
+
+    def encode_cursor(self, row):
+        values = []
+        for field in self.fields:
+            value = row[field] if isinstance(row, dict) else getattr(row, field)
+            if isinstance(value, (datetime.datetime, datetime.date)):
+                # Keep microseconds, the cursor must match exactly
+                value = value.isoformat()
+            elif isinstance(value, uuid.UUID):
+                value = str(value)
+            values.append(value)
+        return urlsafe_base64_encode(json.dumps(values).encode('utf-8'))
+
+    def decode_cursor(self, cursor):
+        """Decode cursor values
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        try:
+            values = json.loads(urlsafe_base64_decode(cursor))
+        except (ValueError, TypeError):
+            raise ValueError('Invalid cursor.')
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise ValueError('Invalid cursor.')
+        return values
+
+    def clean_cursor(self, model, values):
+        """Convert decoded cursor values to the types of the ordering fields
+
+        Args:
+            model (Model): Model of the paginated queryset
+            values (list): From `decode_cursor`
+
+        Raises:
+            ValueError: If a value does not fit its field
+
+        Returns:
+            list: Values ready for `seek`
+        """
+        cleaned = []
+        for name, value in zip(self.fields, values):
+            field = model._meta.get_field(name)
+            # Numbers for numeric fields, strings for the rest, see `encode_cursor`
+            if isinstance(field, NUMERIC_FIELDS):
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+            else:
+                max_length = field.max_length if isinstance(field, models.CharField) else None
+                valid = isinstance(value, str) and \
+                    len(value) <= (max_length or MAX_CURSOR_VALUE_LENGTH)
+            if not valid:
+                raise ValueError('Invalid cursor.')
+            try:
+                value = field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise ValueError('Invalid cursor.')
+            if value is None:
+                raise ValueError('Invalid cursor.')
+            cleaned.append(value)
+        return cleaned
+
+    def seek(self, values):
+        """Build the filter for rows after the given ordering values.
+        For `(-a, -b)` this is `a < x OR (a = x AND b < y)`.
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{self.fields[index]}__{lookup}': values[index]})
+            for previous in range(index):
+                step &= Q(**{self.fields[previous]: values[previous]})
+            condition |= step
+        return condition
+
+    def paginate(self, queryset, cursor=None, limit=None):
+        """Get a page of the queryset
+
+        Args:
+            queryset (QuerySet): Rows to paginate, ordering is replaced
+            cursor (str, optional): Cursor from the previous page
+            limit (int | str, optional): Page size
+
+        Raises:
+            ValueError: If cursor or limit is invalid
+
+        Returns:
+            tuple: (list of rows, cursor of the next page or None)
+        """
+        limit = self.get_limit(limit)
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.seek(
+                self.clean_cursor(queryset.model, self.decode_cursor(cursor))))
+        # One more row tells if there is a next page
+        rows = list(queryset[:limit + 1])
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, self.encode_cursor(rows[-1])
@@ -0,0 +1,65 @@
+import json
+import uuid
+import datetime
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+from users.models import User
+from .keyset import KeysetPaginator
+
+
+def make_cursor(values):
+    return urlsafe_base64_encode(json.dumps(values).encode('utf-8'))
+
+
+class KeysetPaginatorTest(TestCase):
+    def setUp(self):
+        self.paginator = KeysetPaginator(ordering=('-created_at', '-id'), page_size=3)
+        now = timezone.now()
+        # Pairs of equal created_at, the id breaks the tie
+        User.objects.bulk_create([User(
+            email=f'user{index}@example.com', first_name='U', last_name=str(index),
+            created_at=now - datetime.timedelta(minutes=index // 2),
+        ) for index in range(10)])
+
+    def test_walks_every_row_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = self.paginator.paginate(User.objects.all(), cursor=cursor)
+            seen += rows
+            if cursor is None:
+                break
+        expected = list(User.objects.order_by('-created_at', '-id'))
+        self.assertEqual(seen, expected)
+
+    def test_limit(self):
+        rows, _ = self.paginator.paginate(User.objects.all(), limit='500')
+        self.assertEqual(len(rows), 10)
+        for limit in ('0', 'abc'):
+            with self.assertRaises(ValueError):
+                self.paginator.paginate(User.objects.all(), limit=limit)
+
+    def test_wrongly_typed_cursor_values_are_invalid(self):
+        created_at = timezone.now().isoformat()
+        user_id = str(uuid.uuid4())
+        for values in (
+            [123, user_id],
+            [created_at, 456],
+            [[created_at], user_id],
+            [created_at, {'id': user_id}],
+            [None, user_id],
+            [created_at, None],
+            [True, user_id],
+            ['not a date', user_id],
+            [created_at, 'not a uuid'],
+            [created_at, 'a' * 1000],
+            [created_at],
+            {'created_at': created_at},
+        ):
+            with self.subTest(values=values), self.assertRaises(ValueError):
+                self.paginator.paginate(User.objects.all(), cursor=make_cursor(values))
+
+    def test_malformed_cursor_is_invalid(self):
+        for cursor in ('zzz', '!!', make_cursor('x')[:-2]):
+            with self.assertRaises(ValueError):
+                self.paginator.paginate(User.objects.all(), cursor=cursor)